@@ -0,0 +1,178 @@
+# Micro-benchmarks for the per-prompt matching path.
+#
+#   python bench_matching.py                          # casts 10/100/1000 x 1k/10k/100k prompts
+#   python bench_matching.py --casts 10 100 --rows 1000 --out bench_matching.json
+#   python bench_matching.py --compare baseline.json  # exit 1 on a >25% slowdown
+#
+# Builds a synthetic cast with generated name_variants and a prompt corpus
+# mixing [@tags], plain names, nicknames and filler, then times
+# extract_characters, _resolve_alias and _default_patterns_for. The CLI and
+# the GUI share chatgpt_batch_core, so these are the GUI's timings too.
+# Each cell stops after --budget seconds and reports the rate it reached.
+
+import argparse, json, platform, random, statistics, sys, time
+from datetime import datetime
+from pathlib import Path
+
+import chatgpt_batch_core as core
+
+SYLLABLES = ["ay", "da", "mo", "re", "no", "ka", "li", "tor", "vin", "sha", "el", "bri", "an", "o'", "zu", "fen"]
+FILLER = (
+    "walks through the market at dusk, lanterns glowing, rain on cobblestones, "
+    "wide shot, painterly style, soft rim light, crowd in the background"
+).split(", ")
+
+
+def make_name(rng):
+    def word():
+        w = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+        return w.strip("'").capitalize()
+    return f"{word()} {word()}" if rng.random() < 0.6 else word()
+
+
+def build_cast(size, seed=0):
+    """Return (char_map, name_variants, names) for ``size`` characters."""
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < size:
+        name = make_name(rng)
+        if name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    char_map = {name.lower(): f"/cast/{name.replace(' ', '_')}.png" for name in names}
+    variants = {}
+    for name in names:
+        first = name.split()[0]
+        nick = first[:3]
+        variants[name.lower()] = [rf"\b{first}(?:'s)?\b", rf"\b{nick}ie\b"]
+    return char_map, variants, names
+
+
+def build_corpus(rows, names, seed=1):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(rows):
+        parts = rng.sample(FILLER, 3)
+        for _ in range(rng.randint(0, 3)):
+            name = rng.choice(names)
+            style = rng.random()
+            if style < 0.4:
+                mention = f"[@{name}]"
+            elif style < 0.8:
+                mention = name
+            else:
+                mention = f"{name.split()[0][:3]}ie"
+            parts.insert(rng.randrange(len(parts) + 1), mention)
+        out.append(" ".join(parts))
+    return out
+
+
+def _timed_loop(fn, items, budget_sec):
+    times = []
+    started = time.perf_counter()
+    for n, item in enumerate(items, start=1):
+        t0 = time.perf_counter()
+        fn(item)
+        times.append(time.perf_counter() - t0)
+        if n % 200 == 0 and time.perf_counter() - started > budget_sec:
+            break
+    total = sum(times)
+    return {
+        "calls": len(times),
+        "truncated": len(times) < len(items),
+        "total_sec": round(total, 4),
+        "per_call_us": round(total / len(times) * 1e6, 2) if times else None,
+        "p50_us": round(statistics.median(times) * 1e6, 2) if times else None,
+        "calls_per_sec": round(len(times) / total, 1) if total else None,
+    }
+
+
+def bench_cell(cast_size, rows, budget_sec):
+    char_map, variants, names = build_cast(cast_size)
+    corpus = build_corpus(rows, names)
+    aliases = [core.TAG_PATTERN.search(p).group(1) for p in corpus if core.TAG_PATTERN.search(p)]
+
+    t0 = time.perf_counter()
+    index = core.CharacterIndex(char_map, variants)
+    build_sec = time.perf_counter() - t0
+
+    core._index_cache = None
+    extract = _timed_loop(lambda p: core.index_for(char_map, variants).extract(p), corpus, budget_sec)
+    core._index_cache = None
+    resolve_cold = _timed_loop(lambda a: index._resolve_alias_uncached(a), aliases, budget_sec)
+    resolve_warm = _timed_loop(lambda a: core._resolve_alias(a, char_map, variants), aliases, budget_sec)
+    defaults = _timed_loop(core._default_patterns_for, list(char_map) * max(1, 1000 // cast_size), budget_sec)
+    return {
+        "cast": cast_size,
+        "rows": rows,
+        "index_build_ms": round(build_sec * 1000, 2),
+        "extract_characters": extract,
+        "resolve_alias_uncached": resolve_cold,
+        "resolve_alias": resolve_warm,
+        "default_patterns_for": defaults,
+    }
+
+
+def run_suite(casts=(10, 100, 1000), rows=(1000, 10000, 100000), budget_sec=20.0, log=print):
+    results = []
+    for cast_size in casts:
+        for n in rows:
+            cell = bench_cell(cast_size, n, budget_sec)
+            results.append(cell)
+            ex = cell["extract_characters"]
+            log(
+                f"cast {cast_size:>5} rows {n:>7}: extract {ex['per_call_us']} us/prompt"
+                f"{' (truncated)' if ex['truncated'] else ''}, "
+                f"alias {cell['resolve_alias_uncached']['per_call_us']} us, "
+                f"defaults {cell['default_patterns_for']['per_call_us']} us, "
+                f"index {cell['index_build_ms']} ms"
+            )
+    return {
+        "benchmark": "matching",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.25):
+    """Return a list of (cell, metric, old_us, new_us) that slowed down beyond ``threshold``."""
+    old = {(r["cast"], r["rows"]): r for r in baseline.get("results", [])}
+    slower = []
+    for r in current["results"]:
+        ref = old.get((r["cast"], r["rows"]))
+        if not ref:
+            continue
+        for metric in ("extract_characters", "resolve_alias_uncached", "resolve_alias", "default_patterns_for"):
+            a, b = ref[metric]["per_call_us"], r[metric]["per_call_us"]
+            if a and b and b > a * (1 + threshold):
+                slower.append((f"cast {r['cast']} rows {r['rows']}", metric, a, b))
+    return slower
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark character extraction and alias resolution.")
+    ap.add_argument("--casts", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--budget", type=float, default=20.0, help="seconds per timed loop before it stops early")
+    ap.add_argument("--out", default="bench_matching.json", help="where to write the JSON results")
+    ap.add_argument("--compare", help="baseline JSON from an earlier run")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs the baseline")
+    args = ap.parse_args()
+
+    result = run_suite(args.casts, args.rows, args.budget)
+    Path(args.out).write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        slower = compare(result, json.loads(Path(args.compare).read_text(encoding="utf-8")), args.threshold)
+        for cell, metric, a, b in slower:
+            print(f"REGRESSION {cell} {metric}: {a} -> {b} us")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Import-time benchmark for the two entry points.
+#
+#   python bench_startup.py                 # table, 5 fresh interpreters per module
+#   python bench_startup.py --json          # machine-readable
+#   python bench_startup.py --max-ms 600    # exit 1 if any median is slower
+#
+# Each run starts a new interpreter with -X importtime, so results include
+# everything `python chatgpt_image_gui.py` loads before the window opens.
+
+import argparse, json, statistics, subprocess, sys, time
+from pathlib import Path
+
+MODULES = ["chatgpt_image_gui", "chatgpt_batch_images"]
+HERE = Path(__file__).resolve().parent
+
+
+def _parse_importtime(stderr: str):
+    # lines look like "import time:       self [us] |      cumulative | imported package"
+    costs = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, _, rest = line.partition(":")
+        parts = [p.strip() for p in rest.split("|")]
+        if len(parts) == 3 and parts[1].isdigit():
+            costs[parts[2].strip()] = int(parts[1])
+    return costs
+
+
+def measure(module: str, runs: int):
+    walls, costs = [], {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=HERE, capture_output=True, text=True,
+        )
+        walls.append((time.perf_counter() - start) * 1000)
+        if out.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{out.stderr.strip().splitlines()[-1]}")
+        costs = _parse_importtime(out.stderr)
+    top = sorted(costs.items(), key=lambda kv: kv[1], reverse=True)
+    return {
+        "module": module,
+        "runs": runs,
+        "median_ms": round(statistics.median(walls), 1),
+        "min_ms": round(min(walls), 1),
+        "top_imports_ms": {name: round(us / 1000, 1) for name, us in top[1:11]},
+        "pandas_loaded": "pandas" in costs,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Measure import time of the GUI and CLI entry points.")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    ap.add_argument("--max-ms", type=float, default=None, help="fail if a median exceeds this")
+    args = ap.parse_args()
+
+    results = [measure(m, args.runs) for m in MODULES]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for r in results:
+            print(f"{r['module']:<24} median {r['median_ms']:>7.1f} ms   min {r['min_ms']:>7.1f} ms   pandas loaded: {r['pandas_loaded']}")
+            for name, ms in r["top_imports_ms"].items():
+                print(f"    {ms:>7.1f} ms  {name}")
+
+    if args.max_ms is not None and any(r["median_ms"] > args.max_ms for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
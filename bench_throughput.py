@@ -0,0 +1,155 @@
+# End-to-end throughput benchmark against the offline mock chat server.
+#
+#   python bench_throughput.py                          # 20 prompts, 1 tab, sync engine
+#   python bench_throughput.py --prompts 50 --tabs 3 --async --latency 2
+#   python bench_throughput.py --json --out bench_output.txt
+#
+# Starts mock_chatgpt_server.MockChatServer, writes a synthetic prompt file and
+# character set to a temporary folder, and runs the same BatchRunner the CLI
+# main() and the GUI's _run_generator use, headless, on Playwright's bundled
+# Chromium. Reports prompts per minute, per-prompt time split into the
+# send_prompt phases plus the image wait, and peak memory.
+
+import argparse, json, statistics, sys, tempfile, time, tracemalloc
+from pathlib import Path
+
+from chatgpt_batch_core import SEND_PHASES, BatchRunner, BatchSettings
+from mock_chatgpt_server import MockChatServer, make_png
+
+
+def write_fixture(root: Path, prompts: int, characters: int):
+    chars_dir = root / "characters"
+    chars_dir.mkdir()
+    names = [f"Hero{n}" for n in range(1, characters + 1)]
+    char_map = {}
+    for n, name in enumerate(names):
+        path = chars_dir / f"{name}.png"
+        path.write_bytes(make_png(64, 64, seed=n))
+        char_map[name.lower()] = str(path)
+    (root / "characters.json").write_text(json.dumps(char_map), encoding="utf-8")
+    (root / "name_variants.json").write_text("{}", encoding="utf-8")
+
+    blocks = []
+    for i in range(1, prompts + 1):
+        cast = " and ".join(f"[@{names[(i + k) % len(names)]}]" for k in range(min(2, len(names))))
+        blocks.append(f"id: p{i:04d}\n{cast} walk through scene {i} at dusk.")
+    (root / "prompts.txt").write_text("\n\n".join(blocks) + "\n", encoding="utf-8")
+
+
+def _summary(values):
+    if not values:
+        return {"median": None, "mean": None, "max": None}
+    return {
+        "median": round(statistics.median(values), 4),
+        "mean": round(statistics.fmean(values), 4),
+        "max": round(max(values), 4),
+    }
+
+
+def _rss_peak_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_benchmark(prompts=20, tabs=1, async_engine=False, latency=2.0, jitter=0.0, characters=3, log=None):
+    per_prompt = {}
+
+    def progress(item, state, info):
+        rec = per_prompt.setdefault(item["id"], {})
+        if state == "sent":
+            rec.update(info.get("timings", {}))
+            rec["sent_at"] = info["sent_at"]
+        else:
+            rec["wait"] = time.time() - rec.get("sent_at", time.time())
+            rec["result"] = state
+
+    with tempfile.TemporaryDirectory() as tmp, MockChatServer(latency_sec=latency, jitter=jitter) as server:
+        root = Path(tmp)
+        write_fixture(root, prompts, characters)
+        settings = BatchSettings(
+            prompts_path=str(root / "prompts.txt"),
+            characters_json=str(root / "characters.json"),
+            name_variants_json=str(root / "name_variants.json"),
+            output_dir=str(root / "out"),
+            profile_dir=str(root / "profile"),
+            urls=[server.url],
+            max_wait_sec=int(latency * (1 + jitter) * 4 + 30),
+            min_spacing_sec=0,
+            tabs=tabs,
+            async_engine=async_engine,
+            headless=True,
+            browser_channel="",
+        )
+        runner = BatchRunner(settings, log=log or (lambda msg: None), progress=progress)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        outcome = runner.run()
+        elapsed = time.perf_counter() - started
+        _, py_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        received = len(server.sent)
+        saved = len(list((root / "out").glob("p*_*.png")))
+
+    done = [r for r in per_prompt.values() if r.get("result") == "captured"]
+    phases = {name: _summary([r[name] for r in per_prompt.values() if name in r]) for name in SEND_PHASES}
+    send_total = [sum(r.get(name, 0) for name in SEND_PHASES) for r in per_prompt.values() if "sent_at" in r]
+    waits = [r["wait"] for r in per_prompt.values() if "wait" in r]
+    return {
+        "engine": "async" if async_engine else "sync",
+        "tabs": tabs,
+        "prompts": prompts,
+        "latency_sec": latency,
+        "outcome": outcome,
+        "captured": len(done),
+        "images_saved": saved,
+        "messages_received": received,
+        "elapsed_sec": round(elapsed, 2),
+        "prompts_per_min": round(len(done) / elapsed * 60, 2) if elapsed else None,
+        "send_phases_sec": phases,
+        "send_total_sec": _summary(send_total),
+        "wait_sec": _summary(waits),
+        "wait_overhead_sec": _summary([w - latency for w in waits]),
+        "py_peak_mb": round(py_peak / (1024 * 1024), 2),
+        "rss_peak_mb": _rss_peak_mb(),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the batch loop against the offline mock chat page.")
+    ap.add_argument("--prompts", type=int, default=20)
+    ap.add_argument("--tabs", type=int, default=1)
+    ap.add_argument("--async", dest="async_engine", action="store_true", help="use the asyncio engine")
+    ap.add_argument("--latency", type=float, default=2.0, help="mock image generation time, seconds")
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--characters", type=int, default=3)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    ap.add_argument("--out", help="also write the JSON results to this file")
+    ap.add_argument("--verbose", action="store_true", help="show the runner's log")
+    args = ap.parse_args()
+
+    result = run_benchmark(
+        prompts=args.prompts, tabs=args.tabs, async_engine=args.async_engine,
+        latency=args.latency, jitter=args.jitter, characters=args.characters,
+        log=print if args.verbose else None,
+    )
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2), encoding="utf-8")
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"{result['engine']} engine, {result['tabs']} tab(s), {result['prompts']} prompts, latency {result['latency_sec']}s: {result['outcome']}")
+    print(f"  captured {result['captured']}, {result['prompts_per_min']} prompts/min in {result['elapsed_sec']}s")
+    for name, stats in result["send_phases_sec"].items():
+        print(f"  {name:<10} median {stats['median']}s  max {stats['max']}s")
+    print(f"  send total median {result['send_total_sec']['median']}s, wait overhead median {result['wait_overhead_sec']['median']}s")
+    print(f"  peak memory: python {result['py_peak_mb']} MB, process rss {result['rss_peak_mb']} MB")
+
+
+if __name__ == "__main__":
+    main()
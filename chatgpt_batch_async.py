@@ -0,0 +1,271 @@
+# pip install playwright
+# playwright install
+#
+# asyncio batch engine built on playwright.async_api. One event loop drives
+# every chat tab, selector lookups race each other instead of running one by
+# one. BatchRunner in chatgpt_batch_core switches to it via run_batch().
+#
+# The page logic itself lives in chatgpt_batch_core as steps generators (see
+# run_steps there); this module only awaits them, and keeps blocking work
+# such as journal writes and the prompt stream off the event loop.
+
+import asyncio, contextlib, functools, inspect, time
+from concurrent.futures import ThreadPoolExecutor
+
+from playwright.async_api import async_playwright
+
+import chatgpt_batch_core as core
+from chatgpt_batch_core import (
+    DEFAULT_MAX_WAIT_SEC,
+    DEFAULT_MIN_SPACING_SEC,
+    RATE_LIMIT_RETRIES,
+    CompletionWatcher as _CompletionWatcher,
+    PromptDispatch,
+    on_rate_limit_response,
+)
+
+
+async def _first_visible(candidates, timeout_ms):
+    """Race ``wait_for(visible)`` on every locator, return the best winner.
+
+    ``candidates`` is in preference order. When several are already visible
+    in the same round, the earliest in that order wins, as in the sync code.
+    """
+    tasks = {
+        asyncio.ensure_future(loc.wait_for(state="visible", timeout=timeout_ms)): rank
+        for rank, loc in enumerate(candidates)
+    }
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winners = [tasks[t] for t in done if not t.cancelled() and t.exception() is None]
+            if winners:
+                return candidates[min(winners)]
+        return None
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _offload(executor, fn, *args):
+    return asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args))
+
+
+async def _resolve(result, executor):
+    if inspect.isgenerator(result):
+        return await run_steps(result, executor)
+    if inspect.isawaitable(result):
+        return await result
+    return result
+
+
+async def run_steps(steps, executor=None):
+    """Async driver for chatgpt_batch_core steps generators.
+
+    Awaits each Playwright call the steps yield and sends the result back.
+    Blocking work runs on ``executor`` (a worker thread by default).
+    """
+    value, error = None, None
+    while True:
+        try:
+            op = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as done:
+            return done.value
+        value, error = None, None
+        try:
+            if isinstance(op, core._Sleep):
+                await asyncio.sleep(op.sec)
+            elif isinstance(op, core._InThread):
+                value = await _offload(executor, op.fn, *op.args)
+            elif isinstance(op, core._Gather):
+                value = list(await asyncio.gather(
+                    *(_resolve(call(), executor) for call in op.calls), return_exceptions=True
+                ))
+            elif isinstance(op, core._FirstVisible):
+                value = await _first_visible(op.locators, op.timeout_ms)
+            elif inspect.isawaitable(op):
+                value = await op
+            else:
+                value = op
+        except Exception as e:
+            error = e
+
+
+def awaiting(func):
+    """Async twin of a ``@page_steps`` function from chatgpt_batch_core."""
+    @functools.wraps(func)
+    async def call(*args, **kwargs):
+        return await run_steps(func.steps(*args, **kwargs))
+
+    call.steps = func.steps
+    return call
+
+
+find_composer_any_frame = awaiting(core.find_composer_any_frame)
+dismiss_common_popups = awaiting(core.dismiss_common_popups)
+detect_login = awaiting(core.detect_login)
+ensure_composer_ready = awaiting(core.ensure_composer_ready)
+goto_with_fallback = awaiting(core.goto_with_fallback)
+image_snapshot = awaiting(core.image_snapshot)
+insert_message = awaiting(core.insert_message)
+send_prompt = awaiting(core.send_prompt)
+capture_new_images = awaiting(core.capture_new_images)
+open_browser_context = awaiting(core.open_browser_context)
+
+
+class CompletionWatcher(_CompletionWatcher):
+    """Async twin of chatgpt_batch_core.CompletionWatcher."""
+
+    async def poll(self):
+        if self.outcome:
+            return self.outcome
+        return self.update(await image_snapshot(self.page))
+
+
+async def run_prompt_pool(
+    pages,
+    prompts,
+    send,
+    finish,
+    max_wait_sec=DEFAULT_MAX_WAIT_SEC,
+    min_spacing_sec=DEFAULT_MIN_SPACING_SEC,
+    max_in_flight=None,
+    limiter=None,
+    control=None,
+    on_tick=None,
+    poll_sec=1.0,
+    max_retries=RATE_LIMIT_RETRIES,
+    executor=None,
+):
+    """Async counterpart of chatgpt_batch_core.run_prompt_pool.
+
+    One task per page pulls from the shared :class:`PromptDispatch`; a
+    semaphore enforces ``max_in_flight`` and a lock serialises ``limiter``
+    checks so sends on the account stay spaced. ``send`` and ``finish`` are
+    coroutines with the same arguments as the sync pool; ``control`` and
+    ``on_tick`` are plain callables. The prompt stream may block while the
+    file is read, so it is pulled on ``executor``. Returns "stopped" or "done".
+    """
+    dispatch = PromptDispatch(prompts, limiter, max_wait_sec, min_spacing_sec, max_retries)
+    limiter = dispatch.limiter
+    cap = max(1, min(max_in_flight or len(pages), len(pages)))
+    gate = asyncio.Semaphore(cap)
+    send_lock = asyncio.Lock()
+    flags = {"stop": False, "pause": False, "skip": 0}
+
+    async def watch_controls():
+        while True:
+            action = control() if control else None
+            flags["pause"] = action == "pause"
+            if action == "stop":
+                flags["stop"] = True
+                return
+            if action == "skip":
+                flags["skip"] += 1
+            await asyncio.sleep(poll_sec)
+
+    async def worker(page):
+        current = {"watcher": None}
+
+        def on_limit(retry_after):
+            if current["watcher"]:
+                current["watcher"].note_429(retry_after)
+
+        remove_listener = on_rate_limit_response(page, on_limit)
+        try:
+            await serve(page, current)
+        finally:
+            remove_listener()
+
+    async def serve(page, current):
+        while not flags["stop"]:
+            async with gate:
+                async with send_lock:
+                    item = await _offload(executor, dispatch.take)
+                    if item is None:
+                        return
+                    while not flags["stop"] and (flags["pause"] or limiter.wait_time() > 0):
+                        await asyncio.sleep(min(poll_sec, limiter.wait_time() or poll_sec))
+                    if flags["stop"]:
+                        return
+                    limiter.record_send()
+                    try:
+                        sent = await send(page, item)
+                    except Exception as e:
+                        await finish(page, item, e, "failed")
+                        continue
+
+                watcher = current["watcher"] = CompletionWatcher(page, sent["baseline"])
+                skip_seen = flags["skip"]
+                paused_for = 0.0
+                outcome = None
+                while outcome is None:
+                    if flags["stop"]:
+                        return
+                    if flags["skip"] != skip_seen:
+                        outcome = "skip"
+                        break
+                    if flags["pause"]:
+                        paused_for += poll_sec
+                        await asyncio.sleep(poll_sec)
+                        continue
+                    elapsed = time.time() - sent["sent_at"] - paused_for
+                    outcome = dispatch.verdict(await watcher.poll(), elapsed)
+                    if outcome is None:
+                        if on_tick:
+                            on_tick(item, max(0, int(max_wait_sec - elapsed)))
+                        await asyncio.sleep(poll_sec)
+                current["watcher"] = None
+                await finish(page, item, sent, dispatch.settle(item, sent, watcher, outcome))
+
+    controller = asyncio.ensure_future(watch_controls())
+    try:
+        await asyncio.gather(*(worker(page) for page in pages))
+    finally:
+        controller.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await controller
+    return "stopped" if flags["stop"] else "done"
+
+
+async def run_batch_async(runner, prompts):
+    """Open the chat tabs and work through ``prompts`` for a BatchRunner.
+
+    Runs the runner's shared steps (open_tabs, send_one, finish_one,
+    end_run), so results match the sync engine. Journal writes and the
+    prompt stream go through one bookkeeping thread, in order. Returns
+    "done", "stopped", "canceled" or "no_composer".
+    """
+    s = runner.settings
+    runner.status("Launching browser session (async engine)...")
+    books = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-bookkeeping")
+    try:
+        async with async_playwright() as p:
+            ctx = await open_browser_context(p, s)
+            try:
+                page = await ctx.new_page()
+                pages = await run_steps(runner.open_tabs(ctx, page), books)
+                if isinstance(pages, str):
+                    return pages
+
+                async def send(pg, item):
+                    return await run_steps(runner.send_one(pg, item), books)
+
+                async def finish(pg, item, sent, result):
+                    await run_steps(runner.finish_one(pg, item, sent, result), books)
+
+                outcome = await run_prompt_pool(pages, prompts, send, finish, executor=books, **runner.pool_options())
+                await run_steps(runner.end_run(ctx), books)
+                return "canceled" if runner.login_canceled else outcome
+            finally:
+                with contextlib.suppress(Exception):
+                    await ctx.close()
+    finally:
+        books.shutdown(wait=False)
+
+
+def run_batch(runner, prompts):
+    """Blocking entry point used by BatchRunner.run()."""
+    return asyncio.run(run_batch_async(runner, prompts))
@@ -0,0 +1,2853 @@
+# pip install playwright
+# playwright install
+#
+# Shared batch engine used by both entry points, chatgpt_batch_images.py (CLI)
+# and chatgpt_image_gui.py (GUI): prompt and character loading, page helpers,
+# image completion and capture, the run journal, the tab pool and BatchRunner.
+
+from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+from pathlib import Path
+import csv, json, re, time, os, contextlib, base64, collections, functools, hashlib, inspect, itertools, mimetypes, random, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime
+from urllib.parse import urlparse
+
+# Timing defaults, seconds
+DEFAULT_MAX_WAIT_SEC = 180     # upper bound to wait for each image
+DEFAULT_MIN_SPACING_SEC = 20   # never send prompts closer together than this
+
+SELECTORS = {
+    "composer_candidates": [
+        "input[placeholder*='Ask anything']",
+        "textarea[placeholder*='Ask anything']",
+        "[aria-label*='Ask anything']",
+        "div[contenteditable='true'][data-placeholder*='Ask anything']",
+        "[data-testid='composer'] div[contenteditable='true']",
+        "div[contenteditable='true'][data-placeholder*='Send a message']",
+        "textarea[placeholder*='Send a message']",
+        "[aria-label*='Message']",
+        "div[contenteditable='true'][role='textbox']",
+        "[contenteditable='true'][data-placeholder]",
+        "[role='textbox']",
+    ],
+    "ask_anything_click_targets": [
+        "text=Ask anything",
+        "button:has-text('Ask anything')",
+        "div:has-text('Ask anything')",
+    ],
+    "new_chat_buttons": [
+        "button:has-text('New chat')",
+        "a:has-text('New chat')",
+        "button:has-text('Start chatting')",
+        "a:has-text('Start chatting')",
+        "button:has-text('Start new chat')",
+    ],
+    "attach_btn": "button[aria-label*='Attach'], button[data-testid='attach-button']",
+    "file_input": "input[type='file']",
+    "send_btn": "button:has-text('Send'), button[data-testid='send-button']",
+    "stop_btn": "button[data-testid='stop-button'], button[aria-label*='Stop']",
+    "generated_images": "[data-message-author-role='assistant'] img, img[alt*='Generated image']",
+    "assistant_msgs": "[data-message-author-role='assistant']",
+    "alerts": "[role='alert'], [role='status'], [data-testid*='toast']",
+    # exact button labels (any case) that close consent banners and tips
+    "popup_buttons": ["Accept", "Got it", "Okay", "OK", "I agree", "Continue", "Dismiss"],
+    # same-origin request paths whose HTTP 429 means the account is throttled;
+    # 429s from analytics or CDN requests on the page are ignored
+    "rate_limit_urls": ["/backend-api/conversation"],
+}
+
+# Banner text that means the account is being throttled. Checked in the page
+# (JavaScript RegExp, case-insensitive) against the newest reply and alerts.
+RATE_LIMIT_PATTERN = (
+    r"you(?:'|’)ve (?:hit|reached) (?:the |your )?(?:\w+ )*?limit|rate limit|"
+    r"too many requests|try again later|usage cap"
+)
+
+# Detect tags like [@ayda] and plain name mentions
+TAG_PATTERN = re.compile(r"\[@([a-zA-Z0-9_\- '’]+)\]")
+
+# Helpers used for detecting plain-text name mentions. Results are memoized
+# per name (bounded by NAME_CACHE_SIZE); they depend only on their input, so
+# a changed characters.json just adds new keys.
+NAME_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+def _tokenize_cached(stem: str) -> tuple:
+    sanitized = re.sub(r"[^0-9A-Za-z'’_\-\s]", " ", stem)
+    parts = [p for p in re.split(r"[\s_\-]+", sanitized) if p]
+    if len(parts) == 1:
+        part = parts[0]
+        camel = re.findall(r"[A-Z]?[a-z0-9'’]+|[A-Z]+(?![a-z])", part)
+        if len(camel) > 1:
+            parts = camel
+    return tuple(p.lower() for p in parts)
+
+
+def _tokenize_name_for_patterns(stem: str):
+    return list(_tokenize_cached(stem))
+
+
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+def _flex_apostrophes(text: str) -> str:
+    return re.sub(r"[’']", "['’]", text)
+
+
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+def _default_patterns_cached(name: str) -> tuple:
+    raw_key = name.strip().lower()
+    tokens = _tokenize_cached(name)
+    pattern_set = set()
+
+    def add_variant(text: str):
+        if not text:
+            return
+        escaped = _flex_apostrophes(re.escape(text))
+        pattern_set.add(rf"\b{escaped}(?:['’]s)?\b")
+
+    add_variant(raw_key)
+
+    canonical = " ".join(tokens)
+    if canonical and canonical != raw_key:
+        add_variant(canonical)
+
+    if tokens:
+        joined_tokens = "[\\s_\\-]+".join(_flex_apostrophes(re.escape(t)) for t in tokens)
+        pattern_set.add(rf"\b{joined_tokens}(?:['’]s)?\b")
+        collapsed = "".join(tokens)
+        if collapsed:
+            add_variant(collapsed)
+
+    return tuple(sorted(pattern_set))
+
+
+def _default_patterns_for(name: str) -> list[str]:
+    return list(_default_patterns_cached(name))
+
+
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+def _compile_patterns_cached(patterns: tuple) -> tuple:
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append(re.compile(pattern, flags=re.IGNORECASE))
+        except (re.error, TypeError):
+            continue
+    if len(compiled) > 1 and not any(rx.groups for rx in compiled):
+        with contextlib.suppress(re.error):
+            merged = "|".join(f"(?:{rx.pattern})" for rx in compiled)
+            return (re.compile(merged, flags=re.IGNORECASE),)
+    return tuple(compiled)
+
+
+def _compile_patterns(patterns) -> tuple:
+    """Compile regex sources case-insensitively, dropping invalid ones.
+
+    Patterns without groups are merged into a single alternation so a key is
+    checked with one search; anything with groups keeps its own object so
+    backreferences stay numbered correctly. Compiled tuples are memoized by
+    pattern list.
+    """
+    try:
+        return _compile_patterns_cached(tuple(patterns))
+    except TypeError:  # unhashable entries, compile without the cache
+        return _compile_patterns_cached.__wrapped__(tuple(patterns))
+
+
+def clear_name_caches():
+    for cached in (_tokenize_cached, _flex_apostrophes, _default_patterns_cached, _compile_patterns_cached):
+        cached.cache_clear()
+    _file_index_cache.clear()
+
+
+def _any_match(regexes, text: str) -> bool:
+    return any(rx.search(text) for rx in regexes)
+
+
+class CharacterIndex:
+    """Precompiled matcher for characters.json plus name_variants.json.
+
+    Built once per run so prompts are not re-tokenized and re-compiled for
+    every character. Matching order and results are identical to the
+    original per-prompt loops: tags first, then name variants, then the
+    default patterns derived from each character name.
+    """
+
+    def __init__(self, char_map: dict[str, str], name_variants: dict | None = None):
+        self.char_map = dict(char_map)
+        self._variants = [
+            (str(name).strip().lower(), _compile_patterns(pats))
+            for name, pats in (name_variants or {}).items()
+        ]
+        self._defaults = [
+            (str(raw_name).strip().lower(), _compile_patterns(_default_patterns_for(raw_name)))
+            for raw_name in self.char_map.keys()
+        ]
+        self._alias_cache: dict[str, str] = {}
+
+    @classmethod
+    def from_files(cls, char_map_json, name_variants_json):
+        return cls(load_char_map(char_map_json), load_name_variants(name_variants_json))
+
+    def resolve_alias(self, alias: str) -> str:
+        cached = self._alias_cache.get(alias)
+        if cached is not None:
+            return cached
+        resolved = self._resolve_alias_uncached(alias)
+        self._alias_cache[alias] = resolved
+        return resolved
+
+    def _resolve_alias_uncached(self, alias: str) -> str:
+        key = alias.strip().lower()
+        if key in self.char_map:
+            return key
+        for target, regexes in self._variants:
+            if target in self.char_map and _any_match(regexes, alias):
+                return target
+        for target, regexes in self._defaults:
+            if target in self.char_map and _any_match(regexes, alias):
+                return target
+        return key
+
+    def extract(self, prompt_text: str):
+        tags = []
+        seen = set()
+        for m in TAG_PATTERN.finditer(prompt_text):
+            resolved = self.resolve_alias(m.group(1).strip())
+            if resolved and resolved not in seen:
+                tags.append(resolved)
+                seen.add(resolved)
+        for entries in (self._variants, self._defaults):
+            for key, regexes in entries:
+                if key not in seen and _any_match(regexes, prompt_text):
+                    tags.append(key)
+                    seen.add(key)
+        clean = TAG_PATTERN.sub("", prompt_text)
+        clean = re.sub(r"\s{2,}", " ", clean).strip()
+        files = [self.char_map[t] for t in tags if t in self.char_map]
+        return tags, files, clean
+
+
+_index_cache: tuple | None = None
+
+
+def index_for(char_map: dict[str, str], name_variants: dict) -> CharacterIndex:
+    """CharacterIndex for in-memory mappings, reused while they are unchanged.
+
+    For callers that hold the maps themselves, such as the CLI's
+    ``extract_characters``; :func:`load_character_index` does the same for
+    the JSON files.
+    """
+    global _index_cache
+    signature = (
+        tuple(char_map.items()),
+        tuple((name, tuple(pats) if isinstance(pats, (list, tuple)) else repr(pats)) for name, pats in name_variants.items()),
+    )
+    if _index_cache is None or _index_cache[0] != signature:
+        _index_cache = (signature, CharacterIndex(char_map, name_variants))
+    return _index_cache[1]
+
+
+def _resolve_alias(alias: str, char_map: dict[str, str], name_variants: dict) -> str:
+    return index_for(char_map, name_variants).resolve_alias(alias)
+
+
+_file_index_cache: dict = {}
+
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return (str(path), None, None)
+    return (str(Path(path).resolve()), st.st_mtime_ns, st.st_size)
+
+
+def load_character_index(char_map_json, name_variants_json, log=print) -> CharacterIndex:
+    """CharacterIndex for the two JSON files, reused while neither changes.
+
+    The character map is read each time, since it drops images that no
+    longer exist; the index is keyed by that map plus the path, mtime and
+    size of name_variants.json, so repeated runs in one session skip
+    compiling until an image appears or goes, or a file is rewritten
+    (e.g. by Generate JSONs).
+    """
+    char_map = load_char_map(char_map_json)
+    key = (tuple(sorted(char_map.items())), _file_signature(name_variants_json))
+    index = _file_index_cache.get(key)
+    if index is None:
+        index = CharacterIndex(char_map, load_name_variants(name_variants_json, log))
+        _file_index_cache.clear()
+        _file_index_cache[key] = index
+    return index
+
+
+# --- Loading prompts and character maps ---
+def load_name_variants(json_path, log=print):
+    if json_path and Path(json_path).exists():
+        try:
+            return json.loads(Path(json_path).read_text(encoding="utf-8"))
+        except Exception as e:
+            log(f"Could not load name_variants.json, {e}")
+    return {}
+
+
+def load_char_map(json_path):
+    if not Path(json_path).exists():
+        return {}
+    m = json.loads(Path(json_path).read_text(encoding="utf-8"))
+    out = {}
+    for k, v in m.items():
+        key = k.strip().lower()
+        p = Path(v).expanduser()
+        if p.exists():
+            out[key] = str(p)
+    return out
+
+
+_PROMPT_HEADER_RE = re.compile(r"^(prompt[_\- ]?\d+)\s*:\s*(.*)$", re.IGNORECASE)
+_ID_HEADER_RE = re.compile(r"^id\s*:\s*(.+)$", re.IGNORECASE)
+
+
+def _looks_like_csv(first_line: str, suffix: str) -> bool:
+    if "," in first_line or suffix in [".csv", ".txt"]:
+        if first_line.lower().strip().startswith("id,prompt"):
+            return True
+        if re.match(r'^\s*[^,]+,\s*".*"$', first_line) or re.match(r"^\s*[^,]+,\s*[^\"].+$", first_line):
+            return True
+    return False
+
+
+CSV_PROBE_ROWS = 20
+_CSV_ID_RE = re.compile(r"[^\s,\"]{1,64}")
+
+
+def _csv_shape_ok(p: Path) -> bool:
+    # A comma on the first line is not enough: prose paragraphs have commas
+    # too. Require an id/prompt header, or every probed row to be an
+    # id-looking field followed by at least one more field.
+    with open(p, encoding="utf-8", errors="ignore", newline="") as f:
+        rows = list(itertools.islice((r for r in csv.reader(f) if any(c.strip() for c in r)), CSV_PROBE_ROWS))
+    if not rows:
+        return False
+    if {"id", "prompt"} & {c.lower().strip() for c in rows[0]}:
+        return True
+    return all(len(r) >= 2 and _CSV_ID_RE.fullmatch(r[0].strip()) for r in rows)
+
+
+def _iter_csv_rows(p: Path):
+    with open(p, encoding="utf-8", errors="ignore", newline="") as f:
+        reader = csv.reader(f)
+        header = next((r for r in reader if r), None)
+        if header is None:
+            return
+        cols = [c.lower().strip() for c in header]
+        if (len(header) == 2 and set(cols) != {"id", "prompt"}) or not {"id", "prompt"} & set(cols):
+            # headerless id,prompt; the prompt may contain unquoted commas or
+            # be quoted after a space ("p1, \"...\""), which csv leaves split
+            for r in itertools.chain([header], reader):
+                if not r:
+                    continue
+                pr = ",".join(r[1:]).strip()
+                if len(pr) >= 2 and pr[0] == pr[-1] == '"':
+                    pr = pr[1:-1].replace('""', '"')
+                yield {"id": r[0].strip(), "prompt": pr.strip()}
+            return
+
+        id_col = cols.index("id") if "id" in cols else None
+        prompt_col = cols.index("prompt") if "prompt" in cols else None
+        for i, r in enumerate((r for r in reader if r), start=1):
+            extra = len(r) - len(header)
+            if extra > 0 and prompt_col is not None:
+                # unquoted commas in the prompt split it, as in the headerless case
+                r = r[:prompt_col] + [",".join(r[prompt_col:prompt_col + extra + 1])] + r[prompt_col + extra + 1:]
+            pid = r[id_col] if id_col is not None and id_col < len(r) else f"row_{i}"
+            pr = r[prompt_col] if prompt_col is not None and prompt_col < len(r) else ""
+            yield {"id": pid.strip(), "prompt": pr.strip()}
+
+
+def _iter_txt_blocks(p: Path):
+    with open(p, encoding="utf-8", errors="ignore") as f:
+        block = []
+        for line in f:
+            if line.strip():
+                block.append(line.rstrip("\r\n"))
+            elif block:
+                yield block
+                block = []
+        if block:
+            yield block
+
+
+def _iter_txt_rows(p: Path):
+    for idx, lines in enumerate(_iter_txt_blocks(p), start=1):
+        header = lines[0].strip()
+        m1 = _PROMPT_HEADER_RE.match(header)
+        m2 = _ID_HEADER_RE.match(header)
+        if m1:
+            pid = m1.group(1).strip()
+            rest = m1.group(2).strip()
+            prompt_text = (rest + "\n" + "\n".join(lines[1:])).strip() if rest else "\n".join(lines[1:]).strip()
+        elif m2:
+            pid = m2.group(1).strip()
+            prompt_text = "\n".join(lines[1:]).strip()
+        else:
+            pid = f"row_{idx:03d}"
+            prompt_text = "\n".join(lines).strip()
+        if prompt_text:
+            yield {"id": pid, "prompt": prompt_text}
+
+
+def iter_prompts(prompts_path: str):
+    """
+    Stream prompts from a file, one {id, prompt} dict at a time.
+    Accepts:
+      1) CSV with header id,prompt (either .csv or .txt)
+      2) CSV without header: prompt_id,"prompt text..."
+      3) Plain TXT, one prompt per paragraph separated by blank lines
+      4) Plain TXT where a block starts with 'prompt123:' or 'id: ...'
+    Only the first few rows are read up front (to tell CSV from prose that
+    happens to contain commas); CSV is then parsed row by row and TXT
+    paragraph by paragraph, so the first prompt is available before a large
+    file has been read.
+    """
+    p = Path(prompts_path)
+    if not p.exists():
+        return
+
+    first_line = ""
+    with open(p, encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            if line.strip():
+                first_line = line.strip()
+                break
+    if not first_line:
+        return
+
+    if _looks_like_csv(first_line, p.suffix.lower()) and _csv_shape_ok(p):
+        rows = _iter_csv_rows(p)
+    else:
+        rows = _iter_txt_rows(p)
+
+    for i, row in enumerate(rows, start=1):
+        pid = str(row.get("id") or f"row_{i:03d}").strip()
+        pr = (row.get("prompt") or "").strip()
+        if pr:
+            yield {"id": pid, "prompt": pr}
+
+
+def load_prompts(prompts_path: str):
+    """Returns list of {id, prompt}; see :func:`iter_prompts` for the formats."""
+    return list(iter_prompts(prompts_path))
+
+
+# --- Building characters.json from an image folder ---
+CHARACTER_IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+CHARACTER_MANIFEST = ".character_manifest.json"
+
+
+def _character_key(stem: str) -> str:
+    return " ".join(_tokenize_name_for_patterns(stem)) or stem.lower()
+
+
+def _write_json_atomic(path: Path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+FINGERPRINT_BYTES = 8192  # read from each end of a new image for rename checks
+
+
+def _image_fingerprint(path, size):
+    """Hash of the first and last FINGERPRINT_BYTES, cheap on a network share."""
+    h = hashlib.sha256()
+    with contextlib.suppress(OSError):
+        with open(path, "rb") as f:
+            h.update(f.read(FINGERPRINT_BYTES))
+            if size > 2 * FINGERPRINT_BYTES:
+                f.seek(size - FINGERPRINT_BYTES)
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def scan_character_images(img_dir, workers=8, progress=None):
+    """Create or update characters.json and name_variants.json for a folder.
+
+    Both files and a manifest of file names, mtimes, sizes and fingerprints
+    live next to ``img_dir``. Only new or changed images are resolved, on a
+    pool of ``workers`` threads; removed images drop out and renamed ones
+    (same mtime, size and fingerprint) carry their variants over. Entries
+    for other folders and hand-edited variant lists (anything other than
+    the generated default patterns) are kept.
+    ``progress(done, total)`` is called from worker threads.
+
+    Returns a dict of counts plus the two JSON paths.
+    """
+    img_dir = Path(img_dir)
+    root = img_dir.parent
+    char_json_path = root / "characters.json"
+    variants_json_path = root / "name_variants.json"
+    manifest_path = root / CHARACTER_MANIFEST
+
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        manifest = {}
+    known = manifest.get("files", {}) if manifest.get("dir") == str(img_dir.resolve()) else {}
+
+    entries = sorted(
+        (e for e in os.scandir(img_dir)
+         if e.name.lower().endswith(CHARACTER_IMAGE_SUFFIXES) and Path(e.name).stem.strip()),
+        key=lambda e: e.name,
+    )
+    total = len(entries)
+    done = 0
+    done_lock = threading.Lock()
+
+    def examine(entry):
+        nonlocal done
+        if not entry.is_file():
+            info = None
+        else:
+            st = entry.stat()
+            old = known.get(entry.name)
+            if old and (old["mtime_ns"], old["size"]) == (st.st_mtime_ns, st.st_size):
+                info = dict(old, state="unchanged")
+            else:
+                stem = Path(entry.name).stem.strip()
+                info = {
+                    "mtime_ns": st.st_mtime_ns,
+                    "size": st.st_size,
+                    "fingerprint": _image_fingerprint(entry.path, st.st_size),
+                    "key": _character_key(stem),
+                    "path": str(Path(entry.path).resolve()),
+                    "state": "updated" if old else "added",
+                }
+        with done_lock:
+            done += 1
+            if progress:
+                progress(done, total)
+        return entry.name, info
+
+    current = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for fut in as_completed([pool.submit(examine, e) for e in entries]):
+            name, info = fut.result()
+            if info:
+                current[name] = info
+    current = dict(sorted(current.items()))
+
+    def load(path):
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    chars = load(char_json_path)
+    variants = load(variants_json_path)
+    char_keys = {k.strip().lower(): k for k in chars}
+
+    def auto_patterns(name):
+        return _default_patterns_for(Path(name).stem.strip())
+
+    live_keys = {info["key"] for info in current.values()}
+    removed = {name: old for name, old in known.items() if name not in current}
+
+    def signature(info):
+        return info["mtime_ns"], info["size"], info.get("fingerprint")
+
+    added_by_sig = {signature(i): n for n, i in current.items() if i["state"] == "added"}
+    stats = {"images": len(current), "added": 0, "updated": 0, "unchanged": 0,
+             "removed": 0, "renamed": 0, "kept_variants": 0}
+
+    if not current:
+        return dict(stats, chars_path=None, variants_path=None)
+
+    renamed_targets = set()
+    for name, old in removed.items():
+        key = old["key"]
+        # an entry from before fingerprints were kept never pairs: call it removed
+        renamed_to = added_by_sig.pop(signature(old), None) if "fingerprint" in old else None
+        stats["renamed" if renamed_to else "removed"] += 1
+        if renamed_to:
+            renamed_targets.add(renamed_to)
+        hand_edited = key in variants and variants[key] != auto_patterns(name)
+        if renamed_to and hand_edited:
+            new_key = current[renamed_to]["key"]
+            if new_key not in variants or variants[new_key] == auto_patterns(renamed_to):
+                variants[new_key] = variants[key]
+        if key in live_keys:
+            continue
+        if chars.get(char_keys.get(key, key)) == old["path"]:
+            chars.pop(char_keys.get(key, key))
+        if key in variants:
+            if hand_edited and not renamed_to:
+                stats["kept_variants"] += 1  # the user's list outlives the image
+            else:
+                variants.pop(key)
+
+    for name, info in current.items():
+        if name not in renamed_targets:
+            stats[info["state"]] += 1
+        key = info["key"]
+        existing = char_keys.get(key)
+        if existing is not None and existing != key:
+            chars.pop(existing, None)
+        chars[key] = info["path"]
+        variants.setdefault(key, auto_patterns(name))
+
+    _write_json_atomic(char_json_path, chars)
+    _write_json_atomic(variants_json_path, variants)
+    _write_json_atomic(manifest_path, {
+        "dir": str(img_dir.resolve()),
+        "files": {n: {k: v for k, v in i.items() if k != "state"} for n, i in current.items()},
+    })
+    return dict(stats, chars_path=str(char_json_path), variants_path=str(variants_json_path))
+
+
+# --- Engine-neutral page steps ---
+# Page logic is written once, as generators that yield every Playwright
+# call. The sync engine runs them with run_steps() below, where a call has
+# already returned its value; chatgpt_batch_async drives the same
+# generators and awaits what the async API returns. Waits and blocking
+# work are yielded as the markers below so each engine can do them its way.
+@dataclass(frozen=True)
+class _Sleep:
+    sec: float
+
+
+@dataclass(frozen=True)
+class _InThread:
+    """Blocking Python work (disk, journal, user prompts); the async engine
+    runs it off the event loop."""
+    fn: object
+    args: tuple = ()
+
+
+@dataclass(frozen=True)
+class _Gather:
+    """Zero-argument callables to run together; results come back in order,
+    with an exception in place of a result that raised."""
+    calls: list
+
+
+@dataclass(frozen=True)
+class _FirstVisible:
+    """The first of ``locators`` that is visible, or None."""
+    locators: list
+    timeout_ms: int
+
+
+def _first_visible_now(locators):
+    for loc in locators:
+        with contextlib.suppress(Exception):
+            if loc.is_visible():
+                return loc
+    return None
+
+
+def run_steps(steps):
+    """Run a page-steps generator on the sync API and return its result."""
+    value, error = None, None
+    while True:
+        try:
+            op = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as done:
+            return done.value
+        value, error = None, None
+        try:
+            if isinstance(op, _Sleep):
+                time.sleep(op.sec)
+            elif isinstance(op, _InThread):
+                value = op.fn(*op.args)
+            elif isinstance(op, _Gather):
+                value = []
+                for call in op.calls:
+                    try:
+                        result = call()
+                        value.append(run_steps(result) if inspect.isgenerator(result) else result)
+                    except Exception as e:
+                        value.append(e)
+            elif isinstance(op, _FirstVisible):
+                value = _first_visible_now(op.locators)
+            else:
+                value = op  # the sync call already ran
+        except Exception as e:
+            error = e
+
+
+def page_steps(fn):
+    """Make a steps generator callable as a plain sync function.
+
+    The generator stays available as ``.steps`` so other steps can
+    ``yield from`` it and the async engine can drive it.
+    """
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        return run_steps(fn(*args, **kwargs))
+
+    run.steps = fn
+    return run
+
+
+# --- Page helpers ---
+_DISMISS_POPUPS_JS = """
+    (labels) => {
+        const wanted = new Set(labels.map(t => t.trim().toLowerCase()));
+        const visible = el => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+        const clicked = [];
+        for (const el of document.querySelectorAll("button, [role='button']")) {
+            const label = (el.innerText || el.textContent || "").trim().toLowerCase();
+            if (wanted.has(label) && !el.disabled && visible(el)) {
+                el.click();
+                clicked.push(label);
+            }
+        }
+        return clicked;
+    }
+"""
+
+
+@page_steps
+def dismiss_common_popups(page, labels=None):
+    """Click every visible dismiss button in one DOM pass.
+
+    ``labels`` defaults to ``SELECTORS["popup_buttons"]``. When nothing is
+    showing this is a single ``evaluate``. Returns the labels clicked.
+    """
+    try:
+        return (yield page.evaluate(_DISMISS_POPUPS_JS, list(labels or SELECTORS["popup_buttons"])))
+    except Exception:
+        return []
+
+
+def in_conversation(url: str) -> bool:
+    try:
+        u = urlparse(url)
+        return "/c/" in u.path or "model=" in (u.query or "")
+    except Exception:
+        return False
+
+
+_VISIBLE_MATCH_JS = """
+    (sels) => {
+        const visible = el => {
+            if (!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)) return false;
+            const st = getComputedStyle(el);
+            return st.visibility !== "hidden" && st.display !== "none";
+        };
+        for (let i = 0; i < sels.length; i++) {
+            let els;
+            try { els = document.querySelectorAll(sels[i]); } catch (e) { continue; }
+            for (const el of els) if (visible(el)) return i;
+        }
+        return -1;
+    }
+"""
+
+
+class ComposerResolver:
+    """Find the chat composer with one DOM scan per frame.
+
+    All candidate selectors are checked inside a single ``evaluate`` and the
+    first visible match wins. The selector that won last time is tried first
+    on later lookups, so a stable page layout resolves on the first probe.
+    """
+
+    def __init__(self, selectors):
+        self.selectors = list(selectors)
+        self.preferred = None
+
+    def order(self):
+        if self.preferred in self.selectors:
+            return [self.preferred] + [s for s in self.selectors if s != self.preferred]
+        return list(self.selectors)
+
+    def accept(self, order, idx):
+        """Selector for a ``_VISIBLE_MATCH_JS`` result over ``order``, remembered as preferred."""
+        if not isinstance(idx, int) or isinstance(idx, bool) or idx < 0:
+            return None
+        self.preferred = order[idx]
+        return order[idx]
+
+
+COMPOSER_RESOLVER = ComposerResolver(
+    [
+        "[placeholder*='Ask anything' i]",
+        "textarea, input[type='text'], [role='textbox'], [contenteditable='true']",
+    ]
+    + SELECTORS["composer_candidates"]
+)
+
+
+_FOCUS_LAST_EDITABLE_JS = """
+    () => {
+        const eds = Array.from(document.querySelectorAll('[contenteditable="true"]'));
+        const last = eds[eds.length - 1];
+        if (last) { last.focus(); return true; }
+        return false;
+    }
+"""
+
+
+@page_steps
+def find_composer_any_frame(page, timeout_ms=15000, resolver=None):
+    # One DOM scan per frame with the shared ComposerResolver; the main
+    # frame wins ties, then frames in document order.
+    resolver = resolver or COMPOSER_RESOLVER
+    deadline = time.time() + timeout_ms / 1000.0
+
+    while time.time() < deadline:
+        order = resolver.order()
+        frames = [page.main_frame] + [fr for fr in page.frames if fr != page.main_frame]
+        found = yield _Gather([functools.partial(fr.evaluate, _VISIBLE_MATCH_JS, order) for fr in frames])
+        for fr, idx in zip(frames, found):
+            selector = resolver.accept(order, idx)
+            if selector:
+                return fr.locator(f"{selector} >> visible=true").first
+        yield _Sleep(0.3)
+
+    try:
+        yield page.evaluate(_FOCUS_LAST_EDITABLE_JS)
+        loc = page.locator('[contenteditable="true"]').last
+        yield loc.wait_for(state="visible", timeout=1200)
+        return loc
+    except Exception:
+        pass
+
+    raise TimeoutError("Composer not visible in any frame")
+
+
+@page_steps
+def ensure_composer_ready(page, *, timeout_ms=6000, allow_reload=True, allow_new_chat=True, stats=None, popups=None):
+    """Return the composer, opening a new chat or reloading if it is missing.
+
+    ``stats``, when given, counts the recoveries under "new_chat" and "reloads".
+    ``popups`` is passed to :func:`dismiss_common_popups` after a reload.
+    """
+    stats = stats if stats is not None else {}
+    try:
+        return (yield from find_composer_any_frame.steps(page, timeout_ms=timeout_ms))
+    except Exception:
+        pass
+    if allow_new_chat and not in_conversation(page.url):
+        buttons = [page.locator(sel).first for sel in SELECTORS["new_chat_buttons"]]
+        btn = yield _FirstVisible(buttons, 1200)
+        if btn:
+            stats["new_chat"] = stats.get("new_chat", 0) + 1
+            try:
+                yield btn.click()
+                yield page.wait_for_load_state("domcontentloaded")
+                return (yield from find_composer_any_frame.steps(page, timeout_ms=timeout_ms))
+            except Exception:
+                pass
+    if not allow_reload:
+        raise TimeoutError("Composer not visible (reload skipped)")
+    stats["reloads"] = stats.get("reloads", 0) + 1
+    yield page.reload(wait_until="domcontentloaded", timeout=15000)
+    yield from dismiss_common_popups.steps(page, popups)
+    return (yield from find_composer_any_frame.steps(page, timeout_ms=max(timeout_ms, 8000)))
+
+
+# Ways to put the prompt into the composer, fastest first. "type" sends
+# one key event per character and is only the last resort.
+INSERT_STRATEGIES = ("fill", "insert_text", "paste", "dom", "type")
+FILL_TIMEOUT_MS = 5000
+
+_COMPOSER_TEXT_JS = """
+    el => (typeof el.value === "string" ? el.value : el.innerText) || ""
+"""
+
+_COMPOSER_CLEAR_JS = """
+    el => {
+        el.focus();
+        if (typeof el.value === "string") {
+            Object.getOwnPropertyDescriptor(Object.getPrototypeOf(el), "value").set.call(el, "");
+            el.dispatchEvent(new Event("input", {bubbles: true}));
+        } else {
+            document.execCommand("selectAll", false);
+            document.execCommand("delete", false);
+        }
+    }
+"""
+
+_COMPOSER_PASTE_JS = """
+    (el, text) => {
+        el.focus();
+        const data = new DataTransfer();
+        data.setData("text/plain", text);
+        el.dispatchEvent(new ClipboardEvent("paste", {clipboardData: data, bubbles: true, cancelable: true}));
+    }
+"""
+
+_COMPOSER_SET_JS = """
+    (el, text) => {
+        el.focus();
+        if (typeof el.value === "string") {
+            Object.getOwnPropertyDescriptor(Object.getPrototypeOf(el), "value").set.call(el, text);
+        } else {
+            el.innerText = text;
+        }
+        el.dispatchEvent(new InputEvent("input", {bubbles: true, inputType: "insertText", data: text}));
+    }
+"""
+
+
+def _same_text(a, b):
+    return " ".join(str(a).split()) == " ".join(str(b).split())
+
+
+class ComposerInserter:
+    """Remember which insertion strategy fills the composer correctly.
+
+    :func:`insert_message` tries the strategies in order and keeps the first
+    one whose result reads back as the message; later prompts start with it,
+    the same way ComposerResolver keeps the winning selector.
+    """
+
+    def __init__(self, strategies=INSERT_STRATEGIES):
+        self.strategies = list(strategies)
+        self.preferred = None
+
+    def order(self):
+        if self.preferred in self.strategies:
+            return [self.preferred] + [s for s in self.strategies if s != self.preferred]
+        return list(self.strategies)
+
+
+COMPOSER_INSERTER = ComposerInserter()
+
+
+def _insert_with(page, composer, message, strategy):
+    if strategy == "fill":
+        yield composer.fill(message, timeout=FILL_TIMEOUT_MS)
+    elif strategy == "insert_text":
+        yield composer.focus()
+        yield page.keyboard.insert_text(message)
+    elif strategy == "paste":
+        yield composer.evaluate(_COMPOSER_PASTE_JS, message)
+    elif strategy == "dom":
+        yield composer.evaluate(_COMPOSER_SET_JS, message)
+    else:
+        yield composer.type(message, delay=10)
+
+
+@page_steps
+def insert_message(page, composer, message, inserter=None):
+    """Enter ``message`` into the composer and check that it arrived intact.
+
+    Returns ``(strategy, failed)``, the strategy that worked and how many
+    were tried before it. The composer is cleared after a failed attempt.
+    "type" is accepted without the check, as the old fallback was.
+    """
+    inserter = inserter or COMPOSER_INSERTER
+    failed = 0
+    for strategy in inserter.order():
+        try:
+            yield from _insert_with(page, composer, message, strategy)
+            if strategy == "type" or _same_text((yield composer.evaluate(_COMPOSER_TEXT_JS)), message):
+                inserter.preferred = strategy
+                return strategy, failed
+        except Exception:
+            pass
+        failed += 1
+        try:
+            yield composer.evaluate(_COMPOSER_CLEAR_JS)
+        except Exception:
+            pass
+    raise RuntimeError("Could not enter the prompt into the composer")
+
+
+# matched against the parsed host (or a parent domain) and whole path
+# segments, so chat URLs such as /g/g-123-auth-helper do not count
+LOGIN_HOSTS = ("auth.openai.com", "auth0.openai.com", "login.openai.com", "challenges.cloudflare.com")
+LOGIN_PATH_SEGMENTS = ("login", "log-in", "signin", "sign-in", "auth", "authorize", "challenge-platform")
+LOGIN_TEXT_CLUES = [
+    "Log in",
+    "Sign in",
+    "Welcome back",
+    "Continue with",
+    "Use the ChatGPT app to continue",
+    "Verify you are human",
+    "human check",
+]
+LOGIN_SELECTOR_CLUES = [
+    "input[type='email']",
+    "input[type='password']",
+    "form[action*='login']",
+    "iframe[src*='captcha']",
+    "iframe[title*='captcha']",
+]
+LOGIN_BUTTON_LABELS = ["Log in", "Sign in"]
+
+_LOGIN_SIGNALS_JS = """
+    ([texts, selectors, buttons, includeText]) => {
+        const visible = el => {
+            if (!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)) return false;
+            const st = getComputedStyle(el);
+            return st.visibility !== "hidden" && st.display !== "none";
+        };
+        const out = {texts: [], selectors: [], buttons: []};
+        if (includeText) {
+            const body = ((document.body && document.body.innerText) || "").toLowerCase();
+            out.texts = texts.filter(t => body.includes(t.toLowerCase()));
+        }
+        for (const sel of selectors) {
+            try {
+                if (Array.from(document.querySelectorAll(sel)).some(visible)) out.selectors.push(sel);
+            } catch (e) {}
+        }
+        const labels = buttons.map(b => b.toLowerCase());
+        for (const el of document.querySelectorAll("button, [role='button']")) {
+            const text = (el.innerText || "").trim().toLowerCase();
+            const hit = labels.find(l => text.startsWith(l));
+            if (hit && !out.buttons.includes(hit) && visible(el)) out.buttons.push(hit);
+        }
+        return out;
+    }
+"""
+
+
+def _login_signal_args(include_text=True):
+    return [LOGIN_TEXT_CLUES, LOGIN_SELECTOR_CLUES, LOGIN_BUTTON_LABELS, include_text]
+
+
+def _login_url_hits(url):
+    """LOGIN_HOSTS and LOGIN_PATH_SEGMENTS found in ``url``."""
+    try:
+        parsed = urlparse((url or "").lower())
+    except ValueError:
+        return []
+    host = parsed.hostname or ""
+    segments = [s for s in parsed.path.split("/") if s]
+    if "logout" in segments:
+        return []
+    hits = [h for h in LOGIN_HOSTS if host == h or host.endswith("." + h)]
+    return hits + [f"/{s}" for s in LOGIN_PATH_SEGMENTS if s in segments]
+
+
+def login_verdict(url, frame_urls, signals):
+    """Combine the page URL, child frame URLs and the in-page signals.
+
+    Returns ``{"login_needed": bool, "reasons": [...]}``, reasons being
+    short strings such as "url:auth.openai.com", "url:/login" or
+    "selector:input[type='password']".
+    """
+    reasons = [f"url:{hit}" for hit in _login_url_hits(url)]
+    signals = signals or {}
+    reasons += [f"text:{t}" for t in signals.get("texts", ())]
+    reasons += [f"selector:{sel}" for sel in signals.get("selectors", ())]
+    reasons += [f"button:{b}" for b in signals.get("buttons", ())]
+    for f_url in frame_urls:
+        f_url = (f_url or "").lower()
+        if "captcha" in f_url or _login_url_hits(f_url):
+            reasons.append(f"frame:{f_url[:80]}")
+    return {"login_needed": bool(reasons), "reasons": reasons}
+
+
+@page_steps
+def detect_login(page, include_text=True):
+    """Check for a login or human-check page with one ``evaluate``.
+
+    ``include_text=False`` skips the visible-text clues, which chat messages
+    can trip, and is cheap enough to run before every prompt.
+    """
+    try:
+        signals = yield page.evaluate(_LOGIN_SIGNALS_JS, _login_signal_args(include_text))
+    except Exception:
+        signals = {}
+    try:
+        frame_urls = [fr.url for fr in page.frames if fr != page.main_frame]
+    except Exception:
+        frame_urls = []
+    return login_verdict(page.url, frame_urls, signals)
+
+
+def looks_like_login(page):
+    return detect_login(page)["login_needed"]
+
+
+class LoginRequired(RuntimeError):
+    """Raised by send_prompt when the chat tab shows a login or human check."""
+
+    def __init__(self, verdict):
+        super().__init__(", ".join(verdict["reasons"]) or "login page")
+        self.verdict = verdict
+
+
+@page_steps
+def goto_with_fallback(page, urls, log=print, popups=None):
+    """Open the first reachable chat URL. Returns ``(composer, login_needed)``."""
+    for attempt, url in enumerate([u for u in urls if u], start=1):
+        try:
+            yield page.goto(url, wait_until="domcontentloaded", timeout=15000)
+        except PWTimeout:
+            log(f"Navigation to {url} hit timeout, continuing (attempt {attempt}).")
+        except Exception as e:
+            log(f"Navigation to {url} failed, {e}")
+            continue
+        yield from dismiss_common_popups.steps(page, popups)
+        if (yield from detect_login.steps(page))["login_needed"]:
+            return None, True
+        try:
+            comp = yield from ensure_composer_ready.steps(page, timeout_ms=2500, allow_reload=False, popups=popups)
+            if comp:
+                return comp, False
+        except Exception:
+            pass
+    return None, False
+
+
+# --- Image completion detection ---
+_IMAGE_STATE_JS = """
+    ([imgSel, stopSel, minSize, replySel, alertSel, limitSrc]) => {
+        const visible = el => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+        const imgs = Array.from(document.querySelectorAll(imgSel)).filter(visible);
+        let loaded = 0, pending = 0;
+        for (const img of imgs) {
+            if (img.complete && img.naturalWidth >= minSize) loaded++;
+            else if (!img.complete) pending++;
+        }
+        const generating = Array.from(document.querySelectorAll(stopSel)).some(visible);
+        const limit = new RegExp(limitSrc, "i");
+        const replies = document.querySelectorAll(replySel);
+        const last = replies[replies.length - 1];
+        const replyLimited = !!last && limit.test(last.innerText || "");
+        const alertLimited = Array.from(document.querySelectorAll(alertSel))
+            .some(el => visible(el) && limit.test(el.innerText || ""));
+        return {loaded, pending, generating, replies: replies.length, replyLimited, alertLimited};
+    }
+"""
+
+
+def _image_state_args(min_size=256):
+    return [
+        SELECTORS["generated_images"], SELECTORS["stop_btn"], min_size,
+        SELECTORS["assistant_msgs"], SELECTORS["alerts"], RATE_LIMIT_PATTERN,
+    ]
+
+
+@page_steps
+def image_snapshot(page, min_size=256):
+    """Return counts of rendered/pending chat images, whether a reply is
+    streaming, and whether a rate-limit banner is showing."""
+    try:
+        return (yield page.evaluate(_IMAGE_STATE_JS, _image_state_args(min_size)))
+    except Exception:
+        return {"loaded": 0, "pending": 0, "generating": False}
+
+
+def _retry_after(resp):
+    try:
+        return float(resp.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def is_chat_rate_limit(resp, page_url, paths=None) -> bool:
+    """True for an HTTP 429 from the chat backend of the page's own site."""
+    if getattr(resp, "status", None) != 429:
+        return False
+    try:
+        url = urlparse(resp.url)
+        same_origin = url.netloc == urlparse(page_url).netloc
+    except (AttributeError, TypeError, ValueError):
+        return False
+    paths = SELECTORS["rate_limit_urls"] if paths is None else paths
+    return same_origin and any(p in url.path for p in paths)
+
+
+def on_rate_limit_response(page, callback, paths=None):
+    """Call ``callback(retry_after_sec)`` when the chat backend answers 429.
+
+    ``paths`` defaults to SELECTORS["rate_limit_urls"]. Returns a function
+    that removes the listener again, since a kept page outlives the run.
+    """
+    def on_response(resp):
+        with contextlib.suppress(Exception):
+            if is_chat_rate_limit(resp, page.url, paths):
+                callback(_retry_after(resp))
+
+    def remove():
+        with contextlib.suppress(Exception):
+            page.remove_listener("response", on_response)
+
+    with contextlib.suppress(Exception):
+        page.on("response", on_response)
+    return remove
+
+
+class CompletionWatcher:
+    """Non-blocking completion check for one sent prompt.
+
+    ``poll()`` takes one :func:`image_snapshot` and returns "done" once the
+    new image has loaded and stayed stable, "no_image" when a reply finished
+    without producing one, "rate_limited" when a limit banner showed up or
+    :meth:`note_429` was called, or None while it is still in progress.
+    ``timeline()`` has the wall-clock times it first saw each of those stages.
+    """
+
+    def __init__(self, page, baseline, settle_polls=2, no_image_grace_sec=8.0):
+        self.page = page
+        self.baseline = baseline
+        self.settle_polls = settle_polls
+        self.no_image_grace_sec = no_image_grace_sec
+        self.saw_generating = False
+        self.stable = 0
+        self.idle_since = None
+        self.outcome = None
+        self.generating_at = None
+        self.first_image_at = None
+        self.outcome_at = None
+        self.http_429 = False
+        self.retry_after = None
+
+    def note_429(self, retry_after=None):
+        self.http_429 = True
+        self.retry_after = retry_after
+
+    def poll(self):
+        if self.outcome:
+            return self.outcome
+        return self.update(image_snapshot(self.page))
+
+    def update(self, snap):
+        now = time.time()
+        new_images = snap["loaded"] - self.baseline.get("loaded", 0)
+        if self.first_image_at is None and (new_images > 0 or snap["pending"] > self.baseline.get("pending", 0)):
+            self.first_image_at = now
+        new_reply_limited = snap.get("replyLimited") and snap.get("replies", 0) > self.baseline.get("replies", 0)
+        if self.http_429 or snap.get("alertLimited") or new_reply_limited:
+            self.outcome = "rate_limited"
+        elif snap["generating"]:
+            self.generating_at = self.generating_at or now
+            self.saw_generating = True
+            self.stable = 0
+            self.idle_since = None
+        elif new_images > 0 and snap["pending"] == 0:
+            self.stable += 1
+            if self.stable >= self.settle_polls:
+                self.outcome = "done"
+        elif self.saw_generating:
+            self.idle_since = self.idle_since or now
+            if now - self.idle_since >= self.no_image_grace_sec:
+                self.outcome = "no_image"
+        if self.outcome:
+            self.outcome_at = now
+        return self.outcome
+
+    def timeline(self):
+        return {"generating_at": self.generating_at, "first_image_at": self.first_image_at, "outcome_at": self.outcome_at}
+
+
+# --- Image capture ---
+_IMAGE_SOURCES_JS = """
+    ([imgSel, minSize]) => Array.from(document.querySelectorAll(imgSel))
+        .filter(img => img.complete && img.naturalWidth >= minSize)
+        .filter(img => !!(img.offsetWidth || img.offsetHeight || img.getClientRects().length))
+        .map(img => img.currentSrc || img.src)
+"""
+
+_FETCH_IN_PAGE_JS = """
+    async (src) => {
+        const resp = await fetch(src);
+        const blob = await resp.blob();
+        const buf = new Uint8Array(await blob.arrayBuffer());
+        let bin = "";
+        for (let i = 0; i < buf.length; i += 0x8000) {
+            bin += String.fromCharCode.apply(null, buf.subarray(i, i + 0x8000));
+        }
+        return {type: blob.type, data: btoa(bin)};
+    }
+"""
+
+IMAGE_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+def safe_file_stem(text: str) -> str:
+    stem = re.sub(r"[^\w\-.]+", "_", str(text)).strip("._")
+    return stem or "prompt"
+
+
+def _image_extension(content_type: str, src: str) -> str:
+    ext = IMAGE_EXTENSIONS.get((content_type or "").split(";")[0].strip().lower())
+    if ext:
+        return ext
+    suffix = Path(urlparse(src).path).suffix.lower()
+    return suffix if suffix in IMAGE_EXTENSIONS.values() else ".png"
+
+
+def _fetch_image_bytes(page, src):
+    # http(s) goes through the context's request API, which shares the
+    # logged-in cookies and returns the original bytes. blob:/data: URLs
+    # only resolve inside the page, so those are read back via fetch().
+    if src.startswith(("http://", "https://")):
+        resp = yield page.context.request.get(src)
+        if resp.ok:
+            return (yield resp.body()), resp.headers.get("content-type", "")
+        raise RuntimeError(f"HTTP {resp.status} for {src}")
+    payload = yield page.evaluate(_FETCH_IN_PAGE_JS, src)
+    return base64.b64decode(payload["data"]), payload.get("type", "")
+
+
+@page_steps
+def new_image_sources(page, baseline, min_size=256):
+    try:
+        srcs = yield page.evaluate(_IMAGE_SOURCES_JS, [SELECTORS["generated_images"], min_size])
+    except Exception:
+        return []
+    out = []
+    for src in srcs[baseline.get("loaded", 0):]:
+        if src and src not in out:
+            out.append(src)
+    return out
+
+
+@page_steps
+def capture_new_images(page, baseline, item, output_dir, tags=(), attachments=(), message="", log=print):
+    """Save images generated since ``baseline`` as ``<id>_<n>.<ext>``.
+
+    Images are downloaded together (concurrently on the async engine).
+    Also writes ``<id>.json`` next to them with the prompt, tags,
+    attachments and saved file names. Returns the list of saved paths.
+    """
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = safe_file_stem(item["id"])
+    srcs = yield from new_image_sources.steps(page, baseline)
+    results = yield _Gather([functools.partial(_fetch_image_bytes, page, src) for src in srcs])
+    saved = []
+    for src, res in zip(srcs, results):
+        if isinstance(res, Exception):
+            log(f"[{item['id']}] Could not download image, {res}")
+            continue
+        data, content_type = res
+        target = out_dir / f"{stem}_{len(saved) + 1}{_image_extension(content_type, src)}"
+        yield _InThread(target.write_bytes, (data,))
+        saved.append(target)
+
+    sidecar = {
+        "id": item["id"],
+        "prompt": item["prompt"],
+        "message": message,
+        "tags": list(tags),
+        "attachments": list(attachments),
+        "images": [p.name for p in saved],
+        "captured_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    try:
+        yield _InThread((out_dir / f"{stem}.json").write_text, (json.dumps(sidecar, indent=2), "utf-8"))
+    except OSError:
+        pass
+    return saved
+
+
+# --- Attachments ---
+ATTACHMENT_CACHE_BYTES = 256 * 1024 * 1024
+SET_INPUT_FILES_LIMIT = 50 * 1024 * 1024  # Playwright rejects larger buffer uploads in one call
+
+
+def _pillow():
+    # Pillow is optional and only needed when reference downscaling is on
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+class ReferenceImageCache:
+    """Size-bounded JPEG/WebP copies of character references, cached on disk.
+
+    :meth:`prepare` returns the file to attach: a copy at most ``max_dim``
+    pixels on its long side, re-encoded at ``quality``, or the original when
+    it is already small enough, the copy would not be smaller, or Pillow is
+    not installed. ``manifest.json`` in ``cache_dir`` maps each source to
+    its copy by mtime and size, backed by a content hash so a touched but
+    unchanged file is not re-encoded.
+    """
+
+    FORMATS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+    def __init__(self, cache_dir, max_dim=1536, quality=85, fmt="JPEG", min_bytes=500_000, log=print):
+        fmt = fmt.upper()
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unsupported reference format {fmt!r}, use JPEG or WEBP")
+        self.cache_dir = Path(cache_dir)
+        self.max_dim = int(max_dim)
+        self.quality = int(quality)
+        self.fmt = fmt
+        self.min_bytes = min_bytes
+        self.log = log
+        self.manifest_path = self.cache_dir / "manifest.json"
+        self._settings = f"{fmt}:{self.max_dim}:{self.quality}"
+        self._lock = threading.Lock()
+        self._warned = False
+        try:
+            self._manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._manifest = {}
+
+    def prepare(self, path):
+        src = Path(path)
+        st = src.stat()
+        key = str(src.resolve())
+        with self._lock:
+            entry = self._manifest.get(key)
+            if entry and entry["settings"] == self._settings and (entry["mtime_ns"], entry["size"]) == (st.st_mtime_ns, st.st_size):
+                hit = self._resolve(src, entry)
+                if hit:
+                    return hit
+
+        digest = _file_digest(src)
+        with self._lock:
+            entry = self._manifest.get(key)
+            if entry and entry["settings"] == self._settings and entry["sha256"] == digest:
+                hit = self._resolve(src, entry)
+                if hit:
+                    entry.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+                    self._save()
+                    return hit
+
+        out = self.cache_dir / f"{digest[:24]}_{self.max_dim}q{self.quality}{self.FORMATS[self.fmt]}"
+        if not out.exists():
+            rendered = self._render(src, out)
+            if rendered is None:
+                return src
+            if not rendered:
+                out = None
+        with self._lock:
+            self._manifest[key] = {
+                "sha256": digest,
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "settings": self._settings,
+                "out": out.name if out else None,
+            }
+            self._save()
+        return out or src
+
+    def _resolve(self, src, entry):
+        if entry["out"] is None:
+            return src
+        out = self.cache_dir / entry["out"]
+        return out if out.exists() else None
+
+    def _render(self, src, out):
+        """Write the bounded copy; False keeps the original, None means no Pillow."""
+        Image = _pillow()
+        if Image is None:
+            if not self._warned:
+                self._warned = True
+                self.log("Pillow is not installed (pip install pillow), attaching reference images unchanged.")
+            return None
+        with Image.open(src) as im:
+            if max(im.size) <= self.max_dim and src.stat().st_size <= self.min_bytes:
+                return False
+            im.thumbnail((self.max_dim, self.max_dim))
+            if self.fmt == "JPEG" and im.mode not in ("RGB", "L"):
+                rgba = im.convert("RGBA")
+                im = Image.new("RGB", rgba.size, (255, 255, 255))
+                im.paste(rgba, mask=rgba.getchannel("A"))
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = out.with_name(out.name + ".tmp")
+            im.save(tmp, self.fmt, quality=self.quality, optimize=True)
+        if tmp.stat().st_size >= src.stat().st_size:
+            tmp.unlink()
+            return False
+        os.replace(tmp, out)
+        return True
+
+    def _save(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        tmp.write_text(json.dumps(self._manifest, indent=2), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+
+class AttachmentStore:
+    """Character reference files kept in memory for upload.
+
+    Each file is read once and handed to ``set_input_files`` as a
+    name/mimeType/buffer payload, re-read only when its size or mtime
+    changes; least recently used files are dropped past ``max_bytes``.
+    A send whose files add up to more than ``SET_INPUT_FILES_LIMIT`` gets
+    plain paths instead, since Playwright will not take that many bytes of
+    buffers (or a mix of buffers and paths) in one call.
+    ``preprocess(path)`` may swap in another file to upload, e.g.
+    :meth:`ReferenceImageCache.prepare`.
+    With ``reuse_uploads`` the store also remembers what each tab has
+    uploaded into its current conversation and leaves those files out of
+    later prompts there, since the chat already has them in context.
+    """
+
+    def __init__(self, reuse_uploads=False, max_bytes=ATTACHMENT_CACHE_BYTES, preprocess=None):
+        self.reuse_uploads = reuse_uploads
+        self.max_bytes = max_bytes
+        self.preprocess = preprocess
+        self.reads = 0
+        self._payloads = collections.OrderedDict()
+        self._bytes = 0
+        self._uploaded = {}
+        self._lock = threading.Lock()
+
+    def payload(self, path):
+        path = str(path)
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._payloads.get(path)
+            if hit and hit[0] == signature:
+                self._payloads.move_to_end(path)
+                return hit[1]
+        source = Path(self._source(path))
+        data = source.read_bytes()
+        payload = {
+            "name": Path(path).stem + source.suffix,
+            "mimeType": mimetypes.guess_type(source.name)[0] or "application/octet-stream",
+            "buffer": data,
+        }
+        with self._lock:
+            self.reads += 1
+            old = self._payloads.pop(path, None)
+            if old:
+                self._bytes -= len(old[1]["buffer"])
+            self._payloads[path] = (signature, payload)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._payloads) > 1:
+                _, (_, dropped) = self._payloads.popitem(last=False)
+                self._bytes -= len(dropped["buffer"])
+        return payload
+
+    def _source(self, path):
+        return str(self.preprocess(path) if self.preprocess else path)
+
+    def _upload_size(self, path):
+        with self._lock:
+            hit = self._payloads.get(path)
+        if hit:
+            return len(hit[1]["buffer"])
+        return os.path.getsize(self._source(path))
+
+    @staticmethod
+    def _conversation(page):
+        url = page.url or ""
+        return urlparse(url).path if in_conversation(url) else None
+
+    def select(self, page, files):
+        """Split ``files`` for one send: ``(uploads, names already in the chat)``.
+
+        ``uploads`` are payloads, or file paths when the payloads would
+        exceed ``SET_INPUT_FILES_LIMIT``.
+        """
+        files = [str(f) for f in files]
+        reused = []
+        if self.reuse_uploads:
+            current = self._conversation(page)
+            seen = self._uploaded.get(id(page))
+            # a fresh chat gets its /c/ URL only after the first send, so
+            # uploads recorded there belong to whatever conversation follows
+            if current and seen and seen[0] in (current, None):
+                self._uploaded[id(page)] = (current, seen[1])
+                reused = [f for f in files if f in seen[1]]
+        upload = [f for f in files if f not in reused]
+        if sum(self._upload_size(f) for f in upload) > SET_INPUT_FILES_LIMIT:
+            return [self._source(f) for f in upload], [Path(f).name for f in reused]
+        return [self.payload(f) for f in upload], [Path(f).name for f in reused]
+
+    def mark_uploaded(self, page, files):
+        if not self.reuse_uploads:
+            return
+        current = self._conversation(page)
+        seen = self._uploaded.get(id(page))
+        names = set(seen[1]) if current and seen and seen[0] == current else set()
+        self._uploaded[id(page)] = (current, names | {str(f) for f in files})
+
+
+# --- Sending and parallel dispatch ---
+SEND_PHASES = ("prepare", "composer", "fill", "attach", "send")
+FILL_SETTLE_SEC = 0.2     # pause after filling the composer
+ATTACH_SETTLE_SEC = 0.5   # pause after handing files to the upload input
+
+
+def _phase_timings(marks):
+    return {name: round(b - a, 4) for name, a, b in zip(SEND_PHASES, marks, marks[1:])}
+
+
+@page_steps
+def send_prompt(page, item, extract, preprompt="", attachments=None, popups=None):
+    """Fill the composer, attach character images and send one prompt.
+
+    ``extract`` maps prompt text to ``(tags, files, clean_text)``, usually
+    :meth:`CharacterIndex.extract`; items from :func:`resolve_prompt` skip
+    it. ``attachments`` is an optional :class:`AttachmentStore` that uploads
+    in-memory buffers instead of paths; ``popups`` overrides the dismiss
+    button labels. A failed upload raises rather than sending the prompt
+    without its references. Returns the details the completion wait
+    and capture steps need, including the pre-send image ``baseline``,
+    per-phase ``timings`` in seconds (see SEND_PHASES) and a ``trace`` dict
+    with the matched composer selector, recoveries and fixed sleeps.
+    Raises :class:`LoginRequired` when the tab has been logged out.
+    """
+    if "message" in item:
+        tags, char_files, message = item["tags"], item["files"], item["message"]
+    else:
+        tags, char_files, clean_prompt = extract(item["prompt"])
+        message = preprompt + clean_prompt
+
+    trace = {"started_at": time.time(), "reloads": 0, "new_chat": 0, "fill_retries": 0, "fixed_wait": 0.0}
+    marks = [time.perf_counter()]
+    yield page.bring_to_front()
+    yield page.wait_for_load_state("domcontentloaded")
+    yield from dismiss_common_popups.steps(page, popups)
+    verdict = yield from detect_login.steps(page, include_text=False)
+    if verdict["login_needed"]:
+        raise LoginRequired(verdict)
+    marks.append(time.perf_counter())
+
+    composer = yield from ensure_composer_ready.steps(page, stats=trace, popups=popups)
+    trace["selector"] = COMPOSER_RESOLVER.preferred
+    marks.append(time.perf_counter())
+    yield composer.click()
+    trace["insert"], trace["fill_retries"] = yield from insert_message.steps(page, composer, message)
+    yield _Sleep(FILL_SETTLE_SEC)
+    trace["fixed_wait"] += FILL_SETTLE_SEC
+    marks.append(time.perf_counter())
+
+    finputs = yield page.query_selector_all(SELECTORS["file_input"])
+    attached_files, reused = [], []
+    if char_files and finputs:
+        try:
+            if attachments:
+                payloads, reused = yield _InThread(attachments.select, (page, char_files))
+                if payloads:
+                    yield finputs[0].set_input_files(payloads)
+                    yield _Sleep(ATTACH_SETTLE_SEC)
+                    trace["fixed_wait"] += ATTACH_SETTLE_SEC
+                attachments.mark_uploaded(page, char_files)
+            else:
+                yield finputs[0].set_input_files(char_files)
+                yield _Sleep(ATTACH_SETTLE_SEC)
+                trace["fixed_wait"] += ATTACH_SETTLE_SEC
+            attached_files = [Path(f).name for f in char_files]
+        except Exception as e:
+            raise RuntimeError(f"Could not attach files for {item['id']}, {e}") from e
+
+    marks.append(time.perf_counter())
+    baseline = yield from image_snapshot.steps(page)
+    if (yield page.query_selector(SELECTORS["send_btn"])):
+        yield page.click(SELECTORS["send_btn"])
+    else:
+        yield page.keyboard.press("Enter")
+
+    return {
+        "tags": tags,
+        "attachments": attached_files,
+        "reused_attachments": reused,
+        "message": message,
+        "baseline": baseline,
+        "sent_at": time.time(),
+        "timings": _phase_timings(marks + [time.perf_counter()]),
+        "trace": trace,
+    }
+
+
+RATE_LIMIT_BACKOFF_SEC = 60       # first hold after a rate limit
+RATE_LIMIT_MAX_BACKOFF_SEC = 900  # longest hold, however often the limit repeats
+RATE_LIMIT_RETRIES = 3            # resends of one prompt after rate limits
+
+
+class RateLimiter:
+    """Spacing between sends that share one account, adapting to rate limits.
+
+    ``min_interval_sec`` is the floor. :meth:`record_limited` (a limit banner
+    or an HTTP 429) holds every send and raises the interval: ``backoff_sec``
+    the first time, doubling on repeats, with +/- ``jitter``, capped at
+    ``max_backoff_sec`` unless the server's Retry-After asks for longer.
+    Each clean :meth:`record_success` shrinks the interval back toward the
+    floor by ``recover``.
+    """
+
+    def __init__(
+        self,
+        min_interval_sec=0.0,
+        backoff_sec=RATE_LIMIT_BACKOFF_SEC,
+        max_backoff_sec=RATE_LIMIT_MAX_BACKOFF_SEC,
+        recover=0.75,
+        jitter=0.2,
+        rng=None,
+    ):
+        self.floor_sec = max(0.0, float(min_interval_sec))
+        self.min_interval_sec = self.floor_sec
+        self.backoff_sec = max(0.0, float(backoff_sec))
+        self.max_backoff_sec = max(self.backoff_sec, float(max_backoff_sec))
+        self.recover = recover
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self.last_send = None
+        self.hold_until = 0.0
+        self.limited = 0
+
+    def wait_time(self) -> float:
+        now = time.time()
+        spacing = 0.0 if self.last_send is None else self.last_send + self.min_interval_sec - now
+        return max(0.0, spacing, self.hold_until - now)
+
+    def record_send(self):
+        self.last_send = time.time()
+
+    def record_success(self):
+        excess = (self.min_interval_sec - self.floor_sec) * self.recover
+        self.min_interval_sec = self.floor_sec + (excess if excess >= 0.5 else 0.0)
+
+    def record_limited(self, retry_after=None):
+        """Back off after a rate limit; returns the hold in seconds."""
+        self.limited += 1
+        grown = max(self.backoff_sec, self.min_interval_sec * 2)
+        hold = min(self.max_backoff_sec, grown * (1 + self.rng.uniform(-self.jitter, self.jitter)))
+        if retry_after:
+            hold = max(hold, float(retry_after))
+        self.min_interval_sec = max(self.floor_sec, hold)
+        self.hold_until = max(self.hold_until, time.time() + hold)
+        return hold
+
+
+class PromptDispatch:
+    """Queue and wait bookkeeping shared by the sync and async tab pools.
+
+    :meth:`take` hands out the next prompt, resends first, and may block
+    while the prompt file is still being read. :meth:`verdict` decides
+    whether a wait has ended and :meth:`settle` records it: a rate limit
+    backs ``limiter`` off and requeues the prompt as "retry", or reports
+    "rate_limited" once ``max_retries`` resends are used up.
+    """
+
+    def __init__(
+        self,
+        prompts,
+        limiter=None,
+        max_wait_sec=DEFAULT_MAX_WAIT_SEC,
+        min_spacing_sec=DEFAULT_MIN_SPACING_SEC,
+        max_retries=RATE_LIMIT_RETRIES,
+    ):
+        self.prompts = iter(prompts)
+        self.limiter = limiter or RateLimiter()
+        self.max_wait_sec = max_wait_sec
+        self.min_spacing_sec = min_spacing_sec
+        self.max_retries = max_retries
+        self.requeued = collections.deque()
+        self.retries = collections.Counter()
+        self.exhausted = False
+
+    @property
+    def drained(self):
+        return self.exhausted and not self.requeued
+
+    def take(self):
+        if self.requeued:
+            return self.requeued.popleft()
+        if not self.exhausted:
+            item = next(self.prompts, None)
+            if item is not None:
+                return item
+            self.exhausted = True
+        return None
+
+    def verdict(self, outcome, elapsed):
+        """"timeout", the watcher's ``outcome`` once it may end the wait, or None."""
+        if outcome and (elapsed >= self.min_spacing_sec or outcome == "rate_limited"):
+            return outcome
+        if elapsed >= self.max_wait_sec:
+            return "timeout"
+        return None
+
+    def settle(self, item, sent, watcher, outcome):
+        """Record the end of a wait; returns the outcome to report."""
+        sent.setdefault("trace", {}).update(watcher.timeline(), released_at=time.time())
+        if outcome == "rate_limited":
+            self.limiter.record_limited(watcher.retry_after)
+            self.retries[item["id"]] += 1
+            if self.retries[item["id"]] <= self.max_retries:
+                self.requeued.append(item)
+                outcome = "retry"
+        elif outcome in ("done", "no_image"):
+            self.limiter.record_success()
+        return outcome
+
+
+def run_prompt_pool(
+    pages,
+    prompts,
+    send,
+    finish,
+    max_wait_sec=DEFAULT_MAX_WAIT_SEC,
+    min_spacing_sec=DEFAULT_MIN_SPACING_SEC,
+    max_in_flight=None,
+    limiter=None,
+    control=None,
+    on_tick=None,
+    poll_sec=1.0,
+    max_retries=RATE_LIMIT_RETRIES,
+):
+    """Dispatch prompts from a shared queue across several chat tabs.
+
+    ``prompts`` may be any iterable, including a generator still reading
+    the prompt file; it is read only when a tab is free to send.
+
+    Each page holds at most one prompt in flight. ``max_in_flight`` caps the
+    total across tabs and ``limiter`` spaces sends on the account. Playwright's
+    sync API is single-threaded, so tabs are driven cooperatively: while one
+    tab waits for its image, the loop sends on the next idle tab.
+
+    ``send(page, item)`` returns the dict from :func:`send_prompt`;
+    ``finish(page, item, sent, outcome)`` runs when the prompt's wait ends,
+    with outcome "done", "no_image", "timeout", "skip" or "failed" (``sent``
+    then holds the error). Rate limits are handled by :class:`PromptDispatch`
+    and finish as "retry" or "rate_limited". ``control`` may return "skip"
+    (ends every wait in flight), "pause" or "stop". Returns "stopped" or "done".
+    """
+    dispatch = PromptDispatch(prompts, limiter, max_wait_sec, min_spacing_sec, max_retries)
+    limiter = dispatch.limiter
+    cap = max(1, min(max_in_flight or len(pages), len(pages)))
+    slots = [{"page": page, "item": None} for page in pages]
+
+    def busy():
+        return [s for s in slots if s["item"] is not None]
+
+    def listen(slot):
+        def on_limit(retry_after):
+            if slot["item"] is not None:
+                slot["watcher"].note_429(retry_after)
+        return on_rate_limit_response(slot["page"], on_limit)
+
+    def release(slot, outcome):
+        item, sent = slot["item"], slot["sent"]
+        slot["item"] = None
+        finish(slot["page"], item, sent, dispatch.settle(item, sent, slot["watcher"], outcome))
+
+    removers = [listen(slot) for slot in slots]
+    try:
+        while not dispatch.drained or busy():
+            action = control() if control else None
+            if action == "stop":
+                return "stopped"
+            if action == "pause":
+                for slot in busy():
+                    slot["paused_for"] += poll_sec
+                time.sleep(poll_sec)
+                continue
+
+            for slot in busy():
+                if action == "skip":
+                    release(slot, "skip")
+                    continue
+                elapsed = time.time() - slot["sent"]["sent_at"] - slot["paused_for"]
+                outcome = dispatch.verdict(slot["watcher"].poll(), elapsed)
+                if outcome:
+                    release(slot, outcome)
+                elif on_tick:
+                    on_tick(slot["item"], max(0, int(max_wait_sec - elapsed)))
+
+            for slot in slots:
+                if dispatch.drained or slot["item"] is not None or len(busy()) >= cap:
+                    continue
+                if limiter.wait_time() > 0:
+                    break
+                item = dispatch.take()
+                if item is None:
+                    break
+                limiter.record_send()
+                try:
+                    sent = send(slot["page"], item)
+                except Exception as e:
+                    finish(slot["page"], item, e, "failed")
+                    continue
+                slot.update(
+                    item=item,
+                    sent=sent,
+                    paused_for=0.0,
+                    watcher=CompletionWatcher(slot["page"], sent["baseline"]),
+                )
+
+            if not dispatch.drained or busy():
+                time.sleep(poll_sec)
+    finally:
+        for remove in removers:
+            remove()
+    return "done"
+
+
+# --- Resumable runs ---
+class JobJournal:
+    """Append-only JSONL log of each prompt id's state, for resuming runs.
+
+    Every change is one line, flushed and fsynced, so a crash loses at most
+    the line being written. On open the file is replayed (last state per id
+    wins, a torn final line is ignored) and compacted once superseded lines
+    clearly outnumber live ones.
+    """
+
+    QUEUED = "queued"
+    SENT = "sent"
+    CAPTURED = "captured"
+    FAILED = "failed"
+
+    def __init__(self, path, compact_ratio=4, compact_min_lines=1000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.states: dict[str, dict] = {}
+        lines = self._replay()
+        if lines >= compact_min_lines and lines > compact_ratio * max(1, len(self.states)):
+            self.compact()
+        self._fh = open(self.path, "a", encoding="utf-8")
+
+    @classmethod
+    def for_prompts(cls, output_dir, prompts_path):
+        return cls(Path(output_dir) / f"{safe_file_stem(Path(prompts_path).stem)}.journal.jsonl")
+
+    def _replay(self) -> int:
+        count = 0
+        if not self.path.exists():
+            return count
+        with open(self.path, "r", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                count += 1
+                try:
+                    entry = json.loads(line)
+                    self.states[str(entry["id"])] = entry
+                except (ValueError, KeyError, TypeError):
+                    continue
+        return count
+
+    def compact(self):
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.states.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def state(self, prompt_id):
+        entry = self.states.get(str(prompt_id))
+        return entry["state"] if entry else None
+
+    def is_done(self, prompt_id) -> bool:
+        return self.state(prompt_id) == self.CAPTURED
+
+    def pending(self, prompts):
+        return [item for item in prompts if not self.is_done(item["id"])]
+
+    def record(self, prompt_id, state, **extra):
+        self.record_many([prompt_id], state, **extra)
+
+    def record_many(self, prompt_ids, state, **extra):
+        ts = datetime.now().isoformat(timespec="seconds")
+        chunk = []
+        for pid in prompt_ids:
+            entry = {"id": str(pid), "state": state, "ts": ts, **extra}
+            self.states[entry["id"]] = entry
+            chunk.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        if chunk:
+            self._fh.write("".join(chunk))
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+
+    def close(self):
+        with contextlib.suppress(Exception):
+            self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- Run trace ---
+TRACE_PHASES = SEND_PHASES + ("generate", "settle", "spacing", "capture", "total")
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def _span(a, b):
+    return round(b - a, 3) if a is not None and b is not None else None
+
+
+class RunTrace:
+    """Structured per-prompt timing events, appended to a JSONL trace.
+
+    One "start" line per run, one "prompt" line per finished prompt with its
+    wall-clock stage times, phase durations, matched composer selector and
+    recovery counts, and a closing "summary" line with p50/p95 per phase,
+    prompts/hour and the time spent in fixed sleeps and waits. Phases after
+    "send" come from the completion watcher: "generate" (sent to first
+    image), "settle" (first image to confirmed done), "spacing" (held back
+    by the minimum spacing) and "capture" (download and save).
+    """
+
+    def __init__(self, path, **meta):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.started = time.time()
+        self.phases = {name: [] for name in TRACE_PHASES}
+        self.waits = {"sleeps": 0.0, "settle": 0.0, "spacing": 0.0}
+        self.results = collections.Counter()
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self._write({"event": "start", "ts": datetime.now().isoformat(timespec="seconds"), **meta})
+
+    @classmethod
+    def for_prompts(cls, output_dir, prompts_path, **meta):
+        return cls(Path(output_dir) / f"{safe_file_stem(Path(prompts_path).stem)}.trace.jsonl", **meta)
+
+    def _write(self, event):
+        self._fh.write(json.dumps({"run": self.run_id, **event}, ensure_ascii=False) + "\n")
+        self._fh.flush()
+
+    def record(self, item, sent, result, saved=()):
+        now = time.time()
+        captured = bool(saved) and result != "failed"
+        self.results["captured" if captured else "retried" if result == "retry" else "failed"] += 1
+        event = {"event": "prompt", "id": item["id"], "result": result, "images": len(saved)}
+        if not isinstance(sent, dict):
+            event["error"] = str(sent)
+            self._write(event)
+            return event
+
+        t = sent.get("trace", {})
+        stamps = {
+            "started": t.get("started_at"),
+            "sent": sent.get("sent_at"),
+            "generating": t.get("generating_at"),
+            "first_image": t.get("first_image_at"),
+            "ready": t.get("outcome_at"),
+            "released": t.get("released_at"),
+            "saved": now,
+        }
+        phases = dict(sent.get("timings", {}))
+        phases["generate"] = _span(stamps["sent"], stamps["first_image"])
+        phases["settle"] = _span(stamps["first_image"], stamps["ready"])
+        phases["spacing"] = _span(stamps["ready"], stamps["released"])
+        phases["capture"] = _span(stamps["released"], stamps["saved"])
+        phases["total"] = _span(stamps["started"], stamps["saved"])
+        if result != "retry":  # the resend is recorded again when it finishes
+            for name, value in phases.items():
+                if value is not None and name in self.phases:
+                    self.phases[name].append(value)
+        self.waits["sleeps"] += t.get("fixed_wait", 0.0)
+        self.waits["settle"] += phases["settle"] or 0.0
+        self.waits["spacing"] += phases["spacing"] or 0.0
+
+        event.update(
+            tab=t.get("tab"),
+            selector=t.get("selector"),
+            insert=t.get("insert"),
+            reloads=t.get("reloads", 0),
+            new_chat=t.get("new_chat", 0),
+            fill_retries=t.get("fill_retries", 0),
+            attachments=len(sent.get("attachments", ())),
+            reused=len(sent.get("reused_attachments", ())),
+            fixed_wait=round(t.get("fixed_wait", 0.0), 3),
+            ts={k: round(v, 3) for k, v in stamps.items() if v is not None},
+            phases=phases,
+        )
+        self._write(event)
+        return event
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        fixed = sum(self.waits.values())
+        busy = sum(self.phases["total"])
+        return {
+            "event": "summary",
+            "prompts": self.results["captured"] + self.results["failed"],
+            "captured": self.results["captured"],
+            "failed": self.results["failed"],
+            "retried": self.results["retried"],
+            "elapsed_sec": round(elapsed, 1),
+            "prompts_per_hour": round(self.results["captured"] / elapsed * 3600, 1) if elapsed > 0 else None,
+            "phases": {
+                name: {"p50": _percentile(values, 50), "p95": _percentile(values, 95), "n": len(values)}
+                for name, values in self.phases.items()
+                if values
+            },
+            "fixed_waits_sec": {**{k: round(v, 1) for k, v in self.waits.items()}, "total": round(fixed, 1)},
+            "fixed_wait_share": round(fixed / busy, 3) if busy else None,
+        }
+
+    def close(self):
+        """Write the summary line, close the file and return the summary."""
+        summary = self.summary()
+        with contextlib.suppress(Exception):
+            self._write(summary)
+            self._fh.close()
+        return summary
+
+
+def format_trace_summary(summary):
+    """Short human-readable lines for a :meth:`RunTrace.summary` dict."""
+    retried = f", {summary['retried']} resent after rate limits" if summary.get("retried") else ""
+    lines = [
+        f"Run summary: {summary['captured']} captured, {summary['failed']} failed{retried} in "
+        f"{summary['elapsed_sec'] / 60:.1f} min ({summary['prompts_per_hour']} prompts/hour)."
+    ]
+    phases = summary["phases"]
+    if phases:
+        lines.append("Phase p50/p95 (s): " + ", ".join(
+            f"{name} {stats['p50']:.2f}/{stats['p95']:.2f}" for name, stats in phases.items()
+        ))
+    waits = summary["fixed_waits_sec"]
+    if waits["total"]:
+        share = summary["fixed_wait_share"]
+        lines.append(
+            f"Fixed waits: {waits['total']}s total (sleeps {waits['sleeps']}s, settle {waits['settle']}s, "
+            f"min spacing {waits['spacing']}s){f', {share:.0%} of prompt time' if share is not None else ''}."
+        )
+    return lines
+
+
+# --- Resolved prompt cache ---
+def resolve_prompt(item, index, preprompt=""):
+    """Return ``item`` with its tags, attachment paths and final message."""
+    tags, files, clean = index.extract(item["prompt"])
+    return {**item, "tags": tags, "files": files, "message": preprompt + clean}
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with contextlib.suppress(OSError, TypeError):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+class PromptCache:
+    """Resolved prompts on disk, so re-runs skip character extraction.
+
+    The key hashes the prompt file, the loaded character map, the
+    name_variants file and the preprompt. A valid cache is streamed back
+    as is. Otherwise a background thread resolves the whole file up front
+    into a partial file while :meth:`items` tails it, so sends start as
+    soon as the first prompt is resolved and memory stays flat; the
+    partial file replaces the cache once complete. Each compile pass has
+    its own partial file, so a pass left running by a stopped run never
+    shares one with the next.
+    """
+
+    FORMAT = 1
+    _passes = itertools.count(1)
+
+    def __init__(self, path, key):
+        self.path = Path(path)
+        self.partial = self.path.with_name(f"{self.path.name}.{os.getpid()}-{next(self._passes)}.partial")
+        self.key = key
+        self.count = 0
+        self.consumed = 0
+        self._reader = None
+        self._cond = threading.Condition()
+        self._started = False
+        self._done = False
+        self._error = None
+
+    @classmethod
+    def for_prompts(cls, output_dir, prompts_path, index, name_variants_json, preprompt=""):
+        h = hashlib.sha256()
+        for part in (
+            str(cls.FORMAT),
+            _file_digest(prompts_path),
+            json.dumps(index.char_map, sort_keys=True),
+            _file_digest(name_variants_json),
+            preprompt,
+        ):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return cls(Path(output_dir) / f"{safe_file_stem(Path(prompts_path).stem)}.resolved.jsonl", h.hexdigest())
+
+    def is_valid(self) -> bool:
+        try:
+            with open(self.path, "rb") as f:
+                header = json.loads(f.readline() or b"null")
+                f.seek(0, os.SEEK_END)
+                f.seek(max(0, f.tell() - 4096))
+                tail = f.read().splitlines()
+            footer = json.loads(tail[-1]) if tail else None
+        except (OSError, ValueError):
+            return False
+        return (
+            isinstance(header, dict) and header.get("key") == self.key
+            and isinstance(footer, dict) and footer.get("done") is True
+        )
+
+    def items(self, prompts, resolve):
+        """Yield resolved prompts, from the cache or by resolving ``prompts``."""
+        if self.is_valid():
+            return self._read()
+        self._start(prompts, resolve)
+        return self._tail()
+
+    def wait(self):
+        """Block until the compile pass has finished; return the prompt count."""
+        if not self._started:
+            self.count = 0
+            for _ in self._read():
+                pass
+            return self.count
+        with self._cond:
+            while not self._done:
+                self._cond.wait()
+        if self._error:
+            raise self._error
+        # the compile thread renames after waking us; don't return before that
+        self._finish()
+        return self.count
+
+    def has_ready(self) -> bool:
+        """True when the next prompt from :meth:`items` is available without waiting."""
+        if not self._started:
+            return True
+        with self._cond:
+            return self.consumed < self.count or self._done
+
+    def close(self):
+        """Release the tail's file when it was never read, e.g. after :meth:`wait`."""
+        if self._reader:
+            self._reader.close()
+        self._finish()
+
+    def _read(self):
+        with open(self.path, encoding="utf-8") as f:
+            f.readline()
+            for line in f:
+                entry = json.loads(line)
+                if "done" in entry:
+                    return
+                self.count += 1
+                yield entry
+
+    def _start(self, prompts, resolve):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        out = open(self.partial, "w", encoding="utf-8")
+        out.write(json.dumps({"key": self.key, "format": self.FORMAT}) + "\n")
+        out.flush()
+        # open the reading side now: a short file can be compiled and renamed
+        # before the caller first pulls from the tail
+        self._reader = open(self.partial, encoding="utf-8")
+        self._started = True
+
+        def compile_all():
+            try:
+                with out:
+                    for item in prompts:
+                        out.write(json.dumps(resolve(item), ensure_ascii=False) + "\n")
+                        out.flush()
+                        with self._cond:
+                            self.count += 1
+                            self._cond.notify_all()
+                    out.write(json.dumps({"done": True, "count": self.count}) + "\n")
+            except Exception as e:
+                self._error = e
+                with contextlib.suppress(OSError):
+                    os.remove(self.partial)
+            finally:
+                with self._cond:
+                    self._done = True
+                    self._cond.notify_all()
+            self._finish()
+
+        threading.Thread(target=compile_all, name="prompt-compile", daemon=True).start()
+
+    def _tail(self):
+        try:
+            with self._reader as f:
+                f.readline()
+                while True:
+                    with self._cond:
+                        while self.consumed >= self.count and not self._done:
+                            self._cond.wait()
+                        available = self.count
+                    if self.consumed >= available:
+                        break
+                    while self.consumed < available:
+                        entry = json.loads(f.readline())
+                        self.consumed += 1
+                        yield entry
+            if self._error:
+                raise self._error
+        finally:
+            self._finish()
+
+    def _finish(self):
+        # Both the compile thread and the reader try this: Windows will not
+        # replace a file that the other side still has open.
+        if self._done and self._error is None:
+            with contextlib.suppress(OSError):
+                os.replace(self.partial, self.path)
+
+
+# --- Browser sessions ---
+CONTEXT_OPTIONS = {"viewport": {"width": 1340, "height": 900}, "accept_downloads": True}
+
+
+def default_state_path(profile_dir) -> Path:
+    """Where a captured session for ``profile_dir`` is kept, next to the profile."""
+    profile = Path(profile_dir).expanduser()
+    return profile.parent / f"{profile.name}_session.json"
+
+
+@page_steps
+def open_browser_context(p, settings):
+    """Start the browser context a batch runs in.
+
+    With ``settings.storage_state`` a plain browser is launched and a fresh
+    context loads the captured cookies and local storage, so headless
+    workers on bundled Chromium need no profile or display. Otherwise the
+    persistent Chrome profile is opened as before.
+    """
+    launch = {"headless": settings.headless, "channel": settings.browser_channel or None}
+    if settings.storage_state:
+        browser = yield p.chromium.launch(**launch)
+        return (yield browser.new_context(storage_state=str(settings.storage_state), **CONTEXT_OPTIONS))
+    return (yield p.chromium.launch_persistent_context(user_data_dir=str(settings.profile_dir), **launch, **CONTEXT_OPTIONS))
+
+
+@page_steps
+def save_storage_state(ctx, path):
+    # the file holds live session cookies, keep it private where we can
+    yield ctx.storage_state(path=str(path))
+    with contextlib.suppress(OSError):
+        os.chmod(path, 0o600)
+
+
+def capture_session(profile_dir, state_path, urls, channel="chrome", confirm_login=None, log=print):
+    """Export the logged-in session of ``profile_dir`` for headless workers.
+
+    Opens the profile in a visible browser and, if the chat asks for a
+    login, waits on ``confirm_login()`` (blocking; False cancels). Then
+    writes Playwright storage state to ``state_path``. Returns the path, or
+    None when canceled or still logged out. Chrome must not have the
+    profile open at the same time.
+    """
+    state_path = Path(state_path)
+    with sync_playwright() as p:
+        ctx = p.chromium.launch_persistent_context(
+            user_data_dir=str(profile_dir), headless=False, channel=channel or None, **CONTEXT_OPTIONS
+        )
+        try:
+            page = ctx.pages[0] if ctx.pages else ctx.new_page()
+            composer, login_needed = goto_with_fallback(page, urls, log)
+            if login_needed or composer is None:
+                log("Log in to ChatGPT in the opened window, open a chat, then confirm.")
+                if confirm_login and not confirm_login():
+                    log("Session capture canceled.")
+                    return None
+                if looks_like_login(page):
+                    log("Still on a login page, session not saved.")
+                    return None
+            state_path.parent.mkdir(parents=True, exist_ok=True)
+            save_storage_state(ctx, state_path)
+            log(f"Saved session to {state_path}")
+            return state_path
+        finally:
+            with contextlib.suppress(Exception):
+                ctx.close()
+
+
+class BrowserSession:
+    """Keep one browser open across batch runs.
+
+    Playwright's sync API stays bound to the thread that started it, so the
+    session owns a single worker thread and :meth:`run` executes each batch
+    there. The context is reopened when the launch settings change or the
+    kept chat tab no longer answers. Extra tabs are closed after each run.
+    :meth:`close` shuts the browser down; a later run starts a new one.
+    """
+
+    def __init__(self, log=print):
+        self.log = log
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser-session")
+        self._pw = None
+        self._ctx = None
+        self._page = None
+        self._key = None
+
+    @property
+    def is_open(self):
+        return self._ctx is not None
+
+    def run(self, settings, fn):
+        """Call ``fn(ctx, page)`` on the session thread and return its result."""
+        return self._executor.submit(self._run, settings, fn).result()
+
+    def close(self, timeout=30):
+        with contextlib.suppress(Exception):
+            self._executor.submit(self._shutdown).result(timeout=timeout)
+
+    @staticmethod
+    def _key_for(settings):
+        return (str(settings.profile_dir), settings.headless, settings.browser_channel, str(settings.storage_state))
+
+    def _run(self, settings, fn):
+        ctx, page = self._acquire(settings)
+        try:
+            return fn(ctx, page)
+        finally:
+            with contextlib.suppress(Exception):
+                for pg in list(ctx.pages):
+                    if pg is not page:
+                        pg.close()
+
+    def _healthy(self):
+        try:
+            self._page.evaluate("1")
+            return not self._page.is_closed()
+        except Exception:
+            return False
+
+    def _acquire(self, settings):
+        key = self._key_for(settings)
+        if self._ctx is not None and (key != self._key or not self._healthy()):
+            self.log("Restarting the browser." if key == self._key else "Browser settings changed, restarting it.")
+            self._close_context()
+        if self._ctx is None:
+            if self._pw is None:
+                self._pw = sync_playwright().start()
+            self._ctx = open_browser_context(self._pw, settings)
+            self._page = self._ctx.pages[0] if self._ctx.pages else self._ctx.new_page()
+            self._key = key
+        else:
+            self.log("Reusing the open browser.")
+        return self._ctx, self._page
+
+    def _close_context(self):
+        if self._ctx is not None:
+            browser = getattr(self._ctx, "browser", None)
+            with contextlib.suppress(Exception):
+                self._ctx.close()
+            if browser is not None:  # contexts from a captured session own a browser
+                with contextlib.suppress(Exception):
+                    browser.close()
+        self._ctx = self._page = self._key = None
+
+    def _shutdown(self):
+        self._close_context()
+        if self._pw is not None:
+            with contextlib.suppress(Exception):
+                self._pw.stop()
+            self._pw = None
+
+
+# --- Batch runner ---
+@dataclass
+class BatchSettings:
+    prompts_path: str
+    characters_json: str
+    name_variants_json: str
+    output_dir: str
+    profile_dir: str
+    preprompt: str = ""
+    urls: list = field(default_factory=list)
+    max_wait_sec: int = DEFAULT_MAX_WAIT_SEC
+    min_spacing_sec: int = DEFAULT_MIN_SPACING_SEC
+    tabs: int = 1
+    max_in_flight: int = 0  # prompts awaiting an image at once; 0 means one per tab
+    account_interval_sec: int = 0
+    backoff_sec: int = RATE_LIMIT_BACKOFF_SEC
+    max_backoff_sec: int = RATE_LIMIT_MAX_BACKOFF_SEC
+    rate_limit_retries: int = RATE_LIMIT_RETRIES
+    async_engine: bool = False
+    headless: bool = False
+    reuse_uploads: bool = False
+    downscale_refs: bool = False
+    ref_max_dim: int = 1536
+    ref_quality: int = 85
+    ref_format: str = "JPEG"  # or "WEBP"
+    popup_buttons: list | None = None  # None keeps SELECTORS["popup_buttons"]
+    storage_state: str = ""  # captured session; starts a fresh context instead of the profile
+    browser_channel: str = "chrome"  # "" uses Playwright's bundled Chromium
+
+
+QUEUE_BATCH = 50
+
+
+class BatchRunner:
+    """Run one batch end to end for the CLI or the GUI.
+
+    Loads prompts and characters, resumes from the journal, opens the chat
+    tabs, dispatches prompts, captures images and records progress. The
+    entry points differ only in the hooks they pass:
+
+    - ``log(msg)``: activity lines
+    - ``status(msg)``: one-line status, e.g. the GUI status bar
+    - ``progress(item, state, info)``: per-prompt "sent", "captured" or "failed"
+    - ``control()``: None, "skip", "pause" or "stop", polled while running
+    - ``on_tick(item, remaining_sec)``: countdown while an image is pending
+    - ``confirm_login()``: blocking, called when login is needed; False cancels
+
+    ``session`` is an optional :class:`BrowserSession` that keeps the browser
+    open between runs of the sync engine.
+
+    :meth:`run` returns "done", "stopped", "canceled", "no_prompts",
+    "all_captured", "no_composer" or "no_session".
+    """
+
+    def __init__(
+        self, settings, log=print, status=None, progress=None, control=None, on_tick=None, confirm_login=None, session=None
+    ):
+        self.settings = settings
+        self.session = session
+        self.log = log
+        self.status = status or (lambda msg: None)
+        self.progress = progress or (lambda item, state, info: None)
+        self.control = control
+        self.login_canceled = False
+        self.on_tick = on_tick
+        self.confirm_login = confirm_login
+        self.index = None
+        self.cache = None
+        self._tab_of = {}
+        preprocess = None
+        if settings.downscale_refs:
+            preprocess = ReferenceImageCache(
+                Path(settings.output_dir) / "_reference_cache",
+                max_dim=settings.ref_max_dim,
+                quality=settings.ref_quality,
+                fmt=settings.ref_format,
+                log=log,
+            ).prepare
+        self.attachments = AttachmentStore(settings.reuse_uploads, preprocess=preprocess)
+        self.limiter = RateLimiter(
+            settings.account_interval_sec,
+            backoff_sec=settings.backoff_sec,
+            max_backoff_sec=settings.max_backoff_sec,
+        )
+        self.journal = None
+        self.trace = None
+        self.total = 0
+        self.sent = 0
+        self.finished = 0
+
+    def prepare(self):
+        """Open the prompt stream, characters and the journal.
+
+        Returns a generator over resolved prompts still to run (see
+        :class:`PromptCache`), or None when the file holds no prompts.
+        ``total`` stays None until the file has been read to the end.
+        """
+        s = self.settings
+        prompts = iter_prompts(s.prompts_path)
+        first = next(prompts, None)
+        if first is None:
+            return None
+        self.index = load_character_index(s.characters_json, s.name_variants_json, self.log)
+        Path(s.output_dir).mkdir(parents=True, exist_ok=True)
+        Path(s.profile_dir).mkdir(parents=True, exist_ok=True)
+
+        self.cache = PromptCache.for_prompts(s.output_dir, s.prompts_path, self.index, s.name_variants_json, s.preprompt)
+        if self.cache.is_valid():
+            self.log(f"Using resolved prompts from {self.cache.path.name}.")
+        resolved = self.cache.items(
+            itertools.chain([first], prompts),
+            lambda item: resolve_prompt(item, self.index, s.preprompt),
+        )
+        self.journal = JobJournal.for_prompts(s.output_dir, s.prompts_path)
+        self.total = None
+        return self._pending(resolved)
+
+    def compile(self):
+        """Resolve every prompt into the cache without sending; returns the count."""
+        prompts = self.prepare()
+        if prompts is None:
+            return 0
+        try:
+            prompts.close()
+            count = self.cache.wait()
+            self.cache.close()
+            return count
+        finally:
+            self.journal.close()
+
+    def _pending(self, prompts, batch=QUEUE_BATCH):
+        # queue in small batches so the journal is not fsynced once per
+        # prompt, but hand over what is resolved before waiting for more
+        count = skipped = 0
+        buffered = []
+        ready = self.cache.has_ready if self.cache else (lambda: True)
+        for item in prompts:
+            if self.journal.is_done(item["id"]):
+                skipped += 1
+                continue
+            buffered.append(item)
+            if len(buffered) >= batch or not ready():
+                self.journal.record_many([b["id"] for b in buffered], JobJournal.QUEUED)
+                count += len(buffered)
+                yield from buffered
+                buffered = []
+        if buffered:
+            self.journal.record_many([b["id"] for b in buffered], JobJournal.QUEUED)
+            count += len(buffered)
+            yield from buffered
+        self.total = count
+        if skipped and count:
+            self.log(f"Resumed from {self.journal.path}: {skipped} already captured, {count} run this time.")
+
+    def progress_label(self, n):
+        return f"{n}/{self.total}" if self.total is not None else str(n)
+
+    def run(self):
+        state = self.settings.storage_state
+        if state and not Path(state).exists():
+            self.log(f"No captured session at {state}. Capture the session first.")
+            return "no_session"
+        prompts = self.prepare()
+        if prompts is None:
+            self.log("No prompts found, check file")
+            return "no_prompts"
+        try:
+            first = next(prompts, None)
+            if first is None:
+                self.log("All prompts already captured. Delete the journal file to run them again.")
+                return "all_captured"
+            self.status(f"Reading prompts from {Path(self.settings.prompts_path).name}...")
+            prompts = itertools.chain([first], prompts)
+            s = self.settings
+            self.trace = RunTrace.for_prompts(
+                s.output_dir, s.prompts_path,
+                engine="async" if s.async_engine else "sync", tabs=s.tabs,
+                min_spacing_sec=s.min_spacing_sec, max_wait_sec=s.max_wait_sec,
+            )
+            if s.async_engine:
+                from chatgpt_batch_async import run_batch
+                if self.session:
+                    self.session.close()  # the async engine opens the profile itself
+                return run_batch(self, prompts)
+            return self._run_sync(prompts)
+        finally:
+            self.journal.close()
+            if self.trace:
+                summary = self.trace.close()
+                if summary["prompts"]:
+                    for line in format_trace_summary(summary):
+                        self.log(line)
+                    self.log(f"Timing trace: {self.trace.path}")
+
+    def _run_sync(self, prompts):
+        s = self.settings
+        if self.session:
+            self.status("Checking the open browser...")
+            return self.session.run(s, lambda ctx, page: self._run_in_context(ctx, page, prompts))
+        self.status("Launching browser session...")
+        with sync_playwright() as p:
+            ctx = open_browser_context(p, s)
+            return self._run_in_context(ctx, ctx.new_page(), prompts)
+
+    def _run_in_context(self, ctx, page, prompts):
+        pages = run_steps(self.open_tabs(ctx, page))
+        if isinstance(pages, str):
+            return pages
+        outcome = run_prompt_pool(
+            pages,
+            prompts,
+            lambda pg, item: run_steps(self.send_one(pg, item)),
+            lambda pg, item, sent, result: run_steps(self.finish_one(pg, item, sent, result)),
+            **self.pool_options(),
+        )
+        run_steps(self.end_run(ctx))
+        return "canceled" if self.login_canceled else outcome
+
+    # Steps shared by both engines (see run_steps); the sync engine runs
+    # them directly, chatgpt_batch_async awaits them.
+    def open_tabs(self, ctx, page):
+        """Open the chat, wait out a login, then open the extra tabs.
+
+        Returns the pages to dispatch on, or "canceled" / "no_composer".
+        """
+        s = self.settings
+        popups = s.popup_buttons
+        self.status("Checking chat composer...")
+        composer, login_needed = yield from goto_with_fallback.steps(page, s.urls, self.log, popups)
+        if login_needed or composer is None:
+            if not (yield _InThread(self.wait_for_login)):
+                return "canceled"
+            try:
+                yield page.wait_for_load_state("domcontentloaded", timeout=15000)
+            except Exception:
+                pass
+            yield from dismiss_common_popups.steps(page, popups)
+        else:
+            self.log("Chat composer detected immediately; starting batch run.")
+
+        try:
+            yield from ensure_composer_ready.steps(page, popups=popups)
+        except Exception:
+            snap = self.debug_snapshot_path()
+            try:
+                yield page.screenshot(path=str(snap), full_page=True)
+            except Exception:
+                pass
+            self.log(f"Composer not found, saved snapshot to {snap}")
+            return "no_composer"
+        self.status("Chat composer ready. Starting prompts...")
+
+        extra = []
+        for _ in range(max(1, s.tabs) - 1):
+            extra.append((yield ctx.new_page()))
+        yield _Gather([functools.partial(goto_with_fallback.steps, pg, s.urls, self.log, popups) for pg in extra])
+        pages = [page] + extra
+        if len(pages) > 1:
+            self.log(f"Running {len(pages)} chat tabs in parallel.")
+            self._tab_of = {id(pg): n for n, pg in enumerate(pages, start=1)}
+        else:
+            self._tab_of = {}
+        self.log(f"Waiting up to {s.max_wait_sec // 60} minutes per image.")
+        return pages
+
+    def send_one(self, page, item):
+        s = self.settings
+        self.before_send(item)
+        options = dict(preprompt=s.preprompt, attachments=self.attachments, popups=s.popup_buttons)
+        try:
+            sent = yield from send_prompt.steps(page, item, self.index.extract, **options)
+        except LoginRequired as e:
+            if not (yield _InThread(self.recover_login, (item, e))):
+                raise
+            sent = yield from send_prompt.steps(page, item, self.index.extract, **options)
+        yield _InThread(self.after_send, (item, sent, self._tab_of.get(id(page))))
+        return sent
+
+    def finish_one(self, page, item, sent, result):
+        saved = []
+        if result not in ("failed", "retry", "rate_limited"):
+            saved = yield from capture_new_images.steps(
+                page, sent["baseline"], item, self.settings.output_dir,
+                tags=sent["tags"], attachments=sent["attachments"], message=sent["message"], log=self.log,
+            )
+        yield _InThread(self.after_finish, (item, sent, result, saved))
+
+    def end_run(self, ctx):
+        state = self.settings.storage_state
+        if state and not self.login_canceled:
+            # keep the refreshed cookies for the next run
+            try:
+                yield from save_storage_state.steps(ctx, state)
+            except Exception:
+                pass
+
+    def pool_options(self):
+        s = self.settings
+        return dict(
+            max_wait_sec=s.max_wait_sec,
+            min_spacing_sec=s.min_spacing_sec,
+            max_in_flight=s.max_in_flight or None,
+            limiter=self.limiter,
+            control=self.poll_control,
+            on_tick=self.on_tick,
+            max_retries=s.rate_limit_retries,
+        )
+
+    # shared by both engines
+    def wait_for_login(self):
+        if self.settings.headless:
+            self.log("The chat needs a login, which a headless run cannot show. Capture the session again, then rerun.")
+            return False
+        self.status("Awaiting manual login...")
+        self.log("If you see a login or human check, finish it in Chrome, open a chat, then confirm to continue.")
+        if self.confirm_login and not self.confirm_login():
+            self.log("Canceled by user.")
+            return False
+        self.status("Resuming automated run...")
+        return True
+
+    def recover_login(self, item, err):
+        """Pause for a manual login after a tab was logged out mid-run.
+
+        Returns True to resend ``item``; False stops the batch.
+        """
+        self.log(f"[{item['id']}] Chat tab needs a login ({err}), pausing the batch.")
+        if self.wait_for_login():
+            return True
+        self.login_canceled = True
+        return False
+
+    def poll_control(self):
+        if self.login_canceled:
+            return "stop"
+        return self.control() if self.control else None
+
+    def debug_snapshot_path(self):
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return Path(self.settings.output_dir) / f"debug_no_composer_{ts}.png"
+
+    def before_send(self, item):
+        self.sent += 1
+        self.status(f"Sending prompt {self.progress_label(self.sent)}...")
+
+    def after_send(self, item, sent, tab=None):
+        self.journal.record(item["id"], JobJournal.SENT)
+        if tab:
+            sent.setdefault("trace", {})["tab"] = tab
+        where = f" (tab {tab})" if tab else ""
+        reused = sent.get("reused_attachments")
+        if reused:
+            uploaded = [n for n in sent["attachments"] if n not in reused]
+            self.log(f"[{item['id']}]{where} Prompt sent, attached: {', '.join(uploaded) or 'none new'} (already in chat: {', '.join(reused)})")
+        elif sent["attachments"]:
+            self.log(f"[{item['id']}]{where} Prompt sent, attached: {', '.join(sent['attachments'])}")
+        else:
+            self.log(f"[{item['id']}]{where} Prompt sent, no attachments")
+        self.progress(item, "sent", sent)
+
+    def after_finish(self, item, sent, result, saved):
+        if self.trace:
+            self.trace.record(item, sent, result, saved)
+        if result == "retry":
+            hold = self.limiter.wait_time()
+            self.journal.record(item["id"], JobJournal.FAILED, reason="rate_limited")
+            self.log(f"[{item['id']}] Rate limit detected, holding sends for {hold:.0f}s, then retrying")
+            self.status(f"Rate limited. Retrying in {hold:.0f}s...")
+            self.progress(item, "retry", {"wait_sec": hold})
+            return
+        self.finished += 1
+        if result == "failed":
+            self.journal.record(item["id"], JobJournal.FAILED, reason=str(sent))
+            self.log(f"[{item['id']}] Prompt failed, {sent}")
+            self.progress(item, "failed", {"reason": str(sent)})
+            return
+        names = [p.name for p in saved]
+        if saved:
+            self.journal.record(item["id"], JobJournal.CAPTURED, images=names)
+            self.log(f"[{item['id']}] Saved {', '.join(names)}")
+            self.progress(item, "captured", {"result": result, "images": names})
+        else:
+            self.journal.record(item["id"], JobJournal.FAILED, reason=result)
+            self.log(f"[{item['id']}] No generated image found to save")
+            self.progress(item, "failed", {"reason": result})
+
+        done = f"{self.progress_label(self.finished)} done"
+        if result == "skip":
+            self.log(f"[{item['id']}] >> Skip pressed, continuing")
+            self.status(f"Skip pressed. Continuing... ({done})")
+        elif result == "done":
+            self.log(f"[{item['id']}] >> Image ready, continuing")
+            self.status(f"Image ready. Continuing... ({done})")
+        elif result == "no_image":
+            self.log(f"[{item['id']}] >> Reply finished without an image, continuing")
+            self.status(f"Reply finished without an image. Continuing... ({done})")
+        elif result == "rate_limited":
+            self.log(f"[{item['id']}] >> Still rate limited after retries, moving on")
+            self.status(f"Rate limited. Continuing... ({done})")
+        else:
+            self.log(f"[{item['id']}] >> Wait finished, continuing")
+            self.status(f"Wait finished. Continuing... ({done})")
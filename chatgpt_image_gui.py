@@ -1,18 +1,104 @@
 # Windows 11, Python 3.10+
-# pip install playwright pandas
+# pip install playwright
 # playwright install
 
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 from tkinter import font as tkfont
 from tkinter import ttk
-import threading, time, json, re, sys, contextlib, os, shutil, subprocess
+import threading, json, sys, os, shutil, subprocess, queue, logging
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from datetime import datetime
-from urllib.parse import urlparse
 
-import pandas as pd
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+from chatgpt_batch_core import BatchRunner, BatchSettings, BrowserSession, capture_session, default_state_path, scan_character_images
+
+# ----------------------------- LOG SINK -----------------------------
+LOG_WIDGET_LINES = 2000     # lines kept in the activity log widget
+LOG_DRAIN_MS = 100          # how often the Tk loop pulls queued lines
+LOG_DRAIN_BATCH = 500       # lines per pull, more are picked up right after
+LOG_FILE_NAME = "activity.log"
+LOG_FILE_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+
+class LogSink:
+    """Thread-safe log queue that the Tk loop drains in batches.
+
+    Any thread may call :meth:`write`. :meth:`drain` runs on the Tk thread
+    and only returns up to ``batch`` pending lines for the widget. A writer
+    thread appends the same lines to a rotating ``activity.log`` in the
+    directory last given to :meth:`set_log_dir`, so the full log survives
+    while the widget only keeps the latest lines.
+    """
+
+    def __init__(self, max_bytes=LOG_FILE_BYTES, backups=LOG_FILE_BACKUPS):
+        self.queue = queue.SimpleQueue()
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file_queue = queue.SimpleQueue()
+        self._handler = None
+        self._path = None
+        self._writer = threading.Thread(target=self._write_files, name="activity-log", daemon=True)
+        self._writer.start()
+
+    def write(self, msg):
+        msg = str(msg)
+        self.queue.put(msg)
+        self._file_queue.put(("line", msg))
+
+    def set_log_dir(self, log_dir):
+        """Append lines written from now on to ``log_dir``; None stops the file."""
+        self._file_queue.put(("dir", Path(log_dir) if log_dir else None))
+
+    def drain(self, batch=LOG_DRAIN_BATCH):
+        lines = []
+        while len(lines) < batch:
+            try:
+                lines.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return lines
+
+    def close(self):
+        """Write out the queued lines and close the file."""
+        if self._writer.is_alive():
+            self._file_queue.put(("close", None))
+            self._writer.join()
+
+    def _write_files(self):
+        log_dir = None
+        while True:
+            kind, value = self._file_queue.get()
+            if kind == "close":
+                self._close_handler()
+                return
+            if kind == "dir":
+                log_dir = value
+            elif log_dir:
+                self._to_file(log_dir, value)
+
+    def _to_file(self, log_dir, line):
+        path = log_dir / LOG_FILE_NAME
+        if path != self._path:
+            self._close_handler()
+            self._path = path
+            try:
+                log_dir.mkdir(parents=True, exist_ok=True)
+                self._handler = RotatingFileHandler(
+                    path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8", delay=True
+                )
+                self._handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            except OSError:
+                self._handler = None
+        if self._handler:
+            self._handler.emit(logging.LogRecord("promptbot", logging.INFO, "", 0, line, None, None))
+
+    def _close_handler(self):
+        if self._handler:
+            self._handler.close()
+            self._handler = None
+        self._path = None
+
 
 # ----------------------------- GUI APP -----------------------------
 
@@ -30,6 +116,9 @@ class ImageGenApp:
 
         # state
         self.running_thread = None
+        self.scan_thread = None
+        self.log_sink = LogSink()
+        self.browser_session = BrowserSession(log=self.log)
         self.skip_event = threading.Event()
         self.stop_event = threading.Event()
         self.pause_event = threading.Event()
@@ -53,10 +142,22 @@ class ImageGenApp:
         self.variants_json = tk.StringVar()
         self.preprompt = tk.StringVar(value="can you create me this image in widescreen from the story, Cinematic gritty sci fi realism, warm industrial lighting, weathered working class starship interiors, painterly photorealism with strong character focus: ")
         self.delay_sec = tk.IntVar(value=180)
+        self.min_spacing_sec = tk.IntVar(value=20)
+        self.parallel_tabs = tk.IntVar(value=1)
+        self.max_in_flight = tk.IntVar(value=0)
+        self.account_interval_sec = tk.IntVar(value=0)
+        self.use_async_engine = tk.BooleanVar(value=False)
+        self.reuse_uploads = tk.BooleanVar(value=False)
+        self.downscale_refs = tk.BooleanVar(value=False)
+        self.ref_max_dim = tk.IntVar(value=1536)
+        self.ref_quality = tk.IntVar(value=85)
+        self.headless_workers = tk.BooleanVar(value=False)
+        self.keep_browser = tk.BooleanVar(value=True)
 
         # try load saved config
         self._load_config()
         self._setup_config_autosave()
+        self._use_log_dir()
 
         # styling & layout
         self._init_styles()
@@ -124,7 +225,7 @@ class ImageGenApp:
 
         ttk.Label(
             form_card,
-            text="Delay between prompts (seconds)",
+            text="Max wait per image (seconds)",
             style="PromptBotFieldLabel.TLabel",
         ).grid(row=row, column=0, sticky="w")
         ttk.Spinbox(
@@ -138,6 +239,142 @@ class ImageGenApp:
         ).grid(row=row, column=1, sticky="w", pady=(0, 6), padx=(0, 12))
         row += 1
 
+        ttk.Label(
+            form_card,
+            text="Min spacing between prompts (seconds)",
+            style="PromptBotFieldLabel.TLabel",
+        ).grid(row=row, column=0, sticky="w")
+        ttk.Spinbox(
+            form_card,
+            from_=0,
+            to=900,
+            increment=5,
+            width=10,
+            textvariable=self.min_spacing_sec,
+            style="PromptBot.TSpinbox",
+        ).grid(row=row, column=1, sticky="w", pady=(0, 6), padx=(0, 12))
+        row += 1
+
+        ttk.Label(
+            form_card,
+            text="Parallel chat tabs",
+            style="PromptBotFieldLabel.TLabel",
+        ).grid(row=row, column=0, sticky="w")
+        ttk.Spinbox(
+            form_card,
+            from_=1,
+            to=8,
+            increment=1,
+            width=10,
+            textvariable=self.parallel_tabs,
+            style="PromptBot.TSpinbox",
+        ).grid(row=row, column=1, sticky="w", pady=(0, 6), padx=(0, 12))
+        row += 1
+
+        ttk.Label(
+            form_card,
+            text="Prompts in flight (0 = one per tab)",
+            style="PromptBotFieldLabel.TLabel",
+        ).grid(row=row, column=0, sticky="w")
+        ttk.Spinbox(
+            form_card,
+            from_=0,
+            to=8,
+            increment=1,
+            width=10,
+            textvariable=self.max_in_flight,
+            style="PromptBot.TSpinbox",
+        ).grid(row=row, column=1, sticky="w", pady=(0, 6), padx=(0, 12))
+        row += 1
+
+        ttk.Label(
+            form_card,
+            text="Account send interval (seconds)",
+            style="PromptBotFieldLabel.TLabel",
+        ).grid(row=row, column=0, sticky="w")
+        ttk.Spinbox(
+            form_card,
+            from_=0,
+            to=600,
+            increment=5,
+            width=10,
+            textvariable=self.account_interval_sec,
+            style="PromptBot.TSpinbox",
+        ).grid(row=row, column=1, sticky="w", pady=(0, 6), padx=(0, 12))
+        row += 1
+
+        ttk.Checkbutton(
+            form_card,
+            text="Use async engine (one event loop for all tabs)",
+            variable=self.use_async_engine,
+            style="PromptBot.TCheckbutton",
+        ).grid(row=row, column=1, columnspan=2, sticky="w", pady=(0, 6))
+        row += 1
+
+        ttk.Checkbutton(
+            form_card,
+            text="Reuse character uploads within a chat",
+            variable=self.reuse_uploads,
+            style="PromptBot.TCheckbutton",
+        ).grid(row=row, column=1, columnspan=2, sticky="w", pady=(0, 6))
+        row += 1
+
+        ttk.Checkbutton(
+            form_card,
+            text="Downscale character images before upload (needs Pillow)",
+            variable=self.downscale_refs,
+            style="PromptBot.TCheckbutton",
+        ).grid(row=row, column=1, columnspan=2, sticky="w", pady=(0, 6))
+        row += 1
+
+        ttk.Checkbutton(
+            form_card,
+            text="Run headless from the captured session (bundled Chromium)",
+            variable=self.headless_workers,
+            style="PromptBot.TCheckbutton",
+        ).grid(row=row, column=1, columnspan=2, sticky="w", pady=(0, 6))
+        row += 1
+
+        ttk.Checkbutton(
+            form_card,
+            text="Keep the browser open between runs",
+            variable=self.keep_browser,
+            style="PromptBot.TCheckbutton",
+        ).grid(row=row, column=1, columnspan=2, sticky="w", pady=(0, 6))
+        row += 1
+
+        ttk.Label(
+            form_card,
+            text="Reference max size (pixels)",
+            style="PromptBotFieldLabel.TLabel",
+        ).grid(row=row, column=0, sticky="w")
+        ttk.Spinbox(
+            form_card,
+            from_=256,
+            to=4096,
+            increment=128,
+            width=10,
+            textvariable=self.ref_max_dim,
+            style="PromptBot.TSpinbox",
+        ).grid(row=row, column=1, sticky="w", pady=(0, 6), padx=(0, 12))
+        row += 1
+
+        ttk.Label(
+            form_card,
+            text="Reference JPEG quality",
+            style="PromptBotFieldLabel.TLabel",
+        ).grid(row=row, column=0, sticky="w")
+        ttk.Spinbox(
+            form_card,
+            from_=40,
+            to=100,
+            increment=5,
+            width=10,
+            textvariable=self.ref_quality,
+            style="PromptBot.TSpinbox",
+        ).grid(row=row, column=1, sticky="w", pady=(0, 6), padx=(0, 12))
+        row += 1
+
         ttk.Label(form_card, text="Primary URL", style="PromptBotFieldLabel.TLabel").grid(row=row, column=0, sticky="w")
         ttk.Entry(form_card, textvariable=self.primary_url, style="PromptBot.TEntry").grid(
             row=row, column=1, columnspan=2, sticky="ew", pady=(0, 6), padx=(0, 12)
@@ -164,6 +401,18 @@ class ImageGenApp:
             command=self._launch_profile_browser,
             style="Secondary.TButton",
         ).pack(side="left", padx=(0, 6))
+        ttk.Button(
+            btns,
+            text="Capture session",
+            command=self._capture_session,
+            style="Secondary.TButton",
+        ).pack(side="left", padx=(0, 6))
+        ttk.Button(
+            btns,
+            text="Compile prompts",
+            command=self._compile_prompts,
+            style="Secondary.TButton",
+        ).pack(side="left", padx=(0, 6))
         ttk.Button(
             btns,
             text="Generate JSONs",
@@ -238,6 +487,7 @@ class ImageGenApp:
 
         self._last_geometry = self.root.geometry()
         self.root.bind("<Configure>", self._on_window_configure)
+        self.root.after(LOG_DRAIN_MS, self._drain_log)
 
     def _apply_default_geometry(self):
         width = self.root.winfo_width()
@@ -457,6 +707,18 @@ class ImageGenApp:
             fieldbackground=[("focus", self.colors["card_highlight"])],
         )
 
+        style.configure(
+            "PromptBot.TCheckbutton",
+            background=self.colors["card"],
+            foreground=self.colors["text"],
+            font=self.fonts["base"],
+        )
+        style.map(
+            "PromptBot.TCheckbutton",
+            background=[("active", self.colors["card"])],
+            indicatorcolor=[("selected", self.colors["accent"]), ("!selected", self.colors["input_bg"])],
+        )
+
         style.configure("PromptBot.TSeparator", background=self.colors["border"])
 
         self.style = style
@@ -519,10 +781,28 @@ class ImageGenApp:
 
     # logging
     def log(self, msg):
-        self.console.configure(state="normal")
-        self.console.insert("end", msg + "\n")
-        self.console.see("end")
-        self.console.configure(state="disabled")
+        # safe from any thread, the widget is only touched by _drain_log
+        self.log_sink.write(msg)
+
+    def _use_log_dir(self):
+        # fixed when a run starts, so typing into the field creates nothing
+        self.log_sink.set_log_dir(self.output_dir.get().strip() or None)
+
+    def _drain_log(self, reschedule=True):
+        lines = self.log_sink.drain()
+        if lines:
+            self.console.configure(state="normal")
+            self.console.insert("end", "\n".join(lines) + "\n")
+            excess = int(self.console.index("end-1c").split(".")[0]) - 1 - LOG_WIDGET_LINES
+            if excess > 0:
+                self.console.delete("1.0", f"{excess + 1}.0")
+            self.console.see("end")
+            self.console.configure(state="disabled")
+        if reschedule:
+            self.root.after(1 if len(lines) >= LOG_DRAIN_BATCH else LOG_DRAIN_MS, self._drain_log)
+
+    def _close_log(self):
+        self.log_sink.close()
 
     def _set_activity_status(self, message: str):
         if not hasattr(self, "status_var"):
@@ -535,97 +815,54 @@ class ImageGenApp:
 
     # new, auto generate characters.json and name_variants.json
     def _generate_jsons(self):
+        if self.scan_thread and self.scan_thread.is_alive():
+            messagebox.showinfo("Scanning", "Character images are still being scanned.")
+            return
         img_dir = filedialog.askdirectory(title="Select character_images folder")
         if not img_dir:
             return
         img_dir = Path(img_dir)
+        self._set_activity_status(f"Scanning {img_dir.name}...")
 
-        def tokenize_name(stem: str):
-            """Split a filename stem into lowercase tokens.
-
-            Handles separators (spaces, hyphen, underscore) and CamelCase so that a
-            name like "AydaPrime" yields tokens ["ayda", "prime"]. Apostrophes are
-            preserved to support names such as "O'Connor".
-            """
-            sanitized = re.sub(r"[^0-9A-Za-z'’_\-\s]", " ", stem)
-            parts = [p for p in re.split(r"[\s_\-]+", sanitized) if p]
-            if len(parts) == 1:
-                part = parts[0]
-                camel = re.findall(r"[A-Z]?[a-z0-9'’]+|[A-Z]+(?![a-z])", part)
-                if len(camel) > 1:
-                    parts = camel
-            return [p.lower() for p in parts]
-
-        def flex_apostrophes(text: str) -> str:
-            """Allow both straight and curly apostrophes inside a regex pattern."""
-            return re.sub(r"[’']", "['’]", text)
-
-        def build_patterns(raw_key: str, tokens: list[str]):
-            pattern_set = set()
-
-            def add_variant(text: str):
-                if not text:
-                    return
-                escaped = flex_apostrophes(re.escape(text))
-                pattern_set.add(rf"\b{escaped}(?:['’]s)?\b")
-
-            add_variant(raw_key)
-
-            canonical = " ".join(tokens)
-            if canonical and canonical != raw_key:
-                add_variant(canonical)
-
-            if tokens:
-                joined_tokens = "[\\s_\\-]+".join(flex_apostrophes(re.escape(t)) for t in tokens)
-                pattern_set.add(rf"\b{joined_tokens}(?:['’]s)?\b")
-                collapsed = "".join(tokens)
-                if collapsed:
-                    add_variant(collapsed)
-
-            return sorted(pattern_set)
-
-        chars = {}
-        variants = {}
-        for file in img_dir.iterdir():
-            if file.is_file() and file.suffix.lower() in [".png", ".jpg", ".jpeg", ".webp"]:
-                stem = file.stem.strip()
-                if not stem:
-                    continue
-                raw_key = stem.lower()
-                tokens = tokenize_name(stem)
-                if not tokens and not raw_key:
-                    continue
+        def progress(done, total):
+            if done == total or done % 25 == 0:
+                self._set_activity_status(f"Scanning character images: {done}/{total}")
 
-                canonical_key = " ".join(tokens)
+        # stat/resolve on a network share can take minutes, keep Tk responsive
+        def work():
+            try:
+                stats = scan_character_images(img_dir, progress=progress)
+            except Exception as e:
+                err = str(e)
+                self.root.after(0, lambda: self._generate_jsons_failed(err))
+                return
+            self.root.after(0, lambda: self._generate_jsons_done(img_dir, stats))
 
-                patterns = build_patterns(raw_key, tokens)
-                primary_key = canonical_key or raw_key
+        self.scan_thread = threading.Thread(target=work, daemon=True)
+        self.scan_thread.start()
 
-                resolved_path = str(file.resolve())
-                if primary_key:
-                    chars[primary_key] = resolved_path
-                    variants[primary_key] = list(patterns)
+    def _generate_jsons_failed(self, err):
+        self._set_activity_status("Could not write character JSON files.")
+        messagebox.showerror("Write error", f"Could not write JSON files, {err}")
 
-        if not chars:
+    def _generate_jsons_done(self, img_dir, stats):
+        if not stats["chars_path"]:
+            self._set_activity_status("No character images found.")
             messagebox.showerror("No images", f"No character images found in {img_dir}")
             return
 
-        # save next to the images folder parent, common project layout
-        char_json_path = img_dir.parent / "characters.json"
-        variants_json_path = img_dir.parent / "name_variants.json"
-
-        try:
-            char_json_path.write_text(json.dumps(chars, indent=2), encoding="utf-8")
-            variants_json_path.write_text(json.dumps(variants, indent=2), encoding="utf-8")
-        except Exception as e:
-            messagebox.showerror("Write error", f"Could not write JSON files, {e}")
-            return
-
         # update GUI fields and persist
-        self.char_json.set(str(char_json_path))
-        self.variants_json.set(str(variants_json_path))
+        self.char_json.set(stats["chars_path"])
+        self.variants_json.set(stats["variants_path"])
         self._save_config()
-        self.log(f"Generated {char_json_path} and {variants_json_path}")
+        self.log(
+            f"Generated {stats['chars_path']} and {stats['variants_path']}: "
+            f"{stats['added']} added, {stats['updated']} updated, {stats['renamed']} renamed, "
+            f"{stats['removed']} removed, {stats['unchanged']} unchanged"
+        )
+        if stats["kept_variants"]:
+            self.log(f"Kept {stats['kept_variants']} hand-edited variant lists for images no longer in the folder.")
+        self._set_activity_status(f"Character files ready: {stats['images']} images.")
 
     # control
     def _start(self):
@@ -649,10 +886,38 @@ class ImageGenApp:
         self.pause_event.clear()
         self._update_pause_button(False)
         self._save_config()
+        self._use_log_dir()
         self._set_activity_status("Starting batch run...")
         self.running_thread = threading.Thread(target=self._run_generator, daemon=True)
         self.running_thread.start()
 
+    def _compile_prompts(self):
+        if self.running_thread and self.running_thread.is_alive():
+            messagebox.showinfo("Running", "Wait for the current run to finish first.")
+            return
+        if not Path(self.csv_path.get()).exists():
+            messagebox.showerror("Missing file", "Please choose a valid prompts file.")
+            return
+        self._save_config()
+        self._use_log_dir()
+        self._set_activity_status("Compiling prompts...")
+        self.running_thread = threading.Thread(target=self._compile_worker, daemon=True)
+        self.running_thread.start()
+
+    def _compile_worker(self):
+        runner = BatchRunner(self._batch_settings(), log=self.log, status=self._set_activity_status)
+        try:
+            count = runner.compile()
+        except Exception as e:
+            self.log(f"Compile failed, {e}")
+            self._set_activity_status("Compile failed.")
+            return
+        if count:
+            self.log(f"Resolved {count} prompts into {runner.cache.path}")
+            self._set_activity_status(f"Prompts compiled: {count}. The next run starts from them.")
+        else:
+            self._set_activity_status("No prompts found. Update your file and try again.")
+
     def _skip_now(self):
         self.skip_event.set()
 
@@ -670,6 +935,8 @@ class ImageGenApp:
             if self.running_thread and self.running_thread.is_alive():
                 self.root.after(150, destroy_when_idle)
                 return
+            self.browser_session.close()
+            self._close_log()
             self.root.destroy()
 
         if self.running_thread and self.running_thread.is_alive():
@@ -678,6 +945,8 @@ class ImageGenApp:
             self._set_activity_status("Exit requested. Shutting down after current step...")
             self.root.after(150, destroy_when_idle)
         else:
+            self.browser_session.close()
+            self._close_log()
             self.root.destroy()
 
     def _update_pause_button(self, paused: bool):
@@ -744,6 +1013,13 @@ class ImageGenApp:
             )
             return
 
+        if self.browser_session.is_open:
+            if self.running_thread and self.running_thread.is_alive():
+                messagebox.showinfo("Running", "The batch browser is using this profile. Stop the run first.")
+                return
+            self.log("Closing the kept browser so Chrome can open the profile.")
+            self.browser_session.close()
+
         profile = Path(self.profile_dir.get()).expanduser()
         profile.mkdir(parents=True, exist_ok=True)
         target_url = self.primary_url.get().strip() or self.fallback_url.get().strip() or "https://chatgpt.com/?model=gpt-5"
@@ -754,6 +1030,39 @@ class ImageGenApp:
         except Exception as e:
             messagebox.showerror("Launch failed", f"Could not launch Chrome: {e}")
 
+    def _capture_session(self):
+        if self.running_thread and self.running_thread.is_alive():
+            messagebox.showinfo("Running", "Wait for the current run to finish first.")
+            return
+        self._set_activity_status("Capturing browser session...")
+        self.running_thread = threading.Thread(target=self._capture_session_worker, daemon=True)
+        self.running_thread.start()
+
+    def _capture_session_worker(self):
+        self.browser_session.close()  # frees the profile for the capture window
+        profile = Path(self.profile_dir.get()).expanduser()
+        profile.mkdir(parents=True, exist_ok=True)
+
+        def confirm_login():
+            return messagebox.askokcancel("Capture session", "Log in in the opened window, then click OK to save the session.")
+
+        try:
+            saved = capture_session(
+                profile,
+                default_state_path(profile),
+                [self.primary_url.get(), self.fallback_url.get()],
+                confirm_login=confirm_login,
+                log=self.log,
+            )
+        except Exception as e:
+            self.log(f"Session capture failed, {e}. Close Chrome windows using this profile and try again.")
+            self._set_activity_status("Session capture failed.")
+            return
+        if saved:
+            self._set_activity_status("Session captured. Headless runs can use it now.")
+        else:
+            self._set_activity_status("Session not captured.")
+
     # config persistence
     def _save_config(self):
         self._cancel_pending_config_save()
@@ -766,6 +1075,17 @@ class ImageGenApp:
             profile=self.profile_dir.get(),
             preprompt=self.preprompt.get(),
             delay=self.delay_sec.get(),
+            min_spacing=self.min_spacing_sec.get(),
+            parallel_tabs=self.parallel_tabs.get(),
+            max_in_flight=self.max_in_flight.get(),
+            account_interval=self.account_interval_sec.get(),
+            async_engine=self.use_async_engine.get(),
+            reuse_uploads=self.reuse_uploads.get(),
+            downscale_refs=self.downscale_refs.get(),
+            ref_max_dim=self.ref_max_dim.get(),
+            ref_quality=self.ref_quality.get(),
+            headless_workers=self.headless_workers.get(),
+            keep_browser=self.keep_browser.get(),
             primary=self.primary_url.get(),
             fallback=self.fallback_url.get(),
             window_geometry=self._last_geometry or self.root.geometry(),
@@ -788,6 +1108,17 @@ class ImageGenApp:
                 self.profile_dir.set(cfg.get("profile", str(Path.cwd() / "chrome_profile")))
                 self.preprompt.set(cfg.get("preprompt", self.preprompt.get()))
                 self.delay_sec.set(int(cfg.get("delay", 180)))
+                self.min_spacing_sec.set(int(cfg.get("min_spacing", 20)))
+                self.parallel_tabs.set(int(cfg.get("parallel_tabs", 1)))
+                self.max_in_flight.set(int(cfg.get("max_in_flight", 0)))
+                self.account_interval_sec.set(int(cfg.get("account_interval", 0)))
+                self.use_async_engine.set(bool(cfg.get("async_engine", False)))
+                self.reuse_uploads.set(bool(cfg.get("reuse_uploads", False)))
+                self.downscale_refs.set(bool(cfg.get("downscale_refs", False)))
+                self.ref_max_dim.set(int(cfg.get("ref_max_dim", 1536)))
+                self.ref_quality.set(int(cfg.get("ref_quality", 85)))
+                self.headless_workers.set(bool(cfg.get("headless_workers", False)))
+                self.keep_browser.set(bool(cfg.get("keep_browser", True)))
                 self.primary_url.set(cfg.get("primary", self.primary_url.get()))
                 self.fallback_url.set(cfg.get("fallback", self.fallback_url.get()))
                 geom = cfg.get("window_geometry")
@@ -806,6 +1137,17 @@ class ImageGenApp:
             self.profile_dir,
             self.preprompt,
             self.delay_sec,
+            self.min_spacing_sec,
+            self.parallel_tabs,
+            self.max_in_flight,
+            self.account_interval_sec,
+            self.use_async_engine,
+            self.reuse_uploads,
+            self.downscale_refs,
+            self.ref_max_dim,
+            self.ref_quality,
+            self.headless_workers,
+            self.keep_browser,
             self.primary_url,
             self.fallback_url,
         ]
@@ -846,511 +1188,104 @@ class ImageGenApp:
 
     # --------------------- batch generation core ---------------------
 
-    def _run_generator(self):
-        CSV_PATH = self.csv_path.get()
-        CHAR_MAP_JSON = self.char_json.get()
-        NAME_VARIANTS_JSON = self.variants_json.get()
-        OUTPUT_DIR = self.output_dir.get()
-        PROFILE_DIR = self.profile_dir.get()
-        PREPROMPT = self.preprompt.get()
-        PRIMARY_URL = self.primary_url.get()
-        FALLBACK_URL = self.fallback_url.get()
-        DELAY_BETWEEN_PROMPTS = int(self.delay_sec.get())
-
-        def log(msg): self.log(msg)
-
-        TAG_PATTERN = re.compile(r"\[@([a-zA-Z0-9_\- '’]+)\]")
-
-        def load_name_variants(path):
-            try:
-                return json.loads(Path(path).read_text(encoding="utf-8"))
-            except Exception as e:
-                log(f"Could not load name_variants.json, {e}")
-                return {}
-
-        # updated, supports CSV and TXT
-        def load_prompts(prompts_path: str):
-            """
-            Accepts:
-              1) CSV with header id,prompt (either .csv or .txt)
-              2) CSV without header: prompt_id,"prompt text..."
-              3) Plain TXT, one prompt per paragraph separated by blank lines
-              4) Plain TXT where a block starts with 'prompt123:' or 'id: ...'
-            Returns list of {id, prompt}
-            """
-            p = Path(prompts_path)
-            if not p.exists():
-                return []
-
-            text = p.read_text(encoding="utf-8", errors="ignore").strip()
-
-            def normalize(rows):
-                out = []
-                for i, row in enumerate(rows, start=1):
-                    pid = str(row.get("id") or f"row_{i:03d}").strip()
-                    pr = (row.get("prompt") or "").strip()
-                    if pr:
-                        out.append({"id": pid, "prompt": pr})
-                return out
-
-            # detect CSV like content
-            looks_like_csv = False
-            first_line = text.splitlines()[0] if text else ""
-            if "," in first_line or p.suffix.lower() in [".csv", ".txt"]:
-                if first_line.lower().strip().startswith("id,prompt"):
-                    looks_like_csv = True
-                elif re.match(r'^\s*[^,]+,\s*".*"$', first_line) or re.match(r"^\s*[^,]+,\s*[^\"].+$", first_line):
-                    looks_like_csv = True
-
-            if looks_like_csv:
-                try:
-                    import io
-                    df = pd.read_csv(io.StringIO(text), dtype=str)
-                    cols = [c.lower().strip() for c in df.columns]
-                    if len(df.columns) == 2 and set(cols) != {"id", "prompt"}:
-                        df = pd.read_csv(io.StringIO(text), names=["id", "prompt"], header=None, dtype=str)
-                    df = df.fillna("")
-                    rows = [{"id": str(r.get("id", f"row_{i+1}")).strip(),
-                             "prompt": str(r.get("prompt", "")).strip()}
-                            for i, r in df.iterrows()]
-                    return normalize(rows)
-                except Exception:
-                    pass  # fall through to TXT parsing
-
-            # plain TXT parsing
-            blocks = [b.strip() for b in re.split(r"\n\s*\n", text) if b.strip()]
-            rows = []
-            for idx, block in enumerate(blocks, start=1):
-                lines = block.splitlines()
-                if not lines:
-                    continue
-                header = lines[0].strip()
-                m1 = re.match(r"^(prompt[_\- ]?\d+)\s*:\s*(.*)$", header, flags=re.IGNORECASE)
-                m2 = re.match(r"^id\s*:\s*(.+)$", header, flags=re.IGNORECASE)
-                if m1:
-                    pid = m1.group(1).strip()
-                    rest = m1.group(2).strip()
-                    prompt_text = (rest + "\n" + "\n".join(lines[1:])).strip() if rest else "\n".join(lines[1:]).strip()
-                elif m2:
-                    pid = m2.group(1).strip()
-                    prompt_text = "\n".join(lines[1:]).strip()
-                else:
-                    pid = f"row_{idx:03d}"
-                    prompt_text = block.strip()
-                if prompt_text:
-                    rows.append({"id": pid, "prompt": prompt_text})
-
-            return normalize(rows)
-
-        def load_char_map(json_path):
-            if not Path(json_path).exists(): return {}
-            m = json.loads(Path(json_path).read_text(encoding="utf-8"))
-            out = {}
-            for k, v in m.items():
-                key = k.strip().lower()
-                p = Path(v).expanduser()
-                if p.exists():
-                    out[key] = str(p)
-            return out
-
-        NAME_VARIANTS = load_name_variants(NAME_VARIANTS_JSON)
-
-        def tokenize_for_patterns(stem: str):
-            sanitized = re.sub(r"[^0-9A-Za-z'’_\-\s]", " ", stem)
-            parts = [p for p in re.split(r"[\s_\-]+", sanitized) if p]
-            if len(parts) == 1:
-                part = parts[0]
-                camel = re.findall(r"[A-Z]?[a-z0-9'’]+|[A-Z]+(?![a-z])", part)
-                if len(camel) > 1:
-                    parts = camel
-            return [p.lower() for p in parts]
-
-        def flex_apostrophes(text: str) -> str:
-            return re.sub(r"[’']", "['’]", text)
-
-        def default_patterns_for(name: str):
-            raw_key = name.strip().lower()
-            tokens = tokenize_for_patterns(name)
-            pattern_set = set()
-
-            def add_variant(text: str):
-                if not text:
-                    return
-                escaped = flex_apostrophes(re.escape(text))
-                pattern_set.add(rf"\b{escaped}(?:['’]s)?\b")
-
-            add_variant(raw_key)
-
-            canonical = " ".join(tokens)
-            if canonical and canonical != raw_key:
-                add_variant(canonical)
-
-            if tokens:
-                joined_tokens = "[\\s_\\-]+".join(flex_apostrophes(re.escape(t)) for t in tokens)
-                pattern_set.add(rf"\b{joined_tokens}(?:['’]s)?\b")
-                collapsed = "".join(tokens)
-                if collapsed:
-                    add_variant(collapsed)
-
-            return sorted(pattern_set)
-
-        def resolve_alias(alias: str):
-            key = alias.strip().lower()
-            if key in char_map:
-                return key
-            for name, pats in NAME_VARIANTS.items():
-                target = name.strip().lower()
-                if target in char_map:
-                    for pattern in pats:
-                        try:
-                            if re.search(pattern, alias, flags=re.IGNORECASE):
-                                return target
-                        except re.error:
-                            continue
-            for raw_name in char_map.keys():
-                target = str(raw_name).strip().lower()
-                for pattern in default_patterns_for(raw_name):
-                    try:
-                        if re.search(pattern, alias, flags=re.IGNORECASE):
-                            if target in char_map:
-                                return target
-                    except re.error:
-                        continue
-            return key
-
-        def extract_characters(prompt_text, char_map):
-            raw_tags = [m.group(1).strip() for m in TAG_PATTERN.finditer(prompt_text)]
-            tags = []
-            seen = set()
-            for raw in raw_tags:
-                resolved = resolve_alias(raw)
-                if resolved and resolved not in seen:
-                    tags.append(resolved)
-                    seen.add(resolved)
-            for name, pats in NAME_VARIANTS.items():
-                key = name.strip().lower()
-                if key in seen:
-                    continue
-                try:
-                    for pattern in pats:
-                        if re.search(pattern, prompt_text, flags=re.IGNORECASE):
-                            tags.append(key)
-                            seen.add(key)
-                            break
-                except re.error:
-                    continue
-            clean = TAG_PATTERN.sub("", prompt_text)
-            clean = re.sub(r"\s{2,}", " ", clean).strip()
-            files = [char_map[t] for t in tags if t in char_map]
-            return tags, files, clean
-
-        def dismiss_common_popups(page):
-            for txt in ["Accept", "Got it", "Okay", "OK", "I agree", "Continue", "Dismiss"]:
-                with contextlib.suppress(Exception):
-                    page.locator(f"button:has-text('{txt}')").first.click(timeout=400)
-
-        def in_conversation(url: str) -> bool:
-            try:
-                u = urlparse(url)
-                return "/c/" in u.path or "model=" in (u.query or "")
-            except Exception:
-                return False
-
-        SELECTORS = {
-            "composer_candidates": [
-                "input[placeholder*='Ask anything']",
-                "textarea[placeholder*='Ask anything']",
-                "[aria-label*='Ask anything']",
-                "div[contenteditable='true'][data-placeholder*='Ask anything']",
-                "[data-testid='composer'] div[contenteditable='true']",
-                "div[contenteditable='true'][data-placeholder*='Send a message']",
-                "textarea[placeholder*='Send a message']",
-                "[aria-label*='Message']",
-                "div[contenteditable='true'][role='textbox']",
-                "[contenteditable='true'][data-placeholder]",
-                "[role='textbox']",
-            ],
-            "new_chat_buttons": [
-                "button:has-text('New chat')",
-                "a:has-text('New chat')",
-                "button:has-text('Start chatting')",
-                "a:has-text('Start chatting')",
-                "button:has-text('Start new chat')",
-            ],
-            "attach_btn": "button[aria-label*='Attach'], button[data-testid='attach-button']",
-            "file_input": "input[type='file']",
-            "send_btn": "button:has-text('Send'), button[data-testid='send-button']",
-        }
-
-        def find_composer_any_frame(page, timeout_ms=15000):
-            deadline = time.time() + timeout_ms / 1000.0
-            def try_frame(frame):
-                with contextlib.suppress(Exception):
-                    loc = frame.get_by_placeholder("Ask anything")
-                    loc.first.wait_for(state="visible", timeout=1200)
-                    return loc.first
-                with contextlib.suppress(Exception):
-                    loc = frame.get_by_role("textbox")
-                    loc.first.wait_for(state="visible", timeout=1200)
-                    return loc.first
-                for sel in SELECTORS["composer_candidates"]:
-                    with contextlib.suppress(Exception):
-                        loc = frame.locator(sel)
-                        loc.first.wait_for(state="visible", timeout=1200)
-                        return loc.first
-                return None
-            while time.time() < deadline:
-                cand = try_frame(page)
-                if cand: return cand
-                for fr in page.frames:
-                    cand = try_frame(fr)
-                    if cand: return cand
-                time.sleep(0.3)
-            with contextlib.suppress(Exception):
-                page.evaluate("""
-                    () => {
-                        const eds = Array.from(document.querySelectorAll('[contenteditable="true"]'));
-                        const last = eds[eds.length - 1];
-                        if (last) { last.focus(); return true; }
-                        return false;
-                    }
-                """)
-                loc = page.locator('[contenteditable="true"]').last
-                loc.wait_for(state="visible", timeout=1200)
-                return loc
-            raise TimeoutError("Composer not visible")
-
-        def ensure_composer_ready(page, *, timeout_ms=6000, allow_reload=True, allow_new_chat=True):
-            try:
-                return find_composer_any_frame(page, timeout_ms=timeout_ms)
-            except Exception:
-                pass
-            if allow_new_chat and not in_conversation(page.url):
-                for sel in SELECTORS["new_chat_buttons"]:
-                    with contextlib.suppress(Exception):
-                        el = page.locator(sel).first
-                        if el.is_visible(timeout=1200):
-                            el.click()
-                            page.wait_for_load_state("domcontentloaded")
-                            return find_composer_any_frame(page, timeout_ms=timeout_ms)
-            if not allow_reload:
-                raise TimeoutError("Composer not visible (reload skipped)")
-            page.reload(wait_until="domcontentloaded", timeout=15000)
-            dismiss_common_popups(page)
-            return find_composer_any_frame(page, timeout_ms=max(timeout_ms, 8000))
-
-        def looks_like_login(page):
-            url = (page.url or "").lower()
-            for token in ("login", "signin", "auth", "account"):
-                if token in url and "logout" not in url:
-                    return True
-            text_clues = [
-                "Log in",
-                "Sign in",
-                "Welcome back",
-                "Continue with",
-                "Use the ChatGPT app to continue",
-                "Verify you are human",
-                "human check",
-            ]
-            for clue in text_clues:
-                with contextlib.suppress(Exception):
-                    loc = page.get_by_text(clue, exact=False).first
-                    if loc.is_visible(timeout=300):
-                        return True
-            selector_clues = [
-                "input[type='email']",
-                "input[type='password']",
-                "button:has-text('Log in')",
-                "button:has-text('Sign in')",
-                "form[action*='login']",
-                "iframe[src*='captcha']",
-                "iframe[title*='captcha']",
-            ]
-            for sel in selector_clues:
-                with contextlib.suppress(Exception):
-                    loc = page.locator(sel).first
-                    if loc.is_visible(timeout=300):
-                        return True
-            with contextlib.suppress(Exception):
-                for frame in page.frames:
-                    if frame is page:
-                        continue
-                    f_url = (frame.url or "").lower()
-                    if "captcha" in f_url or "auth" in f_url:
-                        return True
-            return False
+    def _batch_settings(self):
+        settings = BatchSettings(
+            prompts_path=self.csv_path.get(),
+            characters_json=self.char_json.get(),
+            name_variants_json=self.variants_json.get(),
+            output_dir=self.output_dir.get(),
+            profile_dir=self.profile_dir.get(),
+            preprompt=self.preprompt.get(),
+            urls=[self.primary_url.get(), self.fallback_url.get()],
+            max_wait_sec=int(self.delay_sec.get()),
+            min_spacing_sec=int(self.min_spacing_sec.get()),
+            tabs=int(self.parallel_tabs.get()),
+            max_in_flight=int(self.max_in_flight.get()),
+            account_interval_sec=int(self.account_interval_sec.get()),
+            async_engine=bool(self.use_async_engine.get()),
+            reuse_uploads=bool(self.reuse_uploads.get()),
+            downscale_refs=bool(self.downscale_refs.get()),
+            ref_max_dim=int(self.ref_max_dim.get()),
+            ref_quality=int(self.ref_quality.get()),
+        )
+        if self.headless_workers.get():
+            settings.headless = True
+            settings.browser_channel = ""
+            settings.storage_state = str(default_state_path(self.profile_dir.get()))
+        return settings
 
-        def goto_with_fallback(page):
-            urls = [PRIMARY_URL, FALLBACK_URL]
-            for attempt, url in enumerate(urls, start=1):
-                try:
-                    page.goto(url, wait_until="domcontentloaded", timeout=15000)
-                except PWTimeout:
-                    log(f"Navigation to {url} hit timeout, continuing (attempt {attempt}).")
-                except Exception as e:
-                    log(f"Navigation to {url} failed, {e}")
-                    continue
-                dismiss_common_popups(page)
-                if looks_like_login(page):
-                    return None, True
-                try:
-                    comp = ensure_composer_ready(page, timeout_ms=2500, allow_reload=False)
-                    if comp:
-                        return comp, False
-                except Exception:
-                    pass
-            return None, False
-
-        # do work
+    def _run_generator(self):
+        settings = self._batch_settings()
+        was_paused = False
+        last_logged = {}
+
+        # one control point for every tab: Stop, Skip and Pause apply to all waits
+        def control():
+            nonlocal was_paused
+            if self.stop_event.is_set():
+                return "stop"
+            if self.skip_event.is_set():
+                self.skip_event.clear()
+                self.pause_event.clear()
+                self._update_pause_button(False)
+                return "skip"
+            if self.pause_event.is_set():
+                if not was_paused:
+                    was_paused = True
+                    self._set_activity_status("App paused. Click 'Resume wait' to continue.")
+                return "pause"
+            was_paused = False
+            return None
+
+        # log every 10 seconds only, per prompt
+        def on_tick(item, remaining):
+            mins, secs = divmod(remaining, 60)
+            last = last_logged.get(item["id"])
+            if last is None or last - remaining >= 10:
+                last_logged[item["id"]] = remaining
+                self.log(f"[{item['id']}] Time left: {mins:02d}:{secs:02d}")
+            self._set_activity_status(f"Waiting for image: {mins:02d}:{secs:02d} remaining")
+
+        def progress(item, state, info):
+            if state != "sent":
+                last_logged.pop(item["id"], None)
+
+        def confirm_login():
+            return messagebox.askokcancel("Login check", "Finish login if needed, then click OK to start.")
+
+        runner = BatchRunner(
+            settings,
+            log=self.log,
+            status=self._set_activity_status,
+            progress=progress,
+            control=control,
+            on_tick=on_tick,
+            confirm_login=confirm_login,
+            session=self.browser_session if self.keep_browser.get() else None,
+        )
+        if not self.keep_browser.get():
+            self.browser_session.close()
+        self.skip_event.clear()
         try:
-            prompts = load_prompts(CSV_PATH)
-            if not prompts:
-                log("No prompts found, check file")
+            outcome = runner.run()
+            if outcome == "done":
+                self.log("All prompts processed.")
+                self._set_activity_status("All prompts processed.")
+            elif outcome == "stopped":
+                self.log("Batch stopped by user.")
+                self._set_activity_status("Batch stopped. Ready when you are.")
+            elif outcome == "no_prompts":
                 self._set_activity_status("No prompts found. Update your file and try again.")
-                return
-            total_prompts = len(prompts)
-            plural = "s" if total_prompts != 1 else ""
-            self._set_activity_status(f"Loaded {total_prompts} prompt{plural}.")
-            char_map = load_char_map(CHAR_MAP_JSON)
-            Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
-            Path(PROFILE_DIR).mkdir(parents=True, exist_ok=True)
-
-            self._set_activity_status("Launching browser session...")
-            with sync_playwright() as p:
-                ctx = p.chromium.launch_persistent_context(
-                    user_data_dir=PROFILE_DIR,
-                    headless=False,
-                    channel="chrome",
-                    viewport={"width": 1340, "height": 900},
-                    accept_downloads=True,
-                )
-                page = ctx.new_page()
-                self._set_activity_status("Checking chat composer...")
-                composer, login_needed = goto_with_fallback(page)
-                needs_user_action = login_needed or composer is None
-
-                if needs_user_action:
-                    self._set_activity_status("Awaiting manual login...")
-                    log("If you see a login or human check, finish it in Chrome, open a chat, then return here and click OK.")
-                    if not messagebox.askokcancel("Login check", "Finish login if needed, then click OK to start."):
-                        log("Canceled by user.")
-                        self._set_activity_status("Login canceled. Batch stopped.")
-                        return
-                    with contextlib.suppress(Exception):
-                        page.wait_for_load_state("domcontentloaded", timeout=15000)
-                    dismiss_common_popups(page)
-                    composer = None
-                    self._set_activity_status("Resuming automated run...")
-                else:
-                    log("Chat composer detected immediately; starting batch run.")
-
-                try:
-                    composer = composer or ensure_composer_ready(page)
-                    self._set_activity_status("Chat composer ready. Starting prompts...")
-                except Exception:
-                    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    snap = Path(OUTPUT_DIR) / f"debug_no_composer_{ts}.png"
-                    with contextlib.suppress(Exception):
-                        page.screenshot(path=str(snap), full_page=True)
-                    log(f"Composer not found, saved snapshot to {snap}")
-                    self._set_activity_status("Composer not found. See saved snapshot for details.")
-                    return
-
-                stopped = False
-                for idx, item in enumerate(prompts, start=1):
-                    if self.stop_event.is_set():
-                        log("Stop requested, exiting loop.")
-                        self._set_activity_status("Stop requested. Finishing current step...")
-                        stopped = True
-                        break
-
-                    self._set_activity_status(f"Sending prompt {idx}/{total_prompts}...")
-                    raw = item["prompt"]
-                    tags, char_files, clean_prompt = extract_characters(raw, char_map)
-                    message = PREPROMPT + clean_prompt
-
-                    page.bring_to_front()
-                    page.wait_for_load_state("domcontentloaded")
-                    dismiss_common_popups(page)
-
-                    composer = ensure_composer_ready(page)
-                    composer.click()
-                    try:
-                        composer.fill(message)
-                    except PWTimeout:
-                        composer.type(message, delay=10)
-                    time.sleep(0.2)
-
-                    finputs = page.query_selector_all("input[type='file']")
-                    attached_files = []
-                    if char_files and finputs:
-                        try:
-                            finputs[0].set_input_files(char_files)
-                            attached_files = [Path(f).name for f in char_files]
-                            time.sleep(0.5)
-                        except Exception as e:
-                            log(f"Attach failed for {item['id']}, {e}")
-
-                    if page.query_selector(SELECTORS["send_btn"]):
-                        page.click(SELECTORS["send_btn"])
-                    else:
-                        page.keyboard.press("Enter")
-
-                    if attached_files:
-                        log(f"[{item['id']}] Prompt sent, attached: {', '.join(attached_files)}")
-                    else:
-                        log(f"[{item['id']}] Prompt sent, no attachments")
-
-                    # wait with skip, log every 10 seconds only
-                    self.skip_event.clear()
-                    remaining = DELAY_BETWEEN_PROMPTS
-                    log(f"Waiting up to {remaining // 60} minutes. Click 'Skip wait now' to continue immediately.")
-                    mins, secs = divmod(remaining, 60)
-                    self._set_activity_status(f"Countdown: {mins:02d}:{secs:02d} remaining")
-                    was_paused = False
-                    while remaining > 0 and not self.skip_event.is_set() and not self.stop_event.is_set():
-                        if self.pause_event.is_set():
-                            if not was_paused:
-                                was_paused = True
-                                self._set_activity_status("App paused. Click 'Resume wait' to continue.")
-                            time.sleep(0.5)
-                            continue
-                        if was_paused:
-                            was_paused = False
-                            mins, secs = divmod(remaining, 60)
-                            self._set_activity_status(f"Countdown: {mins:02d}:{secs:02d} remaining")
-                        if remaining % 10 == 0 or remaining == 1:
-                            mins, secs = divmod(remaining, 60)
-                            msg = f"Time left: {mins:02d}:{secs:02d}"
-                            log(msg)
-                            self._set_activity_status(f"Countdown: {mins:02d}:{secs:02d} remaining")
-                        time.sleep(1)
-                        remaining -= 1
-
-                    self.pause_event.clear()
-                    self._update_pause_button(False)
-
-                    if self.skip_event.is_set():
-                        log(">> Skip pressed, continuing")
-                        self._set_activity_status("Skip pressed. Continuing to next prompt...")
-                    elif self.stop_event.is_set():
-                        log(">> Stop requested, halting after current step")
-                        self._set_activity_status("Stop requested. Finishing current step...")
-                        stopped = True
-                        break
-                    else:
-                        log(">> Wait finished, continuing")
-                        self._set_activity_status("Wait finished. Continuing...")
-
-                if stopped:
-                    log("Batch stopped by user.")
-                    self._set_activity_status("Batch stopped. Ready when you are.")
-                else:
-                    log("All prompts processed.")
-                    self._set_activity_status("All prompts processed.")
+            elif outcome == "all_captured":
+                self._set_activity_status("All prompts already captured.")
+            elif outcome == "canceled":
+                self._set_activity_status("Login canceled. Batch stopped.")
+            elif outcome == "no_composer":
+                self._set_activity_status("Composer not found. See saved snapshot for details.")
+            elif outcome == "no_session":
+                self._set_activity_status("No captured session. Click 'Capture session' first.")
         except Exception as e:
-            log(f"Fatal error, {e}")
+            self.log(f"Fatal error, {e}")
             self._set_activity_status(f"Fatal error: {e}")
         finally:
             self.pause_event.clear()
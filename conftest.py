@@ -0,0 +1,26 @@
+import sys
+import types
+
+
+# The scripts import playwright at module level. It is not needed for the
+# pure-Python helpers under test, so register light stand-ins before any
+# test module imports the scripts.
+playwright_module = types.ModuleType("playwright")
+sync_api_module = types.ModuleType("playwright.sync_api")
+async_api_module = types.ModuleType("playwright.async_api")
+
+
+class _DummyTimeoutError(Exception):
+    pass
+
+
+sync_api_module.sync_playwright = lambda: None
+sync_api_module.TimeoutError = _DummyTimeoutError
+async_api_module.async_playwright = lambda: None
+async_api_module.TimeoutError = _DummyTimeoutError
+playwright_module.sync_api = sync_api_module
+playwright_module.async_api = async_api_module
+
+sys.modules.setdefault("playwright", playwright_module)
+sys.modules.setdefault("playwright.sync_api", sync_api_module)
+sys.modules.setdefault("playwright.async_api", async_api_module)
@@ -0,0 +1,218 @@
+# Offline stand-in for the ChatGPT web UI, for benchmarks and local runs.
+#
+#   python mock_chatgpt_server.py --port 8765 --latency 4
+#
+# Serves one chat page with the parts the batch engine touches: an
+# "Ask anything" composer, a file input, a Send button, a Stop button while
+# a reply is generating, and an assistant <img alt="Generated image"> that
+# appears after a configurable delay. Images are real PNGs so capture and
+# download paths run unchanged. Standard library only.
+
+import argparse, json, random, struct, threading, time, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+CHAT_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>ChatGPT (mock)</title>
+<style>
+  body { font-family: sans-serif; margin: 0; }
+  main { padding: 16px 16px 120px; }
+  form { position: fixed; bottom: 0; left: 0; right: 0; padding: 12px; background: #eee; display: flex; gap: 8px; }
+  #prompt-textarea { flex: 1; min-height: 40px; background: #fff; padding: 6px; }
+  [data-message-author-role] { margin: 8px 0; }
+  [data-message-author-role] img { width: 256px; height: 256px; display: block; }
+</style></head>
+<body>
+<main id="thread"></main>
+<form id="composer-form" data-testid="composer" onsubmit="return false">
+  <div id="prompt-textarea" contenteditable="true" role="textbox" data-placeholder="Ask anything"></div>
+  <input id="file-input" type="file" multiple>
+  <button id="send" type="button" data-testid="send-button">Send</button>
+  <button id="stop" type="button" data-testid="stop-button" aria-label="Stop generating" style="display:none">Stop</button>
+</form>
+<script>
+const cfg = __CONFIG__;
+const thread = document.getElementById("thread");
+const box = document.getElementById("prompt-textarea");
+const files = document.getElementById("file-input");
+const stop = document.getElementById("stop");
+let turn = 0;
+
+function send() {
+  const text = box.innerText.trim();
+  if (!text) return;
+  const n = ++turn;
+  const user = document.createElement("div");
+  user.setAttribute("data-message-author-role", "user");
+  user.textContent = text;
+  thread.appendChild(user);
+  fetch("/api/sent", {method: "POST", body: JSON.stringify({turn: n, text, files: files.files.length})});
+  box.innerText = "";
+  files.value = "";
+  stop.style.display = "";
+  const delay = cfg.latency * 1000 * (1 + (Math.random() * 2 - 1) * cfg.jitter);
+  setTimeout(() => {
+    const reply = document.createElement("div");
+    reply.setAttribute("data-message-author-role", "assistant");
+    if (Math.random() >= cfg.no_image_rate) {
+      const img = document.createElement("img");
+      img.alt = "Generated image";
+      img.src = "/image/" + n + ".png";
+      reply.appendChild(img);
+    } else {
+      reply.textContent = "I can't create that image.";
+    }
+    thread.appendChild(reply);
+    stop.style.display = "none";
+  }, Math.max(0, delay));
+}
+
+document.getElementById("send").addEventListener("click", send);
+box.addEventListener("keydown", e => { if (e.key === "Enter" && !e.shiftKey) { e.preventDefault(); send(); } });
+</script>
+</body></html>
+"""
+
+
+def make_png(width, height, seed=0):
+    """Return a solid-colour RGB PNG; ``seed`` varies the colour per image."""
+    rng = random.Random(seed)
+    pixel = bytes(rng.randrange(256) for _ in range(3))
+    row = b"\x00" + pixel * width
+    raw = zlib.compress(row * height, 6)
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+class MockChatServer:
+    """Threaded HTTP server serving the mock chat page.
+
+    ``latency_sec`` is how long a reply "generates" before its image appears,
+    ``jitter`` a +/- fraction of that, ``no_image_rate`` the share of replies
+    that finish without an image. ``sent`` collects every message the page
+    posted back (turn, text, number of attached files).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_sec=3.0, jitter=0.0, no_image_rate=0.0, image_size=512):
+        self.latency_sec = latency_sec
+        self.jitter = jitter
+        self.no_image_rate = no_image_rate
+        self.image_size = image_size
+        self.sent = []
+        self._lock = threading.Lock()
+        self._png_cache = {}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def page_html(self):
+        cfg = {"latency": self.latency_sec, "jitter": self.jitter, "no_image_rate": self.no_image_rate}
+        return CHAT_PAGE.replace("__CONFIG__", json.dumps(cfg))
+
+    def image_png(self, turn):
+        # one encoded PNG per colour seed is plenty; the pixels don't matter
+        key = turn % 16
+        if key not in self._png_cache:
+            self._png_cache[key] = make_png(self.image_size, self.image_size, seed=key)
+        return self._png_cache[key]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def _reply(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path in ("/", "/c/mock"):
+                    self._reply(200, server.page_html().encode("utf-8"), "text/html; charset=utf-8")
+                elif path.startswith("/image/") and path.endswith(".png"):
+                    try:
+                        turn = int(path[len("/image/"):-len(".png")])
+                    except ValueError:
+                        self._reply(404, b"not found", "text/plain")
+                        return
+                    self._reply(200, server.image_png(turn), "image/png")
+                elif path == "/api/sent":
+                    with server._lock:
+                        body = json.dumps(server.sent).encode("utf-8")
+                    self._reply(200, body, "application/json")
+                else:
+                    self._reply(404, b"not found", "text/plain")
+
+            def do_POST(self):
+                if urlparse(self.path).path != "/api/sent":
+                    self._reply(404, b"not found", "text/plain")
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    entry = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    entry = {}
+                entry["received_at"] = time.time()
+                with server._lock:
+                    server.sent.append(entry)
+                self._reply(204, b"", "text/plain")
+
+        return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve an offline mock of the ChatGPT chat page.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=3.0, help="seconds before each image appears")
+    ap.add_argument("--jitter", type=float, default=0.0, help="+/- fraction of latency")
+    ap.add_argument("--no-image-rate", type=float, default=0.0, help="share of replies without an image")
+    args = ap.parse_args()
+
+    server = MockChatServer(args.host, args.port, args.latency, args.jitter, args.no_image_rate)
+    print(f"Mock chat running at {server.url} (Ctrl+C to stop)")
+    server.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+
+import chatgpt_batch_async as cba
+import chatgpt_batch_core as core
+
+
+class _Locator:
+    def __init__(self, delay, visible=True):
+        self.delay = delay
+        self.visible = visible
+
+    async def wait_for(self, state, timeout):
+        await asyncio.sleep(self.delay)
+        if not self.visible:
+            raise TimeoutError("not visible")
+
+
+class _Page:
+    def __init__(self, name):
+        self.name = name
+        self.loaded = 0
+
+    async def evaluate(self, script, arg=None):
+        return {"loaded": self.loaded, "pending": 0, "generating": False}
+
+
+def test_first_visible_prefers_earlier_candidate_among_winners():
+    fast_late_rank = _Locator(0)
+    slow = _Locator(0.05)
+    never = _Locator(0, visible=False)
+    also_fast = _Locator(0)
+
+    found = asyncio.run(cba._first_visible([never, slow, also_fast, fast_late_rank], 1000))
+
+    assert found is also_fast
+
+
+def test_first_visible_returns_none_when_nothing_shows():
+    assert asyncio.run(cba._first_visible([_Locator(0, visible=False)], 1000)) is None
+
+
+def test_async_pool_runs_tabs_concurrently():
+    pages = [_Page("a"), _Page("b")]
+    finished = []
+
+    async def send(page, item):
+        baseline = {"loaded": page.loaded}
+        page.loaded += 1
+        return {"baseline": baseline, "sent_at": 0}
+
+    async def finish(page, item, sent, outcome):
+        finished.append((page.name, item["id"], outcome))
+
+    prompts = [{"id": f"p{i}", "prompt": "x"} for i in range(1, 5)]
+    result = asyncio.run(
+        cba.run_prompt_pool(pages, prompts, send, finish, max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0)
+    )
+
+    assert result == "done"
+    assert sorted(i for _, i, _ in finished) == ["p1", "p2", "p3", "p4"]
+    assert {p for p, _, _ in finished} == {"a", "b"}
+    assert {o for _, _, o in finished} == {"done"}
+
+
+class _ChatPage:
+    """Just enough of a chat tab for send_prompt; records every page call."""
+
+    url = "https://chatgpt.com/c/abc"
+
+    def __init__(self):
+        self.calls = []
+        self.text = ""
+        self.main_frame = self
+        self.frames = [self]
+        self.keyboard = self
+
+    def _call(self, name, *args):
+        self.calls.append(name)
+
+    def bring_to_front(self):
+        self._call("bring_to_front")
+
+    def wait_for_load_state(self, state):
+        self._call("wait_for_load_state")
+
+    def evaluate(self, script, arg=None):
+        self._call("evaluate")
+        if script == core._VISIBLE_MATCH_JS:
+            return 0
+        if script == core._IMAGE_STATE_JS:
+            return {"loaded": 2, "pending": 0, "generating": False}
+        if script == core._COMPOSER_TEXT_JS:
+            return self.text
+        if script == core._LOGIN_SIGNALS_JS:
+            return {}
+        return []
+
+    def locator(self, selector):
+        return self
+
+    @property
+    def first(self):
+        return self
+
+    def click(self, selector=None):
+        self._call("click")
+
+    def fill(self, text, timeout=None):
+        self._call("fill")
+        self.text = text
+
+    def query_selector_all(self, selector):
+        self._call("query_selector_all")
+        return []
+
+    def query_selector(self, selector):
+        self._call("query_selector")
+        return True
+
+
+class _Async:
+    """Wrap a fake so its methods return coroutines, like playwright.async_api."""
+
+    SYNC = {"url", "frames", "main_frame", "keyboard", "first", "locator"}
+
+    def __init__(self, target):
+        self._target = target
+
+    def __eq__(self, other):
+        return isinstance(other, _Async) and other._target is self._target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name in self.SYNC:
+            if callable(attr):
+                return lambda *a, **k: _Async(attr(*a, **k))
+            return [_Async(x) for x in attr] if isinstance(attr, list) else (_Async(attr) if attr is self._target else attr)
+
+        async def call(*args, **kwargs):
+            return attr(*args, **kwargs)
+        return call
+
+
+def test_both_engines_run_the_same_send_steps(monkeypatch):
+    monkeypatch.setattr(core, "FILL_SETTLE_SEC", 0)
+    item = {"id": "p1", "prompt": "x", "tags": [], "files": [], "message": "Ayda at the helm"}
+    sync_page, async_page = _ChatPage(), _ChatPage()
+    monkeypatch.setattr(core.COMPOSER_INSERTER, "preferred", None)
+
+    sent = core.send_prompt(sync_page, item, extract=None)
+    monkeypatch.setattr(core.COMPOSER_INSERTER, "preferred", None)
+    sent_async = asyncio.run(cba.send_prompt(_Async(async_page), item, None))
+
+    assert async_page.calls == sync_page.calls
+    assert async_page.text == sync_page.text == "Ayda at the helm"
+    for result in (sent, sent_async):
+        assert result["baseline"] == {"loaded": 2, "pending": 0, "generating": False}
+        assert result["trace"]["insert"] == "fill"
+        assert set(result["timings"]) == set(core.SEND_PHASES)
+
+
+def test_async_pool_reads_prompts_off_the_event_loop():
+    loop_thread = threading.get_ident()
+    readers = []
+
+    def prompts():
+        for i in range(3):
+            readers.append(threading.get_ident())
+            yield {"id": f"p{i}", "prompt": "x"}
+
+    async def send(page, item):
+        page.loaded += 1
+        return {"baseline": {"loaded": page.loaded - 1}, "sent_at": 0}
+
+    async def finish(page, item, sent, outcome):
+        pass
+
+    asyncio.run(cba.run_prompt_pool([_Page("a")], prompts(), send, finish, max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0))
+
+    assert len(readers) == 3 and loop_thread not in readers
+
+
+def test_async_pool_removes_its_response_listener_when_done():
+    page = _Page("a")
+    page.handlers = []
+    page.on = lambda event, handler: page.handlers.append(handler)
+    page.remove_listener = lambda event, handler: page.handlers.remove(handler)
+
+    async def send(page, item):
+        assert len(page.handlers) == 1
+        page.loaded += 1
+        return {"baseline": {"loaded": page.loaded - 1}, "sent_at": 0}
+
+    async def finish(page, item, sent, outcome):
+        pass
+
+    for _ in range(2):
+        asyncio.run(cba.run_prompt_pool([page], iter([{"id": "p1", "prompt": "x"}]), send, finish, max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0))
+
+    assert page.handlers == []
@@ -0,0 +1,156 @@
+import os
+
+import pytest
+
+import chatgpt_batch_core as core
+
+
+class _Page:
+    def __init__(self, url):
+        self.url = url
+
+
+def test_files_are_read_once_and_reloaded_when_changed(tmp_path):
+    ref = tmp_path / "ayda.png"
+    ref.write_bytes(b"first")
+    store = core.AttachmentStore()
+
+    payload = store.payload(ref)
+    assert payload == {"name": "ayda.png", "mimeType": "image/png", "buffer": b"first"}
+    assert store.payload(ref) is payload
+    assert store.reads == 1
+
+    ref.write_bytes(b"second!")
+    stat = os.stat(ref)
+    os.utime(ref, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert store.payload(ref)["buffer"] == b"second!"
+    assert store.reads == 2
+
+
+def test_reuse_skips_files_already_uploaded_to_the_conversation(tmp_path):
+    a, b = tmp_path / "a.png", tmp_path / "b.png"
+    a.write_bytes(b"a")
+    b.write_bytes(b"b")
+    store = core.AttachmentStore(reuse_uploads=True)
+    page = _Page("https://chatgpt.com/")
+
+    payloads, reused = store.select(page, [a])
+    assert [p["name"] for p in payloads] == ["a.png"] and reused == []
+    store.mark_uploaded(page, [a])
+
+    page.url = "https://chatgpt.com/c/123"  # the first send opened the conversation
+    payloads, reused = store.select(page, [a, b])
+    assert [p["name"] for p in payloads] == ["b.png"] and reused == ["a.png"]
+    store.mark_uploaded(page, [a, b])
+
+    page.url = "https://chatgpt.com/"  # new chat, nothing is in context any more
+    payloads, reused = store.select(page, [a, b])
+    assert [p["name"] for p in payloads] == ["a.png", "b.png"] and reused == []
+
+
+def test_cache_stays_within_its_byte_budget(tmp_path):
+    store = core.AttachmentStore(max_bytes=10)
+    for name in "abc":
+        (tmp_path / f"{name}.png").write_bytes(b"x" * 6)
+        store.payload(tmp_path / f"{name}.png")
+
+    assert list(store._payloads) == [str(tmp_path / "c.png")]
+
+
+def test_uploads_over_the_buffer_limit_go_as_paths(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "SET_INPUT_FILES_LIMIT", 10)
+    a, b = tmp_path / "a.png", tmp_path / "b.png"
+    a.write_bytes(b"x" * 6)
+    b.write_bytes(b"y" * 6)
+    store = core.AttachmentStore()
+
+    assert [p["name"] for p in store.select(_Page(""), [a])[0]] == ["a.png"]
+    assert store.select(_Page(""), [a, b]) == ([str(a), str(b)], [])
+
+
+class _FileInput:
+    def __init__(self, error=None):
+        self.error = error
+        self.files = None
+
+    def set_input_files(self, files):
+        if self.error:
+            raise self.error
+        self.files = files
+
+
+class _SendPage:
+    url = "https://chatgpt.com/"
+
+    def __init__(self, file_input):
+        self.file_input = file_input
+        self.sent = False
+        self.keyboard = self
+
+    def bring_to_front(self):
+        pass
+
+    def wait_for_load_state(self, state):
+        pass
+
+    def evaluate(self, script, arg=None):
+        return {} if script == core._LOGIN_SIGNALS_JS else []
+
+    def query_selector_all(self, selector):
+        return [self.file_input]
+
+    def query_selector(self, selector):
+        return None
+
+    def press(self, key):
+        self.sent = True
+
+
+class _Composer:
+    text = ""
+
+    def click(self):
+        pass
+
+    def fill(self, text, timeout=None):
+        self.text = text
+
+    def evaluate(self, script, arg=None):
+        return self.text
+
+
+def _ready_composer(page, **kwargs):
+    return _Composer()
+    yield
+
+
+def _send(page, files, store, monkeypatch):
+    monkeypatch.setattr(core, "FILL_SETTLE_SEC", 0)
+    monkeypatch.setattr(core, "ATTACH_SETTLE_SEC", 0)
+    monkeypatch.setattr(core.ensure_composer_ready, "steps", _ready_composer)
+    item = {"id": "p1", "prompt": "x", "tags": ["ayda"], "files": files, "message": "Ayda"}
+    return core.send_prompt(page, item, extract=None, attachments=store)
+
+
+def test_large_references_are_attached_by_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "SET_INPUT_FILES_LIMIT", 10)
+    refs = []
+    for name in "abc":
+        refs.append(tmp_path / f"{name}.png")
+        refs[-1].write_bytes(b"x" * 6)
+    page = _SendPage(_FileInput())
+
+    sent = _send(page, refs, core.AttachmentStore(), monkeypatch)
+
+    assert page.file_input.files == [str(r) for r in refs]
+    assert sent["attachments"] == ["a.png", "b.png", "c.png"] and page.sent
+
+
+def test_failed_attach_does_not_send_the_prompt(tmp_path, monkeypatch):
+    ref = tmp_path / "a.png"
+    ref.write_bytes(b"x")
+    page = _SendPage(_FileInput(RuntimeError("Cannot set buffer larger than 50Mb")))
+
+    with pytest.raises(RuntimeError, match="Could not attach files for p1"):
+        _send(page, [ref], core.AttachmentStore(), monkeypatch)
+    assert not page.sent
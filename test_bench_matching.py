@@ -0,0 +1,17 @@
+import copy
+
+import bench_matching
+
+
+def test_suite_reports_every_cell_and_flags_slowdowns():
+    result = bench_matching.run_suite(casts=(5,), rows=(60,), budget_sec=5, log=lambda msg: None)
+
+    (cell,) = result["results"]
+    assert (cell["cast"], cell["rows"]) == (5, 60)
+    assert cell["extract_characters"]["calls"] == 60
+    assert cell["default_patterns_for"]["per_call_us"] > 0
+
+    slower = copy.deepcopy(result)
+    slower["results"][0]["extract_characters"]["per_call_us"] *= 2
+    assert bench_matching.compare(result, result) == []
+    assert [m for _, m, _, _ in bench_matching.compare(slower, result)] == ["extract_characters"]
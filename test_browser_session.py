@@ -0,0 +1,147 @@
+import chatgpt_batch_core as core
+
+
+class _Chromium:
+    def __init__(self):
+        self.calls = []
+
+    def launch(self, **kw):
+        self.calls.append(("launch", kw))
+        return self
+
+    def new_context(self, **kw):
+        self.calls.append(("new_context", kw))
+        return "fresh"
+
+    def launch_persistent_context(self, **kw):
+        self.calls.append(("persistent", kw))
+        return "profile"
+
+
+class _Playwright:
+    def __init__(self):
+        self.chromium = _Chromium()
+
+
+def _settings(tmp_path, **kw):
+    return core.BatchSettings(
+        prompts_path=str(tmp_path / "prompts.txt"),
+        characters_json=str(tmp_path / "characters.json"),
+        name_variants_json=str(tmp_path / "name_variants.json"),
+        output_dir=str(tmp_path / "out"),
+        profile_dir=str(tmp_path / "profile"),
+        **kw,
+    )
+
+
+def test_captured_session_starts_a_headless_context_without_the_profile(tmp_path):
+    p = _Playwright()
+    state = core.default_state_path(tmp_path / "profile")
+    settings = _settings(tmp_path, headless=True, browser_channel="", storage_state=str(state))
+
+    assert core.open_browser_context(p, settings) == "fresh"
+    assert state == tmp_path / "profile_session.json"
+    (kind, launch), (_, ctx) = p.chromium.calls
+    assert kind == "launch" and launch == {"headless": True, "channel": None}
+    assert ctx["storage_state"] == str(state)
+
+
+def test_without_a_session_the_persistent_profile_is_used(tmp_path):
+    p = _Playwright()
+
+    assert core.open_browser_context(p, _settings(tmp_path)) == "profile"
+    kind, kw = p.chromium.calls[0]
+    assert kind == "persistent"
+    assert kw["user_data_dir"] == str(tmp_path / "profile") and kw["channel"] == "chrome"
+
+
+def test_run_needs_the_captured_session_file(tmp_path):
+    logs = []
+    settings = _settings(tmp_path, headless=True, storage_state=str(tmp_path / "missing.json"))
+    runner = core.BatchRunner(settings, log=logs.append, confirm_login=lambda: True)
+
+    assert runner.run() == "no_session"
+    assert not runner.wait_for_login()  # nobody can log in to a headless browser
+
+
+class _Page:
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.closed = False
+
+    def evaluate(self, script):
+        if self.ctx.crashed:
+            raise RuntimeError("Target closed")
+        return 1
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+        self.ctx.pages.remove(self)
+
+
+class _Context:
+    browser = None
+
+    def __init__(self):
+        self.crashed = False
+        self.closed = False
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        page = _Page(self)
+        self.pages.append(page)
+        return page
+
+    def close(self):
+        self.closed = True
+
+
+class _SessionPlaywright:
+    def __init__(self):
+        self.contexts = []
+        self.stopped = False
+        self.chromium = self
+
+    def start(self):
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+    def launch_persistent_context(self, **kw):
+        self.contexts.append(_Context())
+        return self.contexts[-1]
+
+
+def test_browser_session_reuses_one_context_on_one_thread(tmp_path, monkeypatch):
+    import threading
+
+    pw = _SessionPlaywright()
+    monkeypatch.setattr(core, "sync_playwright", lambda: pw)
+    session = core.BrowserSession(log=lambda msg: None)
+    seen = []
+
+    def batch(ctx, page):
+        ctx.new_page()  # an extra tab, closed after the run
+        seen.append((ctx, page, threading.get_ident()))
+        return "done"
+
+    assert session.run(_settings(tmp_path), batch) == "done"
+    assert session.run(_settings(tmp_path), batch) == "done"
+    (ctx1, page1, t1), (ctx2, page2, t2) = seen
+    assert ctx1 is ctx2 and page1 is page2 and t1 == t2 != threading.get_ident()
+    assert ctx1.pages == [page1]
+
+    ctx1.crashed = True
+    session.run(_settings(tmp_path), batch)
+    assert len(pw.contexts) == 2 and ctx1.closed
+
+    session.run(_settings(tmp_path / "other"), batch)
+    assert len(pw.contexts) == 3
+
+    session.close()
+    assert pw.contexts[-1].closed and pw.stopped and not session.is_open
@@ -0,0 +1,54 @@
+import json
+import os
+
+import chatgpt_batch_core as core
+
+
+def test_name_helpers_are_memoized_and_return_fresh_lists():
+    core.clear_name_caches()
+    first = core._default_patterns_for("Marcus Vale")
+    first.append("mutated")
+    again = core._default_patterns_for("Marcus Vale")
+
+    assert "mutated" not in again
+    assert core._default_patterns_cached.cache_info().hits == 1
+    assert core._compile_patterns(again) is core._compile_patterns(list(again))
+
+
+def test_character_index_reused_until_a_json_file_changes(tmp_path):
+    core.clear_name_caches()
+    img = tmp_path / "ayda.png"
+    img.write_bytes(b"png")
+    chars = tmp_path / "characters.json"
+    variants = tmp_path / "name_variants.json"
+    chars.write_text(json.dumps({"Ayda": str(img)}), encoding="utf-8")
+    variants.write_text("{}", encoding="utf-8")
+
+    index = core.load_character_index(chars, variants)
+    assert core.load_character_index(chars, variants) is index
+
+    variants.write_text(json.dumps({"ayda": [r"\bthe pilot\b"]}), encoding="utf-8")
+    stat = os.stat(variants)
+    os.utime(variants, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    rebuilt = core.load_character_index(chars, variants)
+
+    assert rebuilt is not index
+    assert rebuilt.extract("The pilot waves")[0] == ["ayda"]
+
+
+def test_character_index_rebuilt_when_an_image_appears_or_goes(tmp_path):
+    core.clear_name_caches()
+    img = tmp_path / "ayda.png"
+    chars = tmp_path / "characters.json"
+    chars.write_text(json.dumps({"Ayda": str(img)}), encoding="utf-8")
+
+    missing = core.load_character_index(chars, "")
+    assert missing.extract("Ayda waves")[0] == []
+
+    img.write_bytes(b"png")
+    present = core.load_character_index(chars, "")
+    assert present is not missing
+    assert present.extract("Ayda waves")[0] == ["ayda"]
+
+    img.unlink()
+    assert core.load_character_index(chars, "").extract("Ayda waves")[0] == []
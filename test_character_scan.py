@@ -0,0 +1,95 @@
+import json
+import os
+
+import chatgpt_batch_core as core
+
+
+def _read(path):
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def test_first_scan_matches_the_old_generator(tmp_path):
+    img_dir = tmp_path / "character_images"
+    img_dir.mkdir()
+    for name in ("Ayda.png", "MarcusVale.jpg", "notes.txt"):
+        (img_dir / name).write_bytes(b"x")
+    seen = []
+
+    stats = core.scan_character_images(img_dir, workers=2, progress=lambda done, total: seen.append((done, total)))
+
+    assert stats["added"] == 2 and seen[-1] == (2, 2)
+    assert _read(tmp_path / "characters.json") == {
+        "ayda": str((img_dir / "Ayda.png").resolve()),
+        "marcus vale": str((img_dir / "MarcusVale.jpg").resolve()),
+    }
+    assert _read(tmp_path / "name_variants.json")["marcus vale"] == core._default_patterns_for("MarcusVale")
+
+
+def test_rescan_is_incremental_and_keeps_hand_edits(tmp_path):
+    img_dir = tmp_path / "character_images"
+    img_dir.mkdir()
+    for name in ("Ayda.png", "Zed.png", "Kat.png"):
+        (img_dir / name).write_bytes(name.encode())
+    core.scan_character_images(img_dir)
+
+    variants = _read(tmp_path / "name_variants.json")
+    variants["ayda"] = [r"\bthe pilot\b"]
+    variants["kat"] = [r"\bkitty\b"]
+    (tmp_path / "name_variants.json").write_text(json.dumps(variants), encoding="utf-8")
+    chars = _read(tmp_path / "characters.json")
+    chars["elsewhere"] = "/other/folder/elsewhere.png"
+    (tmp_path / "characters.json").write_text(json.dumps(chars), encoding="utf-8")
+
+    (img_dir / "Zed.png").unlink()
+    os.rename(img_dir / "Kat.png", img_dir / "Katrina.png")
+    (img_dir / "Lena.webp").write_bytes(b"new")
+
+    stats = core.scan_character_images(img_dir)
+
+    assert {k: stats[k] for k in ("added", "removed", "renamed", "unchanged")} == {
+        "added": 1, "removed": 1, "renamed": 1, "unchanged": 1,
+    }
+    chars = _read(tmp_path / "characters.json")
+    variants = _read(tmp_path / "name_variants.json")
+    assert sorted(chars) == ["ayda", "elsewhere", "katrina", "lena"]
+    assert variants["ayda"] == [r"\bthe pilot\b"]
+    assert variants["katrina"] == [r"\bkitty\b"]
+    assert "zed" not in variants and "kat" not in variants
+
+
+def test_swapped_image_with_same_mtime_and_size_is_not_a_rename(tmp_path):
+    img_dir = tmp_path / "character_images"
+    img_dir.mkdir()
+    (img_dir / "Kat.png").write_bytes(b"aaaa")
+    core.scan_character_images(img_dir)
+    variants = _read(tmp_path / "name_variants.json")
+    variants["kat"] = [r"\bkitty\b"]
+    (tmp_path / "name_variants.json").write_text(json.dumps(variants), encoding="utf-8")
+
+    st = (img_dir / "Kat.png").stat()
+    (img_dir / "Kat.png").unlink()
+    (img_dir / "Ilse.png").write_bytes(b"bbbb")
+    os.utime(img_dir / "Ilse.png", ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    stats = core.scan_character_images(img_dir)
+
+    assert (stats["renamed"], stats["removed"], stats["added"]) == (0, 1, 1)
+    variants = _read(tmp_path / "name_variants.json")
+    assert variants["ilse"] == core._default_patterns_for("Ilse")
+    assert variants["kat"] == [r"\bkitty\b"]
+
+
+def test_rescan_reads_only_new_images(tmp_path, monkeypatch):
+    img_dir = tmp_path / "character_images"
+    img_dir.mkdir()
+    for name in ("Ayda.png", "Zed.png"):
+        (img_dir / name).write_bytes(name.encode())
+    core.scan_character_images(img_dir)
+    read = []
+    fingerprint = core._image_fingerprint
+    monkeypatch.setattr(core, "_image_fingerprint", lambda path, size: read.append(os.path.basename(path)) or fingerprint(path, size))
+
+    (img_dir / "Lena.png").write_bytes(b"new")
+    core.scan_character_images(img_dir)
+
+    assert read == ["Lena.png"]
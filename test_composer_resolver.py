@@ -0,0 +1,94 @@
+import chatgpt_batch_core as core
+
+
+class _Frame:
+    def __init__(self, visible):
+        self.visible = set(visible)
+        self.scans = []
+        self.main_frame = self
+        self.frames = [self]
+
+    def evaluate(self, script, order):
+        self.scans.append(list(order))
+        for i, sel in enumerate(order):
+            if sel in self.visible:
+                return i
+        return -1
+
+    def locator(self, selector):
+        return _Locator(selector)
+
+
+class _Locator:
+    def __init__(self, selector):
+        self.selector = selector
+        self.first = self
+
+
+def test_resolver_checks_all_candidates_in_one_scan_and_remembers_winner():
+    resolver = core.ComposerResolver(["#a", "#b", "#c"])
+    frame = _Frame(visible={"#c"})
+
+    loc = core.find_composer_any_frame(frame, timeout_ms=1000, resolver=resolver)
+
+    assert loc.selector == "#c >> visible=true"
+    assert frame.scans == [["#a", "#b", "#c"]]
+    assert resolver.order() == ["#c", "#a", "#b"]
+
+    frame.visible = {"#a", "#c"}
+    loc = core.find_composer_any_frame(frame, timeout_ms=1000, resolver=resolver)
+
+    assert loc.selector == "#c >> visible=true"
+    assert frame.scans[-1] == ["#c", "#a", "#b"]
+
+
+class _Keyboard:
+    def __init__(self, box):
+        self.box = box
+
+    def insert_text(self, text):
+        self.box.text = text[: len(text) // 2]  # editor drops half of it
+
+
+class _Composer:
+    def __init__(self):
+        self.text = ""
+        self.tried = []
+        self.keyboard = _Keyboard(self)
+
+    def fill(self, text, timeout=None):
+        self.tried.append("fill")
+        raise TimeoutError("not editable")
+
+    def focus(self):
+        self.tried.append("insert_text")
+
+    def type(self, text, delay=0):
+        self.tried.append("type")
+        self.text = "?"
+
+    def evaluate(self, script, text=None):
+        if script == core._COMPOSER_TEXT_JS:
+            return self.text
+        if script == core._COMPOSER_CLEAR_JS:
+            self.text = ""
+        elif script == core._COMPOSER_PASTE_JS:
+            self.tried.append("paste")
+            self.text = text
+        elif script == core._COMPOSER_SET_JS:
+            self.tried.append("dom")
+
+
+def test_insert_message_verifies_each_strategy_and_remembers_winner():
+    box, inserter = _Composer(), core.ComposerInserter()
+
+    assert core.insert_message(box, box, "a cat  in\nthe rain", inserter) == ("paste", 2)
+    assert box.tried == ["fill", "insert_text", "paste"]
+    assert inserter.preferred == "paste"
+
+    box.tried.clear()
+    assert core.insert_message(box, box, "next prompt", inserter) == ("paste", 0)
+    assert box.tried == ["paste"]
+
+    typed = core.ComposerInserter(["dom", "type"])
+    assert core.insert_message(box, box, "last resort", typed) == ("type", 1)
@@ -1,3 +1,4 @@
+import re
 import sys
 import types
 
@@ -35,6 +36,7 @@ sys.modules.setdefault("pandas", pandas_module)
 sys.modules.setdefault("msvcrt", msvcrt_module)
 
 
+import chatgpt_batch_core as core
 import chatgpt_batch_images as cbi
 
 
@@ -79,3 +81,121 @@ def test_extract_characters_possessive_name():
     assert tags == ["ayda"]
     assert files == ["ayda.png"]
     assert clean == prompt
+
+
+# Frozen copy of the per-prompt regex loops that CharacterIndex replaced,
+# kept so the index is checked against the original behaviour, not itself.
+def _baseline_tokenize(stem):
+    sanitized = re.sub(r"[^0-9A-Za-z'’_\-\s]", " ", stem)
+    parts = [p for p in re.split(r"[\s_\-]+", sanitized) if p]
+    if len(parts) == 1:
+        camel = re.findall(r"[A-Z]?[a-z0-9'’]+|[A-Z]+(?![a-z])", parts[0])
+        if len(camel) > 1:
+            parts = camel
+    return [p.lower() for p in parts]
+
+
+def _baseline_default_patterns(name):
+    flex = lambda text: re.sub(r"[’']", "['’]", text)
+    raw_key = name.strip().lower()
+    tokens = _baseline_tokenize(name)
+    pattern_set = set()
+
+    def add_variant(text):
+        if text:
+            pattern_set.add(rf"\b{flex(re.escape(text))}(?:['’]s)?\b")
+
+    add_variant(raw_key)
+    canonical = " ".join(tokens)
+    if canonical and canonical != raw_key:
+        add_variant(canonical)
+    if tokens:
+        joined = "[\\s_\\-]+".join(flex(re.escape(t)) for t in tokens)
+        pattern_set.add(rf"\b{joined}(?:['’]s)?\b")
+        add_variant("".join(tokens))
+    return sorted(pattern_set)
+
+
+def _baseline_search(patterns, text):
+    for pattern in patterns:
+        try:
+            if re.search(pattern, text, flags=re.IGNORECASE):
+                return True
+        except re.error:
+            continue
+    return False
+
+
+def _baseline_resolve_alias(alias, char_map, name_variants):
+    key = alias.strip().lower()
+    if key in char_map:
+        return key
+    for name, pats in name_variants.items():
+        target = name.strip().lower()
+        if target in char_map and _baseline_search(pats, alias):
+            return target
+    for raw_name in char_map:
+        target = str(raw_name).strip().lower()
+        if target in char_map and _baseline_search(_baseline_default_patterns(raw_name), alias):
+            return target
+    return key
+
+
+def _baseline_extract(prompt_text, char_map, name_variants):
+    tags, seen = [], set()
+    for m in core.TAG_PATTERN.finditer(prompt_text):
+        resolved = _baseline_resolve_alias(m.group(1).strip(), char_map, name_variants)
+        if resolved and resolved not in seen:
+            tags.append(resolved)
+            seen.add(resolved)
+    for name, pats in name_variants.items():
+        key = name.strip().lower()
+        if key not in seen and _baseline_search(pats, prompt_text):
+            tags.append(key)
+            seen.add(key)
+    for raw_name in char_map:
+        key = str(raw_name).strip().lower()
+        if key not in seen and _baseline_search(_baseline_default_patterns(raw_name), prompt_text):
+            tags.append(key)
+            seen.add(key)
+    clean = re.sub(r"\s{2,}", " ", core.TAG_PATTERN.sub("", prompt_text)).strip()
+    return tags, [char_map[t] for t in tags if t in char_map], clean
+
+
+CAST = {"ayda": "ayda.png", "jax ren": "jax.png", "jax": "jax-solo.png", "o'brien": "obrien.png", "marcus vale": "marcus.png"}
+VARIANTS = {"Jax Ren": [r"\bjaxie\b", "("], "Marcus Vale": [r"\bthe captain\b"], "Ghost": [r"\bghost\b"]}
+PROMPTS = {
+    "A portrait of Ayda in the engine room.": ["ayda"],
+    "[@Ayda] Focus on AYDa during the mission.": ["ayda"],
+    "Capture Ayda's determined expression.": ["ayda"],
+    "Capture Ayda’s determined expression.": ["ayda"],
+    "[@jaxie] walks past Ayda's bunk.": ["jax ren", "ayda"],
+    "O’Brien and O'Brien's dog.": ["o'brien"],
+    "[@O’Brien] waves.": ["o'brien"],
+    "The captain salutes [@MarcusVale].": ["marcus vale"],
+    "Marcus-Vale nods at the captain.": ["marcus vale"],
+    "Jax Ren and Jax share a look.": ["jax ren", "jax"],
+    "Jax alone at the airlock.": ["jax"],
+    "A ghost drifts by [@Nobody].": ["nobody", "ghost"],
+    "Nobody here.": [],
+}
+
+
+@pytest.mark.parametrize("prompt", list(PROMPTS))
+def test_character_index_matches_baseline_loops(prompt):
+    index = core.CharacterIndex(CAST, VARIANTS)
+
+    result = index.extract(prompt)
+    cbi.NAME_VARIANTS = VARIANTS
+
+    assert result == _baseline_extract(prompt, CAST, VARIANTS)
+    assert result[0] == PROMPTS[prompt]
+    assert cbi.extract_characters(prompt, CAST) == result
+
+
+def test_character_index_resolves_alias_with_default_patterns():
+    index = core.CharacterIndex({"marcus vale": "marcus.png"})
+
+    assert index.resolve_alias("MarcusVale") == "marcus vale"
+    assert index.resolve_alias("Marcus-Vale") == "marcus vale"
+    assert index.resolve_alias("Nobody") == "nobody"
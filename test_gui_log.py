@@ -0,0 +1,65 @@
+import threading
+
+from chatgpt_image_gui import LOG_FILE_NAME, LogSink
+
+
+def test_drain_batches_lines_from_many_threads(tmp_path):
+    sink = LogSink()
+    sink.set_log_dir(tmp_path)
+    writers = [
+        threading.Thread(target=lambda n=n: [sink.write(f"t{n} line {i}") for i in range(2500)])
+        for n in range(4)
+    ]
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+
+    batches = []
+    while True:
+        lines = sink.drain(batch=500)
+        if not lines:
+            break
+        batches.append(lines)
+    sink.close()
+
+    assert [len(b) for b in batches] == [500] * 20
+    logged = (tmp_path / LOG_FILE_NAME).read_text(encoding="utf-8").splitlines()
+    assert len(logged) == 10_000
+    assert logged[-1].endswith(batches[-1][-1])
+
+
+def test_log_file_rotates(tmp_path):
+    sink = LogSink(max_bytes=2000, backups=2)
+    sink.set_log_dir(tmp_path)
+    for i in range(300):
+        sink.write(f"prompt {i:04d} captured")
+    sink.close()
+
+    assert (tmp_path / f"{LOG_FILE_NAME}.1").exists()
+    assert (tmp_path / f"{LOG_FILE_NAME}.2").exists()
+    assert not (tmp_path / f"{LOG_FILE_NAME}.3").exists()
+    assert "prompt 0299 captured" in (tmp_path / LOG_FILE_NAME).read_text(encoding="utf-8")
+
+
+def test_drain_without_log_dir_only_returns_lines(tmp_path):
+    sink = LogSink()
+    sink.write("hello")
+    assert sink.drain() == ["hello"]
+    sink.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_lines_go_to_the_directory_set_when_they_were_written(tmp_path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    sink = LogSink()
+    sink.set_log_dir(first)
+    sink.write("run one")
+    sink.set_log_dir(second)
+    sink.write("run two")
+    sink.drain()  # the Tk side never touches the files
+    sink.close()
+
+    assert (first / LOG_FILE_NAME).read_text(encoding="utf-8").endswith("run one\n")
+    assert (second / LOG_FILE_NAME).read_text(encoding="utf-8").endswith("run two\n")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["first", "second"]
@@ -0,0 +1,98 @@
+import chatgpt_batch_core as core
+
+
+class _FakePage:
+    def __init__(self, states):
+        self.states = list(states)
+
+    def evaluate(self, script, arg=None):
+        if len(self.states) > 1:
+            return self.states.pop(0)
+        return self.states[0]
+
+
+def _state(loaded=0, pending=0, generating=False):
+    return {"loaded": loaded, "pending": pending, "generating": generating}
+
+
+def _poll_until_done(watcher, polls=10):
+    for _ in range(polls):
+        outcome = watcher.poll()
+        if outcome:
+            return outcome
+    return None
+
+
+def test_watcher_reports_done_once_new_image_settles():
+    page = _FakePage([_state(generating=True), _state(1, 1, True), _state(2), _state(2)])
+
+    result = _poll_until_done(core.CompletionWatcher(page, _state(1)))
+
+    assert result == "done"
+    assert page.states == [_state(2)]
+
+
+def test_watcher_reports_reply_without_image():
+    page = _FakePage([_state(generating=True), _state()])
+
+    result = _poll_until_done(core.CompletionWatcher(page, _state(), no_image_grace_sec=0))
+
+    assert result == "no_image"
+
+
+def test_watcher_stays_pending_while_generating():
+    watcher = core.CompletionWatcher(_FakePage([_state(generating=True)]), _state())
+
+    assert _poll_until_done(watcher) is None
+    assert watcher.timeline()["generating_at"] is not None
+
+
+def test_dispatch_holds_early_results_and_times_out():
+    dispatch = core.PromptDispatch(iter(()), max_wait_sec=30, min_spacing_sec=10)
+
+    assert dispatch.verdict("done", elapsed=5) is None
+    assert dispatch.verdict("done", elapsed=10) == "done"
+    assert dispatch.verdict("rate_limited", elapsed=1) == "rate_limited"
+    assert dispatch.verdict(None, elapsed=30) == "timeout"
+
+
+class _FakeResponse:
+    ok = True
+    status = 200
+    headers = {"content-type": "image/webp"}
+
+    def body(self):
+        return b"RIFF-image"
+
+
+class _FakeCapturePage:
+    def __init__(self, srcs):
+        self.srcs = srcs
+        self.context = self
+        self.request = self
+        self.fetched = []
+
+    def evaluate(self, script, arg=None):
+        return self.srcs
+
+    def get(self, url):
+        self.fetched.append(url)
+        return _FakeResponse()
+
+
+def test_capture_saves_only_new_images_with_sidecar(tmp_path):
+    import json
+
+    page = _FakeCapturePage(["https://x/old.png", "https://x/new.png", "https://x/new.png"])
+    item = {"id": "scene 01", "prompt": "Ayda at the helm"}
+
+    saved = core.capture_new_images(
+        page, _state(1), item, tmp_path, tags=["ayda"], attachments=["ayda.png"], log=lambda m: None
+    )
+
+    assert [p.name for p in saved] == ["scene_01_1.webp"]
+    assert page.fetched == ["https://x/new.png"]
+    sidecar = json.loads((tmp_path / "scene_01.json").read_text(encoding="utf-8"))
+    assert sidecar["tags"] == ["ayda"]
+    assert sidecar["attachments"] == ["ayda.png"]
+    assert sidecar["images"] == ["scene_01_1.webp"]
@@ -0,0 +1,44 @@
+import chatgpt_batch_core as core
+
+
+def _prompts(*ids):
+    return [{"id": pid, "prompt": f"scene {pid}"} for pid in ids]
+
+
+def test_journal_resumes_and_retries_failed(tmp_path):
+    path = tmp_path / "book.journal.jsonl"
+    with core.JobJournal(path) as journal:
+        journal.record_many(["a", "b", "c"], core.JobJournal.QUEUED)
+        journal.record("a", core.JobJournal.SENT)
+        journal.record("a", core.JobJournal.CAPTURED, images=["a_1.png"])
+        journal.record("b", core.JobJournal.FAILED, reason="timeout")
+
+    with core.JobJournal(path) as journal:
+        assert journal.state("a") == "captured"
+        assert journal.state("b") == "failed"
+        assert [p["id"] for p in journal.pending(_prompts("a", "b", "c"))] == ["b", "c"]
+
+
+def test_journal_ignores_torn_last_line(tmp_path):
+    path = tmp_path / "book.journal.jsonl"
+    with core.JobJournal(path) as journal:
+        journal.record("a", core.JobJournal.CAPTURED)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"id": "b", "sta')
+
+    with core.JobJournal(path) as journal:
+        assert journal.is_done("a")
+        assert journal.state("b") is None
+
+
+def test_journal_compacts_superseded_lines(tmp_path):
+    path = tmp_path / "book.journal.jsonl"
+    with core.JobJournal(path) as journal:
+        for _ in range(10):
+            journal.record_many(["a", "b"], core.JobJournal.SENT)
+        journal.record("a", core.JobJournal.CAPTURED)
+
+    with core.JobJournal(path, compact_min_lines=5) as journal:
+        assert journal.state("a") == "captured"
+
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 2
@@ -0,0 +1,81 @@
+import pytest
+
+import chatgpt_batch_core as core
+
+
+class _Frame:
+    def __init__(self, url):
+        self.url = url
+
+
+class _Page:
+    def __init__(self, url, signals=None, frames=()):
+        self.url = url
+        self.signals = signals or {}
+        self.main_frame = _Frame(url)
+        self.frames = [self.main_frame] + [_Frame(u) for u in frames]
+        self.calls = []
+
+    def evaluate(self, script, args):
+        if script != core._LOGIN_SIGNALS_JS:
+            return []
+        self.calls.append(args)
+        return {**{"texts": [], "selectors": [], "buttons": []}, **self.signals}
+
+
+def test_logged_in_chat_costs_one_page_call():
+    page = _Page("https://chatgpt.com/c/abc")
+
+    assert core.detect_login(page) == {"login_needed": False, "reasons": []}
+    assert len(page.calls) == 1
+    assert page.calls[0][3] is True
+
+
+def test_verdict_lists_every_signal():
+    page = _Page(
+        "https://auth.openai.com/log-in",
+        signals={"selectors": ["input[type='password']"], "buttons": ["log in"]},
+        frames=["https://challenges.example/captcha/v2"],
+    )
+
+    verdict = core.detect_login(page)
+
+    assert verdict["login_needed"]
+    assert "url:auth.openai.com" in verdict["reasons"]
+    assert "selector:input[type='password']" in verdict["reasons"]
+    assert "button:log in" in verdict["reasons"]
+    assert any(r.startswith("frame:") for r in verdict["reasons"])
+    assert not core.login_verdict("https://chatgpt.com/logout", [], {})["login_needed"]
+    assert core.login_verdict("https://chatgpt.com/auth/login", [], {})["reasons"] == ["url:/login", "url:/auth"]
+
+
+@pytest.mark.parametrize("url", [
+    "https://chatgpt.com/g/g-abc123-oauth-helper/c/xyz",
+    "https://chatgpt.com/g/g-p-auth0-docs",
+    "https://chatgpt.com/#settings/account",
+    "https://chatgpt.com/c/abc?ref=login-banner",
+    "https://chatgpt.com/account-tools",
+])
+def test_chat_urls_with_login_words_are_not_logins(url):
+    assert core.login_verdict(url, [], {}) == {"login_needed": False, "reasons": []}
+    assert core.login_verdict("https://chatgpt.com/c/abc", [url], {})["reasons"] == []
+
+
+def test_send_prompt_stops_before_the_composer_when_logged_out(monkeypatch):
+    class _ChatPage(_Page):
+        def bring_to_front(self):
+            pass
+
+        def wait_for_load_state(self, state):
+            pass
+
+    page = _ChatPage("https://chatgpt.com/", signals={"selectors": ["input[type='email']"]})
+    item = {"id": "p1", "prompt": "x", "tags": [], "files": [], "message": "x"}
+
+    def composer_lookup(pg, **kwargs):
+        raise AssertionError("composer lookup should not run")
+
+    monkeypatch.setattr(core.ensure_composer_ready, "steps", composer_lookup)
+    with pytest.raises(core.LoginRequired, match="input\\[type='email'\\]"):
+        core.send_prompt(page, item, extract=None)
+    assert page.calls[-1][3] is False  # mid-run checks skip text clues
@@ -0,0 +1,22 @@
+import json
+import struct
+import urllib.request
+
+from mock_chatgpt_server import MockChatServer
+
+
+def test_mock_serves_chat_page_images_and_records_sends():
+    with MockChatServer(latency_sec=0.5, image_size=300) as server:
+        page = urllib.request.urlopen(server.url).read().decode("utf-8")
+        assert 'data-placeholder="Ask anything"' in page
+        assert 'data-testid="send-button"' in page
+        assert '"latency": 0.5' in page
+
+        png = urllib.request.urlopen(server.url + "image/3.png").read()
+        assert png.startswith(b"\x89PNG\r\n\x1a\n")
+        assert struct.unpack(">II", png[16:24]) == (300, 300)
+
+        req = urllib.request.Request(server.url + "api/sent", data=json.dumps({"turn": 1, "text": "hi", "files": 2}).encode())
+        urllib.request.urlopen(req).read()
+        sent = json.loads(urllib.request.urlopen(server.url + "api/sent").read())
+        assert [(s["turn"], s["text"], s["files"]) for s in sent] == [(1, "hi", 2)]
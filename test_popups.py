@@ -0,0 +1,40 @@
+import chatgpt_batch_core as core
+
+
+class _PopupPage:
+    def __init__(self, showing=(), fail=False):
+        self.showing = [s.lower() for s in showing]
+        self.fail = fail
+        self.calls = []
+
+    def evaluate(self, script, labels):
+        self.calls.append(labels)
+        if self.fail:
+            raise RuntimeError("page closed")
+        return [s for s in self.showing if s in {l.lower() for l in labels}]
+
+
+def test_popups_are_dismissed_in_one_page_call():
+    page = _PopupPage(showing=["Got it", "Accept all"])
+
+    assert core.dismiss_common_popups(page) == ["got it"]
+    assert len(page.calls) == 1
+    assert page.calls[0] == core.SELECTORS["popup_buttons"]
+
+    assert core.dismiss_common_popups(page, ["Accept all"]) == ["accept all"]
+    assert core.dismiss_common_popups(_PopupPage(fail=True)) == []
+
+
+def test_runner_popup_override_does_not_touch_shared_selectors(tmp_path):
+    defaults = list(core.SELECTORS["popup_buttons"])
+    settings = core.BatchSettings(
+        prompts_path=str(tmp_path / "p.txt"),
+        characters_json=str(tmp_path / "c.json"),
+        name_variants_json="",
+        output_dir=str(tmp_path / "out"),
+        profile_dir=str(tmp_path / "profile"),
+        popup_buttons=["Not now"],
+    )
+    core.BatchRunner(settings)
+
+    assert core.SELECTORS["popup_buttons"] == defaults
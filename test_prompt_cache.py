@@ -0,0 +1,111 @@
+import json
+import threading
+
+import chatgpt_batch_core as core
+
+
+def _setup(tmp_path):
+    img = tmp_path / "ayda.png"
+    img.write_bytes(b"png")
+    (tmp_path / "characters.json").write_text(json.dumps({"Ayda": str(img)}), encoding="utf-8")
+    (tmp_path / "name_variants.json").write_text("{}", encoding="utf-8")
+    (tmp_path / "book.md").write_text("[@Ayda] at the helm\n\nAn empty deck\n", encoding="utf-8")
+    return core.BatchSettings(
+        prompts_path=str(tmp_path / "book.md"),
+        characters_json=str(tmp_path / "characters.json"),
+        name_variants_json=str(tmp_path / "name_variants.json"),
+        output_dir=str(tmp_path / "out"),
+        profile_dir=str(tmp_path / "profile"),
+        preprompt="Comic style. ",
+    ), str(img)
+
+
+def test_runner_resolves_prompts_once_and_reuses_the_cache(tmp_path, monkeypatch):
+    settings, img = _setup(tmp_path)
+    logs = []
+    runner = core.BatchRunner(settings, log=logs.append)
+    runner._run_sync = lambda prompts: list(prompts)
+    first = runner.run()
+
+    assert [(p["id"], p["tags"], p["files"], p["message"]) for p in first] == [
+        ("row_001", ["ayda"], [img], "Comic style. at the helm"),
+        ("row_002", [], [], "Comic style. An empty deck"),
+    ]
+    assert runner.cache.is_valid()
+    assert not runner.cache.partial.exists()
+
+    def no_extract(*args):
+        raise AssertionError("cache should be used")
+
+    monkeypatch.setattr(core, "resolve_prompt", no_extract)
+    (tmp_path / "out" / "book.journal.jsonl").unlink()
+    runner = core.BatchRunner(settings, log=logs.append)
+    runner._run_sync = lambda prompts: list(prompts)
+
+    assert runner.run() == first
+    assert logs[-1] == "Using resolved prompts from book.resolved.jsonl."
+
+
+def test_cache_key_follows_inputs(tmp_path):
+    settings, _ = _setup(tmp_path)
+    index = core.load_character_index(settings.characters_json, settings.name_variants_json)
+
+    def key(**changes):
+        s = {**settings.__dict__, **changes}
+        return core.PromptCache.for_prompts(s["output_dir"], s["prompts_path"], index, s["name_variants_json"], s["preprompt"]).key
+
+    base = key()
+    assert key() == base
+    assert key(preprompt="Watercolor. ") != base
+    (tmp_path / "book.md").write_text("A different book\n", encoding="utf-8")
+    assert key() != base
+
+
+def test_compile_builds_the_cache_without_sending(tmp_path):
+    settings, _ = _setup(tmp_path)
+
+    assert core.BatchRunner(settings).compile() == 2
+    assert core.BatchRunner(settings).compile() == 2
+    lines = (tmp_path / "out" / "book.resolved.jsonl").read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[-1]) == {"done": True, "count": 2}
+
+
+def test_first_prompt_is_handed_over_before_the_batch_fills(tmp_path, monkeypatch):
+    settings, _ = _setup(tmp_path)
+    (tmp_path / "book.md").write_text("\n\n".join(f"scene {i}" for i in range(5)), encoding="utf-8")
+    got_first = threading.Event()
+    resolve = core.resolve_prompt
+
+    def slow_resolve(item, index, preprompt):
+        if item["id"] != "row_001":
+            assert got_first.wait(5), "first prompt was held back"
+        return resolve(item, index, preprompt)
+
+    monkeypatch.setattr(core, "resolve_prompt", slow_resolve)
+    runner = core.BatchRunner(settings)
+    prompts = runner.prepare()
+
+    assert next(prompts)["id"] == "row_001"
+    got_first.set()
+    assert [p["id"] for p in prompts] == [f"row_{i:03d}" for i in range(2, 6)]
+    runner.journal.close()
+
+
+def test_overlapping_compile_passes_use_separate_partial_files(tmp_path):
+    path = tmp_path / "book.resolved.jsonl"
+    release = threading.Event()
+
+    def slow_prompts():
+        yield {"id": "old", "prompt": "x"}
+        release.wait(5)
+
+    stale = core.PromptCache(path, "k")
+    stale.items(slow_prompts(), lambda item: item)
+    fresh = core.PromptCache(path, "k")
+    assert fresh.partial != stale.partial
+
+    assert [p["id"] for p in fresh.items([{"id": "new", "prompt": "y"}], lambda item: item)] == ["new"]
+    release.set()
+    stale.wait()
+    assert core.PromptCache(path, "k").is_valid()
+    assert not list(tmp_path.glob("*.partial"))
@@ -0,0 +1,101 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import chatgpt_batch_core as core
+
+
+def test_txt_paragraphs_and_headers(tmp_path):
+    path = tmp_path / "prompts.md"
+    path.write_text(
+        "\n\nA knight at dawn\nin the rain\n\n"
+        "prompt7: a castle\nat dusk\n\n"
+        "id: hero-3\nthe hero rests\n   \n"
+        "Prompt_9:\nempty header line\n",
+        encoding="utf-8",
+    )
+
+    assert core.load_prompts(path) == [
+        {"id": "row_001", "prompt": "A knight at dawn\nin the rain"},
+        {"id": "prompt7", "prompt": "a castle\nat dusk"},
+        {"id": "hero-3", "prompt": "the hero rests"},
+        {"id": "Prompt_9", "prompt": "empty header line"},
+    ]
+
+
+def test_missing_or_blank_file_yields_nothing(tmp_path):
+    blank = tmp_path / "blank.md"
+    blank.write_text("\n  \n", encoding="utf-8")
+
+    assert core.load_prompts(tmp_path / "nope.md") == []
+    assert core.load_prompts(blank) == []
+
+
+def test_pool_sends_before_the_stream_is_exhausted():
+    events = []
+
+    def stream():
+        for i in range(1, 4):
+            events.append(f"read p{i}")
+            yield {"id": f"p{i}", "prompt": "scene"}
+
+    class Page:
+        def evaluate(self, script, arg=None):
+            return {"loaded": 1, "pending": 0, "generating": False}
+
+    def send(page, item):
+        events.append(f"send {item['id']}")
+        return {"baseline": {"loaded": 0}, "sent_at": 0}
+
+    core.run_prompt_pool(
+        [Page()], stream(), send, lambda *a: None,
+        max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0,
+    )
+
+    assert events.index("send p1") < events.index("read p3")
+
+
+def test_csv_with_header_and_headerless(tmp_path):
+    with_header = tmp_path / "with_header.csv"
+    with_header.write_text('id,prompt,notes\np1,"A knight, at dawn",x\n\n,untitled scene,\np3,,\n', encoding="utf-8")
+    headerless = tmp_path / "headerless.txt"
+    headerless.write_text('p1, "A knight, at dawn"\np2, a castle, at dusk\n', encoding="utf-8")
+
+    assert core.load_prompts(with_header) == [
+        {"id": "p1", "prompt": "A knight, at dawn"},
+        {"id": "row_002", "prompt": "untitled scene"},
+    ]
+    assert core.load_prompts(headerless) == [
+        {"id": "p1", "prompt": "A knight, at dawn"},
+        {"id": "p2", "prompt": "a castle, at dusk"},
+    ]
+
+
+def test_unquoted_commas_after_a_header_stay_in_the_prompt(tmp_path):
+    plain = tmp_path / "plain.csv"
+    plain.write_text("id,prompt\np1,Ayda walks, slowly\n", encoding="utf-8")
+    notes = tmp_path / "notes.csv"
+    notes.write_text("id,prompt,notes\np1,Ayda walks, slowly, at dawn,x\n", encoding="utf-8")
+
+    assert core.load_prompts(plain) == [{"id": "p1", "prompt": "Ayda walks, slowly"}]
+    assert core.load_prompts(notes) == [{"id": "p1", "prompt": "Ayda walks, slowly, at dawn"}]
+
+
+def test_loading_prompts_does_not_import_pandas():
+    code = "import sys, conftest, chatgpt_image_gui, chatgpt_batch_images; print('pandas' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=Path(__file__).parent)
+    assert out.stdout.strip() == "False", out.stderr
+
+
+def test_prose_with_commas_is_not_read_as_csv(tmp_path):
+    path = tmp_path / "story.txt"
+    path.write_text(
+        "Ayda walks into the engine room, tired and angry.\nThe lights flicker above her.\n\n"
+        "Marco waits at the airlock, holding a wrench, a lamp, and a map.\nHe looks up.\n",
+        encoding="utf-8",
+    )
+
+    assert core.load_prompts(path) == [
+        {"id": "row_001", "prompt": "Ayda walks into the engine room, tired and angry.\nThe lights flicker above her."},
+        {"id": "row_002", "prompt": "Marco waits at the airlock, holding a wrench, a lamp, and a map.\nHe looks up."},
+    ]
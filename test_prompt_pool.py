@@ -0,0 +1,217 @@
+import chatgpt_batch_core as core
+
+
+class _Page:
+    def __init__(self, name):
+        self.name = name
+        self.loaded = 0
+
+    def evaluate(self, script, arg=None):
+        return {"loaded": self.loaded, "pending": 0, "generating": False}
+
+
+def _prompts(n):
+    return [{"id": f"p{i}", "prompt": f"scene {i}"} for i in range(1, n + 1)]
+
+
+def test_pool_spreads_prompts_over_tabs_and_respects_cap():
+    pages = [_Page("a"), _Page("b"), _Page("c")]
+    in_flight = []
+    peak = []
+    finished = []
+
+    def send(page, item):
+        in_flight.append(item["id"])
+        peak.append(len(in_flight))
+        baseline = {"loaded": page.loaded}
+        page.loaded += 1  # the image shows up straight away
+        return {"baseline": baseline, "sent_at": 0}
+
+    def finish(page, item, sent, outcome):
+        in_flight.remove(item["id"])
+        finished.append((page.name, item["id"], outcome))
+
+    result = core.run_prompt_pool(
+        pages, _prompts(5), send, finish,
+        max_wait_sec=1e12, min_spacing_sec=0, max_in_flight=2, poll_sec=0,
+    )
+
+    assert result == "done"
+    assert max(peak) == 2
+    assert sorted(i for _, i, _ in finished) == ["p1", "p2", "p3", "p4", "p5"]
+    assert {o for _, _, o in finished} == {"done"}
+    assert {p for p, _, _ in finished} == {"a", "b"}
+
+
+def test_pool_skip_and_stop_apply_to_every_tab():
+    pages = [_Page("a"), _Page("b")]
+    finished = []
+    actions = iter([None, "skip", "stop"])
+
+    def send(page, item):
+        return {"baseline": {"loaded": page.loaded}, "sent_at": 0}
+
+    result = core.run_prompt_pool(
+        pages, _prompts(4), send, lambda page, item, sent, outcome: finished.append((item["id"], outcome)),
+        max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0, control=lambda: next(actions),
+    )
+
+    assert result == "stopped"
+    assert finished == [("p1", "skip"), ("p2", "skip")]
+
+
+def test_pool_reports_send_failures_and_continues():
+    finished = []
+
+    def send(page, item):
+        if item["id"] == "p1":
+            raise RuntimeError("composer missing")
+        page.loaded += 1
+        return {"baseline": {"loaded": page.loaded - 1}, "sent_at": 0}
+
+    core.run_prompt_pool(
+        [_Page("a")], _prompts(2), send, lambda page, item, sent, outcome: finished.append((item["id"], outcome)),
+        max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0,
+    )
+
+    assert finished == [("p1", "failed"), ("p2", "done")]
+
+
+def test_rate_limiter_backs_off_and_recovers_to_the_floor():
+    limiter = core.RateLimiter(2, backoff_sec=60, max_backoff_sec=200, jitter=0)
+
+    assert limiter.record_limited() == 60
+    assert 59 < limiter.wait_time() <= 60
+    assert limiter.record_limited() == 120
+    assert limiter.record_limited() == 200
+    assert limiter.record_limited(retry_after=300) == 300
+
+    for _ in range(40):
+        limiter.record_success()
+    assert limiter.min_interval_sec == 2
+
+
+class _LimitedPage(_Page):
+    """First reply is a rate-limit banner, later ones produce an image."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.replies = 0
+        self.limited = True
+
+    def evaluate(self, script, arg=None):
+        return {
+            "loaded": self.loaded, "pending": 0, "generating": False,
+            "replies": self.replies, "replyLimited": self.limited, "alertLimited": False,
+        }
+
+
+def test_pool_resends_rate_limited_prompts_after_backing_off():
+    page = _LimitedPage("a")
+    limiter = core.RateLimiter(backoff_sec=0.05, max_backoff_sec=0.05, jitter=0)
+    finished = []
+
+    def send(pg, item):
+        baseline = pg.evaluate(None)
+        pg.replies += 1
+        if finished:  # the limit has cleared by the resend
+            pg.limited = False
+            pg.loaded += 1
+        return {"baseline": baseline, "sent_at": 0}
+
+    core.run_prompt_pool(
+        [page], _prompts(2), send, lambda pg, item, sent, outcome: finished.append((item["id"], outcome)),
+        max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0, limiter=limiter,
+    )
+
+    assert finished == [("p1", "retry"), ("p1", "done"), ("p2", "done")]
+    assert limiter.limited == 1
+
+
+def test_pool_gives_up_after_max_retries():
+    page = _LimitedPage("a")
+    finished = []
+
+    def send(pg, item):
+        baseline = pg.evaluate(None)
+        pg.replies += 1
+        return {"baseline": baseline, "sent_at": 0}
+
+    core.run_prompt_pool(
+        [page], _prompts(1), send, lambda pg, item, sent, outcome: finished.append(outcome),
+        max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0, max_retries=2,
+        limiter=core.RateLimiter(backoff_sec=0, max_backoff_sec=0),
+    )
+
+    assert finished == ["retry", "retry", "rate_limited"]
+
+
+def test_backoff_jitter_never_exceeds_the_cap():
+    limiter = core.RateLimiter(backoff_sec=100, max_backoff_sec=100, jitter=0.5)
+    assert all(limiter.record_limited() <= 100 for _ in range(50))
+
+
+class _Response:
+    def __init__(self, url, status=429):
+        self.url = url
+        self.status = status
+        self.headers = {"retry-after": "30"}
+
+
+class _ListeningPage(_Page):
+    url = "https://chatgpt.com/c/abc"
+
+    def __init__(self, name="a"):
+        super().__init__(name)
+        self.handlers = []
+
+    def on(self, event, handler):
+        self.handlers.append(handler)
+        self.handler = handler
+
+    def remove_listener(self, event, handler):
+        self.handlers.remove(handler)
+
+
+def test_only_chat_backend_429s_count_as_rate_limits():
+    page, seen = _ListeningPage(), []
+    core.on_rate_limit_response(page, seen.append)
+
+    page.handler(_Response("https://chatgpt.com/ces/v1/telemetry"))
+    page.handler(_Response("https://cdn.example.com/backend-api/conversation"))
+    page.handler(_Response("https://chatgpt.com/backend-api/conversation", status=200))
+    assert seen == []
+
+    page.handler(_Response("https://chatgpt.com/backend-api/conversation"))
+    assert seen == [30.0]
+
+
+def test_pool_removes_its_response_listener_when_done():
+    page = _ListeningPage()
+
+    def send(page, item):
+        assert len(page.handlers) == 1
+        page.loaded += 1
+        return {"baseline": {"loaded": page.loaded - 1}, "sent_at": 0}
+
+    for _ in range(2):  # a kept browser page is reused by the next run
+        core.run_prompt_pool([page], _prompts(1), send, lambda *a: None, max_wait_sec=1e12, min_spacing_sec=0, poll_sec=0)
+
+    assert page.handlers == []
+
+
+def test_runner_passes_the_in_flight_cap_to_the_pool(tmp_path):
+    def options(**extra):
+        settings = core.BatchSettings(
+            prompts_path=str(tmp_path / "p.txt"),
+            characters_json=str(tmp_path / "c.json"),
+            name_variants_json="",
+            output_dir=str(tmp_path / "out"),
+            profile_dir=str(tmp_path / "profile"),
+            tabs=3,
+            **extra,
+        )
+        return core.BatchRunner(settings).pool_options()
+
+    assert options()["max_in_flight"] is None
+    assert options(max_in_flight=2)["max_in_flight"] == 2
@@ -0,0 +1,55 @@
+import os
+
+import chatgpt_batch_core as core
+
+
+def _fake_render(calls):
+    def render(self, src, out):
+        calls.append(src.name)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_bytes(b"small")
+        return True
+    return render
+
+
+def test_copies_are_cached_by_mtime_and_content(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(core.ReferenceImageCache, "_render", _fake_render(calls))
+    ref = tmp_path / "ayda.png"
+    ref.write_bytes(b"huge original")
+    cache_dir = tmp_path / "cache"
+
+    out = core.ReferenceImageCache(cache_dir).prepare(ref)
+    assert out.parent == cache_dir and out.suffix == ".jpg"
+    assert core.ReferenceImageCache(cache_dir).prepare(ref) == out
+
+    stat = os.stat(ref)
+    os.utime(ref, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert core.ReferenceImageCache(cache_dir).prepare(ref) == out
+    assert calls == ["ayda.png"]
+
+    ref.write_bytes(b"edited original")
+    assert core.ReferenceImageCache(cache_dir).prepare(ref) != out
+    assert core.ReferenceImageCache(cache_dir, max_dim=512).prepare(ref) != out
+    assert calls == ["ayda.png"] * 3
+
+
+def test_without_pillow_the_original_is_attached(tmp_path, monkeypatch):
+    monkeypatch.setattr(core, "_pillow", lambda: None)
+    ref = tmp_path / "ayda.png"
+    ref.write_bytes(b"png")
+    logs = []
+    cache = core.ReferenceImageCache(tmp_path / "cache", log=logs.append)
+
+    assert cache.prepare(ref) == ref
+    assert cache.prepare(ref) == ref
+    assert len(logs) == 1
+
+
+def test_attachment_store_uploads_the_prepared_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.ReferenceImageCache, "_render", _fake_render([]))
+    ref = tmp_path / "ayda.png"
+    ref.write_bytes(b"huge original")
+    store = core.AttachmentStore(preprocess=core.ReferenceImageCache(tmp_path / "cache").prepare)
+
+    assert store.payload(ref) == {"name": "ayda.jpg", "mimeType": "image/jpeg", "buffer": b"small"}
@@ -0,0 +1,62 @@
+import json
+
+import chatgpt_batch_core as core
+
+
+def _sent(started, sent_at, first_image, ready, released, fixed_wait=0.7):
+    return {
+        "attachments": ["ayda.png"],
+        "reused_attachments": [],
+        "sent_at": sent_at,
+        "timings": {"prepare": 0.1, "composer": 0.2, "fill": 0.3, "attach": 0.6, "send": 0.05},
+        "trace": {
+            "started_at": started,
+            "selector": "#prompt-textarea",
+            "reloads": 1,
+            "fixed_wait": fixed_wait,
+            "first_image_at": first_image,
+            "outcome_at": ready,
+            "released_at": released,
+        },
+    }
+
+
+def test_watcher_records_when_each_stage_was_seen():
+    watcher = core.CompletionWatcher(page=None, baseline={"loaded": 1, "pending": 0})
+    watcher.update({"loaded": 1, "pending": 0, "generating": True})
+    watcher.update({"loaded": 1, "pending": 1, "generating": True})
+    watcher.update({"loaded": 2, "pending": 0, "generating": False})
+    assert watcher.update({"loaded": 2, "pending": 0, "generating": False}) == "done"
+
+    times = watcher.timeline()
+    assert times["generating_at"] <= times["first_image_at"] <= times["outcome_at"]
+
+
+def test_trace_writes_prompt_events_and_a_summary(tmp_path, monkeypatch):
+    trace = core.RunTrace.for_prompts(tmp_path, "batch one.txt", engine="sync")
+    monkeypatch.setattr(core.time, "time", lambda: 1000.0)
+    for n in range(10):
+        base = 900.0 + n
+        trace.record({"id": f"p{n}"}, _sent(base, base + 1, base + 30, base + 32, base + 40), "done", ["x.png"])
+    trace.record({"id": "bad"}, RuntimeError("composer gone"), "failed")
+    trace.started = 1000.0 - 3600
+    summary = trace.close()
+
+    events = [json.loads(line) for line in (tmp_path / "batch_one.trace.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [e["event"] for e in events] == ["start"] + ["prompt"] * 11 + ["summary"]
+    assert len({e["run"] for e in events}) == 1
+
+    first = events[1]
+    assert first["selector"] == "#prompt-textarea" and first["reloads"] == 1
+    assert first["phases"]["generate"] == 29.0
+    assert first["phases"]["settle"] == 2.0
+    assert first["phases"]["spacing"] == 8.0
+    assert first["phases"]["capture"] == 60.0
+    assert events[-2]["error"] == "composer gone"
+
+    assert summary["captured"] == 10 and summary["failed"] == 1
+    assert summary["prompts_per_hour"] == 10.0
+    assert summary["phases"]["composer"] == {"p50": 0.2, "p95": 0.2, "n": 10}
+    assert summary["phases"]["capture"]["p95"] == 60.0
+    assert summary["fixed_waits_sec"] == {"sleeps": 7.0, "settle": 20.0, "spacing": 80.0, "total": 107.0}
+    assert core.format_trace_summary(summary)[0].startswith("Run summary: 10 captured, 1 failed")